@@ -1,28 +1,21 @@
 """Main entry point for the calendar sync tool."""
 
 import argparse
+import dataclasses
 import logging
 import os
 from pathlib import Path
+import shutil
 import sys
+import tempfile
 import time
-from typing import NoReturn
+from typing import NoReturn, Optional
 
-from dotenv import dotenv_values
-
-from .config import Config, ServerConfig
-from .discovery import discover_calendars
-from .sync_manager import SyncManager
-
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,  # Set to DEBUG for more detailed logging
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('calendar_sync.log')
-    ]
-)
+from .config import Config, EnvFile, load_accounts
+from .logging_setup import configure_logging
+from .scheduler import Scheduler, select_pairs
+from .timing import PhaseTimer
+from .tracing import configure_tracing
 
 logger = logging.getLogger(__name__)
 
@@ -49,56 +42,214 @@ def find_dotenv() -> str:
     return '.env'
 
 
+def apply_logging(config: Config, old: Optional[Config] = None) -> None:
+    """Configure logging and tracing, unless their settings equal those of ``old``."""
+    log_settings = lambda c: (c.log_level, c.log_file, c.log_format, c.log_max_bytes, c.log_backup_count)
+    if old is None or log_settings(old) != log_settings(config):
+        configure_logging(
+            config.log_level,
+            log_file=config.log_file,
+            log_format=config.log_format,
+            max_bytes=config.log_max_bytes,
+            backup_count=config.log_backup_count
+        )
+    if old is None or (old.trace_file, old.trace_endpoint) != (config.trace_file, config.trace_endpoint):
+        configure_tracing(config.trace_file, config.trace_endpoint)
+
+
 def main() -> NoReturn:
     """Main entry point for the calendar sync tool."""
+    timer = PhaseTimer()
     parser = argparse.ArgumentParser(description='Calendar Sync Tool')
     parser.add_argument(
         '--discover',
         action='store_true',
         help='Discover available calendars on both servers'
     )
+    parser.add_argument(
+        '--once',
+        action='store_true',
+        help='Run a single sync cycle, print a timing breakdown and exit '
+             '(status 0 if every pair synced, 1 otherwise)'
+    )
+    parser.add_argument(
+        '--profile',
+        nargs='?',
+        const='profiles',
+        metavar='DIR',
+        help='Run a single sync cycle under the profiler, write a .prof file and '
+             'flame graph stacks to DIR (default: profiles) and print the time '
+             'every pair spent per phase'
+    )
+    parser.add_argument(
+        '--record',
+        metavar='FILE',
+        help='Run a single sync cycle and record its HTTP exchanges, with '
+             'credentials removed, into a cassette file'
+    )
+    parser.add_argument(
+        '--replay',
+        metavar='FILE',
+        help='Run a single sync cycle against the HTTP exchanges of a cassette '
+             'file instead of the servers and print the requests made'
+    )
+    parser.add_argument(
+        '--replay-latency',
+        type=float,
+        default=0.0,
+        metavar='MS',
+        help='Milliseconds added to every replayed request (default: 0)'
+    )
+    parser.add_argument(
+        '--initial-import',
+        action='store_true',
+        help='Import the events of IMPORT_DAYS_BACK to IMPORT_DAYS_AHEAD into the '
+             'targets in parallel and exit; an interrupted import resumes where it stopped'
+    )
+    parser.add_argument(
+        '--pair',
+        action='append',
+        metavar='PAIR',
+        help='Only sync this pair, given as its 1-based position in '
+             'CALENDAR_PAIRS or as source:target (can be repeated)'
+    )
+    parser.add_argument(
+        '--accounts',
+        metavar='FILE',
+        help='Sync every account of a multi-account JSON file across worker processes'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='Number of worker processes for --accounts (default: CPU count)'
+    )
+    parser.add_argument(
+        '--worker-concurrency',
+        type=int,
+        default=4,
+        help='Accounts synced at the same time per worker for --accounts (default: 4)'
+    )
     args = parser.parse_args()
 
+    # Log to stdout until the configuration tells us more
+    configure_logging(os.getenv("LOG_LEVEL") or "INFO", log_file=None)
+
     try:
         # Load environment variables
+        config_started = time.perf_counter()
         env_path = find_dotenv()
         logger.debug(f"Loading environment variables from: {env_path}")
         
         # Load environment variables directly
-        env_values = dotenv_values(env_path)
-        logger.debug("Environment variables found:")
-        for key, value in env_values.items():
-            logger.debug(f"  {key}: {value}")
-            os.environ[key] = value
+        env_file = EnvFile(env_path)
+        env_file.apply()
+        
+        if args.accounts:
+            from .orchestrator import run_accounts
+            accounts = load_accounts(args.accounts)
+            log_level = os.getenv("LOG_LEVEL") or "INFO"
+            configure_logging(
+                log_level,
+                log_file=os.getenv("LOG_FILE", "calendar_sync.log") or None,
+                log_format=(os.getenv("LOG_FORMAT") or "text").lower()
+            )
+            configure_tracing(os.getenv("TRACE_FILE"), os.getenv("TRACE_OTLP_ENDPOINT"))
+            sys.exit(run_accounts(
+                accounts,
+                workers=args.workers,
+                concurrency=args.worker_concurrency,
+                once=args.once,
+                log_level=log_level
+            ))
         
         # Load configuration
         config = Config.load()
-        logging.getLogger().setLevel(config.log_level)
+        apply_logging(config)
+        timer.add("load configuration", time.perf_counter() - config_started)
         
         if args.discover:
             # For discovery, we only need server configs
+            from .discovery import discover_calendars
             logger.info("Starting calendar discovery...")
             discover_calendars(config.nextcloud, config.kerio)
             sys.exit(0)
         
-        # Create sync manager for sync mode
-        sync_manager = SyncManager(config)
+        pairs = select_pairs(config.calendar_pairs, args.pair) if args.pair else None
+        
+        transport = None
+        if args.record or args.replay:
+            from .cassette import RecordingTransport, ReplayTransport
+            secrets = [config.nextcloud.password, config.kerio.password]
+            if args.replay:
+                transport = ReplayTransport(args.replay, secrets, latency=args.replay_latency / 1000)
+            else:
+                transport = RecordingTransport(args.record, secrets)
+            # Start from empty state, so that recorded and replayed cycles make the
+            # same requests and the real outbox, tokens and ids are left alone
+            config = dataclasses.replace(config, state_dir=tempfile.mkdtemp(prefix="calendar-sync-cassette-"))
+        
+        # Create sync manager for sync mode; backends are imported on first use
+        with timer.phase("create sync manager"):
+            from .sync_manager import SyncManager
+            sync_manager = SyncManager(config, transport)
         logger.info("Calendar sync tool started")
         
-        while True:
-            try:
-                sync_manager.sync_calendars()
-                
-                # Wait for next sync interval
-                logger.info(f"Waiting {config.sync_interval_minutes} minutes until next sync")
-                time.sleep(config.sync_interval_minutes * 60)
-            except KeyboardInterrupt:
-                logger.info("Received shutdown signal")
-                break
-            except Exception as e:
-                logger.error(f"Sync failed: {str(e)}")
-                logger.info("Retrying in 5 minutes")
-                time.sleep(300)
+        if args.initial_import:
+            from .initial_import import InitialImport
+            import_results = InitialImport(sync_manager).run(pairs)
+            for result in import_results:
+                status = "ok" if result.success and not result.failed else "failed"
+                timer.add(f"import {result.pair.name} ({status}, {result.created} created)", result.duration)
+            print(timer.format_table(), file=sys.stderr)
+            sys.exit(0 if all(result.success and not result.failed for result in import_results) else 1)
+        
+        if args.once or args.profile or transport is not None:
+            if args.profile:
+                from .profiling import profile_cycle
+                with profile_cycle(args.profile) as profile:
+                    results = sync_manager.sync_calendars(pairs)
+            else:
+                results = sync_manager.sync_calendars(pairs)
+            for result in results:
+                status = "ok" if result.success else "failed"
+                timer.add(f"sync {result.pair.name} ({status})", result.duration)
+            print(timer.format_table(), file=sys.stderr)
+            if transport is not None:
+                transport.save()
+                print("\n" + transport.summary(), file=sys.stderr)
+                sync_manager.outbox.close()
+                shutil.rmtree(config.state_dir, ignore_errors=True)
+            if args.profile:
+                print("\n" + profile.phases.format_table(), file=sys.stderr)
+                print(f"\nProfile: {profile.profile_path}\nStacks:  {profile.folded_path}",
+                      file=sys.stderr)
+            sys.exit(0 if all(result.success for result in results) else 1)
+        
+        try:
+            watchdog = None
+            if config.memory_watchdog:
+                from .memory import MIB, MemoryWatchdog
+                watchdog = MemoryWatchdog(
+                    sync_manager.trim_caches,
+                    soft_limit_mb=config.memory_soft_limit_mb,
+                    restart=config.memory_restart,
+                    trace_frames=config.memory_trace_frames
+                )
+            
+            # Keep the settings being applied, to compare the next reload with
+            applied = [config]
+            
+            def on_reload(new_config: Config) -> None:
+                apply_logging(new_config, applied[0])
+                applied[0] = new_config
+                if watchdog is not None:
+                    watchdog.soft_limit = new_config.memory_soft_limit_mb * MIB
+                    watchdog.restart = new_config.memory_restart
+            
+            Scheduler(sync_manager, args.pair, env_file, on_reload=on_reload, watchdog=watchdog).run()
+        except KeyboardInterrupt:
+            logger.info("Received shutdown signal")
     except Exception as e:
         logger.error(f"Failed to start sync tool: {str(e)}")
         sys.exit(1)
@@ -0,0 +1,331 @@
+"""Calendar backends and the registry that resolves calendar endpoints.
+
+Calendars are written as ``calendar@backend``. Each backend name maps to a
+factory creating a ``Backend`` for a configuration. A backend wraps the
+client of a calendar service, created on first use, and declares what the
+service supports so the sync engine can choose the cheapest way to read it.
+New CalDAV servers are added with ``register_backend``.
+"""
+
+import logging
+from enum import Enum
+from typing import TYPE_CHECKING, Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+from .config import Endpoint
+from .events import CalendarEvent
+from .health import BackendUnavailable, CircuitBreaker, is_outage
+from .state import JsonStore
+
+if TYPE_CHECKING:
+    from datetime import datetime
+
+    from .cassette import HttpTransport
+    from .config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class Capability(Enum):
+    """Optional features of a backend."""
+    # Cheap change detection with a ctag or sync token
+    SYNC_TOKEN = "sync-token"
+    # Listing events one batch at a time as they arrive, with
+    # calendar-multiget requests on CalDAV and result pages on Google
+    STREAMING = "streaming"
+    # Several writes per request
+    BATCH_WRITES = "batch-writes"
+    # Fetching only the busy times of events
+    FREE_BUSY = "free-busy"
+
+
+class Backend:
+    """A calendar service used through a lazily created client."""
+
+    capabilities: FrozenSet[Capability] = frozenset()
+
+    def __init__(
+        self,
+        name: str,
+        create_client: Callable[[], Any],
+        wipe_privacy_events: bool = False
+    ):
+        """Initialize the backend.
+
+        Args:
+            name: Backend name used in calendar endpoints.
+            create_client: Creates the client on first use.
+            wipe_privacy_events: Whether privacy pairs targeting this backend
+                delete all busy events and recreate them, instead of matching
+                busy events to source events by UID.
+        """
+        self.name = name
+        self.wipe_privacy_events = wipe_privacy_events
+        self.breaker = CircuitBreaker(name)
+        self._create_client = create_client
+        self._client: Optional[Any] = None
+
+    @property
+    def client(self) -> Any:
+        """Get the client, creating it on first use."""
+        if self._client is None:
+            self._client = self._create_client()
+        return self._client
+
+    def supports(self, capability: Capability) -> bool:
+        """Check whether the backend has a capability."""
+        return capability in self.capabilities
+
+    def _call(self, operation: Callable[[], Any]) -> Any:
+        """Call the server through the circuit breaker of the backend."""
+        if not self.breaker.allow_request():
+            raise BackendUnavailable(
+                f"Backend {self.name} is unavailable, retrying in {self.breaker.retry_in():.0f} seconds"
+            )
+        try:
+            result = operation()
+        except Exception as e:
+            if is_outage(e):
+                self.breaker.record_failure(e)
+            else:
+                # Says nothing about the health of the server
+                self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def _call_iter(self, operation: Callable[[], Iterable[Any]]) -> Iterator[Any]:
+        """Iterate over the results of a streaming call through the circuit breaker."""
+        iterator = self._call(lambda: iter(operation()))
+        while True:
+            try:
+                item = self._call(lambda: next(iterator))
+            except StopIteration:
+                return
+            yield item
+
+    def list_events(
+        self,
+        calendar_id: str,
+        start: Optional["datetime"] = None,
+        end: Optional["datetime"] = None
+    ) -> List[CalendarEvent]:
+        """List the events of a calendar."""
+        return self._call(lambda: self.client.list_events(calendar_id, start=start, end=end))
+
+    def iter_events(
+        self,
+        calendar_id: str,
+        start: Optional["datetime"] = None,
+        end: Optional["datetime"] = None
+    ) -> Iterable[CalendarEvent]:
+        """Yield the events of a calendar in batches.
+
+        Only available with the STREAMING capability.
+        """
+        return self._call_iter(lambda: self.client.iter_events(calendar_id, start=start, end=end))
+
+    def list_busy_events(
+        self,
+        calendar_id: str,
+        start: Optional["datetime"] = None,
+        end: Optional["datetime"] = None
+    ) -> List[CalendarEvent]:
+        """List events with at least their UID and times."""
+        return self._call(lambda: self.client.list_events(calendar_id, start=start, end=end))
+
+    def create_event(self, calendar_id: str, event: CalendarEvent) -> None:
+        """Create an event."""
+        self._call(lambda: self.client.create_event(calendar_id, event))
+
+    def create_events(self, calendar_id: str, events: List[CalendarEvent]) -> List[Optional[Exception]]:
+        """Create several events, in one request with the BATCH_WRITES capability.
+
+        Returns the error of every event, None for the ones created. An
+        unavailable backend raises instead.
+        """
+        errors: List[Optional[Exception]] = []
+        for event in events:
+            try:
+                self.create_event(calendar_id, event)
+                errors.append(None)
+            except BackendUnavailable:
+                raise
+            except Exception as e:
+                if is_outage(e):
+                    raise
+                errors.append(e)
+        return errors
+
+    def update_event(self, calendar_id: str, event: CalendarEvent) -> None:
+        """Update an event."""
+        self._call(lambda: self.client.update_event(calendar_id, event))
+
+    def delete_event(self, calendar_id: str, event_uid: str) -> None:
+        """Delete an event."""
+        self._call(lambda: self.client.delete_event(calendar_id, event_uid))
+
+    def fetch_sync_state(self, calendar_id: str) -> Dict[str, Optional[str]]:
+        """Fetch the current ctag and sync token of a calendar.
+
+        Only available with the SYNC_TOKEN capability.
+        """
+        return self._call(lambda: self.client.fetch_sync_state(calendar_id))
+
+    def save_state(self) -> None:
+        """Persist state kept by the client, if any."""
+
+    def reset_client(self) -> None:
+        """Persist the state of the client and drop it; the next call creates a new one."""
+        self.save_state()
+        self._client = None
+
+
+class CalDAVBackend(Backend):
+    """A CalDAV server."""
+
+    capabilities = frozenset({Capability.SYNC_TOKEN, Capability.STREAMING, Capability.FREE_BUSY})
+
+    def list_busy_events(
+        self,
+        calendar_id: str,
+        start: Optional["datetime"] = None,
+        end: Optional["datetime"] = None
+    ) -> List[CalendarEvent]:
+        """List events with only their UID, times and recurrence rule."""
+        return self._call(lambda: self.client.list_busy_events(calendar_id, start=start, end=end))
+
+
+class GoogleBackend(Backend):
+    """Google Calendar."""
+
+    capabilities = frozenset({Capability.SYNC_TOKEN, Capability.STREAMING, Capability.BATCH_WRITES})
+
+    def create_events(self, calendar_id: str, events: List[CalendarEvent]) -> List[Optional[Exception]]:
+        """Create several events with one batch request."""
+        return self._call(lambda: self.client.create_events(calendar_id, events))
+
+    def save_state(self) -> None:
+        """Persist the Google event ids learned by the client."""
+        if self._client is not None:
+            self._client.save_event_ids()
+
+
+# Configuration fields that every client is built from
+CLIENT_SETTINGS = (
+    "state_dir", "google_credentials_file", "google_token_file", "fetch_slice_days", "fetch_concurrency"
+)
+
+# Called with the configuration and the HTTP transport to use, if any
+BackendFactory = Callable[["Config", Optional["HttpTransport"]], Backend]
+
+# Backend factories by the name used in calendar endpoints
+BACKENDS: Dict[str, BackendFactory] = {}
+
+
+def register_backend(name: str, factory: BackendFactory) -> None:
+    """Make a backend available under a name."""
+    BACKENDS[name.lower()] = factory
+
+
+def caldav_backend(server: str, wipe_privacy_events: bool = False) -> BackendFactory:
+    """Get a factory for a CalDAV backend using a server of the configuration.
+
+    ``server`` names the ServerConfig attribute of the configuration; the
+    discovered calendar URLs are persisted in ``<server>_calendars.json``.
+    """
+    def create(config: "Config", transport: Optional["HttpTransport"] = None) -> Backend:
+        def create_client() -> Any:
+            # Imported here so that loading the package stays cheap
+            from .caldav_client import CalDAVClient
+            return CalDAVClient(
+                getattr(config, server),
+                cache=JsonStore(config.state_path(f"{server}_calendars.json")),
+                slice_days=config.fetch_slice_days,
+                concurrency=config.fetch_concurrency,
+                transport=transport
+            )
+        return CalDAVBackend(server, create_client, wipe_privacy_events=wipe_privacy_events)
+    return create
+
+
+def google_backend(config: "Config", transport: Optional["HttpTransport"] = None) -> Backend:
+    """Create the Google Calendar backend."""
+    def create_client() -> Any:
+        from .google_calendar_client import GoogleCalendarClient
+        return GoogleCalendarClient(
+            credentials_file=config.google_credentials_file,
+            token_file=config.google_token_file,
+            id_cache=JsonStore(config.state_path("google_event_ids.json")),
+            slice_days=config.fetch_slice_days,
+            concurrency=config.fetch_concurrency,
+            transport=transport,
+            discovery_cache=config.state_path("google_discovery_calendar_v3.json")
+        )
+    return GoogleBackend("google", create_client, wipe_privacy_events=True)
+
+
+register_backend("nextcloud", caldav_backend("nextcloud"))
+register_backend("kerio", caldav_backend("kerio", wipe_privacy_events=True))
+register_backend("google", google_backend)
+
+
+class BackendRegistry:
+    """The backends of one configuration, each created on first use."""
+
+    def __init__(self, config: "Config", transport: Optional["HttpTransport"] = None):
+        """Initialize the registry; clients send their requests through ``transport`` if given."""
+        self.config = config
+        self.transport = transport
+        self._backends: Dict[str, Backend] = {}
+        self._routes: Dict[str, Tuple[Backend, str]] = {}
+
+    def get(self, name: str) -> Backend:
+        """Get a backend by name."""
+        if name not in self._backends:
+            if name not in BACKENDS:
+                raise ValueError(f"Unsupported calendar backend: {name}")
+            backend = BACKENDS[name](self.config, self.transport)
+            backend.breaker = CircuitBreaker(
+                name,
+                failure_threshold=self.config.breaker_failure_threshold,
+                reset_timeout=self.config.breaker_reset_seconds
+            )
+            self._backends[name] = backend
+        return self._backends[name]
+
+    def reconfigure(self, config: "Config") -> None:
+        """Switch to a changed configuration, keeping the backends it does not affect.
+
+        A backend is created again, on first use, if its server settings
+        (the configuration attribute named like the backend) or one of
+        CLIENT_SETTINGS changed. The others keep their client, with its
+        connections and discovered calendars.
+        """
+        old, self.config = self.config, config
+        shared_changed = any(getattr(old, name) != getattr(config, name) for name in CLIENT_SETTINGS)
+        for name, backend in list(self._backends.items()):
+            if shared_changed or getattr(old, name, None) != getattr(config, name, None):
+                logger.info("Settings of backend %s changed, it will reconnect", name)
+                backend.save_state()
+                del self._backends[name]
+            else:
+                backend.breaker.failure_threshold = max(config.breaker_failure_threshold, 1)
+                backend.breaker.reset_timeout = config.breaker_reset_seconds
+        self._routes.clear()
+
+    def resolve(self, calendar: str) -> Tuple[Backend, str]:
+        """Get the backend and backend calendar id of a ``calendar@backend`` string."""
+        route = self._routes.get(calendar)
+        if route is None:
+            endpoint = Endpoint.parse(calendar)
+            route = self._routes[calendar] = (self.get(endpoint.backend), endpoint.calendar_id)
+        return route
+
+    def unavailable(self, calendars: Iterable[str]) -> List[Backend]:
+        """Get the backends of some calendars whose circuit breaker is open."""
+        backends = {self.resolve(calendar)[0] for calendar in calendars}
+        return [backend for backend in backends if not backend.breaker.available()]
+
+    def created(self) -> List[Backend]:
+        """Get the backends that were created so far."""
+        return list(self._backends.values())
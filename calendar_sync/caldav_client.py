@@ -1,97 +1,77 @@
 """CalDAV client implementation for calendar operations."""
 
 import logging
-from dataclasses import dataclass
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Set
+from xml.sax.saxutils import escape
 
 import caldav
 from caldav.elements import dav, cdav
+from caldav.elements.base import ValuedBaseElement
+from caldav.lib import error as caldav_error
 from icalendar import Calendar, Event
 
 from .config import ServerConfig
+from .events import CalendarEvent
+from .slicing import fetch_sliced
+from .state import JsonStore
+from .tracing import current_span, span, traced
+
+if TYPE_CHECKING:
+    from .cassette import HttpTransport
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass
-class CalendarEvent:
-    """Representation of a calendar event."""
-    uid: str
-    summary: str
-    start: datetime
-    end: datetime
-    description: Optional[str] = None
-    location: Optional[str] = None
-    recurrence: Optional[str] = None
-    is_all_day: bool = False
-    ical_data: str = ""
-    
-    def __getitem__(self, key: str) -> any:
-        """Support dictionary-style access for backward compatibility."""
-        if hasattr(self, key):
-            return getattr(self, key)
-        raise KeyError(f"'{self.__class__.__name__}' object has no attribute '{key}'")
-    
-    def __setitem__(self, key: str, value: any) -> None:
-        """Support dictionary-style access for backward compatibility."""
-        if hasattr(self, key):
-            setattr(self, key, value)
-        else:
-            raise KeyError(f"'{self.__class__.__name__}' object has no attribute '{key}'")
-            
-    @classmethod
-    def from_ical(cls, ical_data: str) -> "CalendarEvent":
-        """Create a CalendarEvent from iCalendar data."""
-        cal = Calendar.from_ical(ical_data)
-        event = None
-        
-        for component in cal.walk():
-            if component.name == "VEVENT":
-                event = component
-                break
-        
-        if not event:
-            raise ValueError("No VEVENT component found in iCalendar data")
-        
-        # Handle both datetime and date objects
-        start = event.get('dtstart').dt
-        end = event.get('dtend').dt
-        
-        # Check if this is an all-day event (date objects instead of datetime)
-        is_all_day = not isinstance(start, datetime)
-        
-        # For all-day events, keep the date but set time to midnight
-        if is_all_day:
-            start = datetime.combine(start, datetime.min.time())
-            end = datetime.combine(end, datetime.min.time())
-        
-        return cls(
-            uid=event.get('uid'),
-            summary=event.get('summary'),
-            start=start,
-            end=end,
-            description=event.get('description'),
-            location=event.get('location'),
-            recurrence=event.get('rrule'),
-            is_all_day=is_all_day,
-            ical_data=ical_data
-        )
+CALDAV_NS = "urn:ietf:params:xml:ns:caldav"
+
+
+def _utc_stamp(value: datetime) -> str:
+    """Format a datetime as a CalDAV UTC time; naive values are local time."""
+    return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+class GetCTag(ValuedBaseElement):
+    """CalendarServer ``getctag`` property of a calendar collection."""
+    tag = "{http://calendarserver.org/ns/}getctag"
 
 
 class CalDAVClient:
     """Client for interacting with CalDAV servers."""
     
-    def __init__(self, config: ServerConfig):
-        """Initialize the CalDAV client."""
+    def __init__(
+        self,
+        config: ServerConfig,
+        cache: Optional[JsonStore] = None,
+        slice_days: int = 0,
+        concurrency: int = 4,
+        transport: Optional["HttpTransport"] = None
+    ):
+        """Initialize the CalDAV client.
+
+        If a cache store is given, the calendar id to collection URL mapping
+        is persisted there so later runs can skip principal discovery.
+        With ``slice_days``, list_events fetches longer windows in slices of
+        that many days, ``concurrency`` of them at a time. A transport
+        records or replays the HTTP exchanges of the client.
+        """
         self.config = config
+        self.slice_days = slice_days
+        self.concurrency = concurrency
         self.client = caldav.DAVClient(
             url=config.url,
             username=config.username,
             password=config.password
         )
+        if transport is not None:
+            transport.mount(self.client.session)
+        self.cache = cache
         self._principal = None
         self._calendars: Dict[str, caldav.Calendar] = {}
+        # Calendars whose (possibly cached) URL has answered a request
+        self._validated: Set[str] = set()
+        # Calendars whose server rejected partial calendar-data retrieval
+        self._no_partial_data: Set[str] = set()
     
     @property
     def principal(self) -> caldav.Principal:
@@ -101,17 +81,98 @@ class CalDAVClient:
         return self._principal
     
     def get_calendar(self, calendar_id: str) -> caldav.Calendar:
-        """Get a calendar by its ID."""
+        """Get a calendar by its ID.
+
+        A persisted collection URL is used directly without contacting the
+        server; it is validated lazily by the first request made against it.
+        """
         if calendar_id not in self._calendars:
-            calendars = self.principal.calendars()
-            for calendar in calendars:
-                if calendar.id == calendar_id:
-                    self._calendars[calendar_id] = calendar
-                    break
-            if calendar_id not in self._calendars:
-                raise ValueError(f"Calendar not found: {calendar_id}")
+            entry = self.cache.get(calendar_id) if self.cache else None
+            if entry and entry.get('url'):
+                self._calendars[calendar_id] = caldav.Calendar(
+                    client=self.client, url=entry['url'], id=calendar_id
+                )
+            else:
+                self._discover_calendars(calendar_id)
         return self._calendars[calendar_id]
+
+    def _discover_calendars(self, calendar_id: str) -> None:
+        """Look up the calendars of the principal and remember their URLs."""
+        logger.debug(f"Discovering calendars on {self.config.url}")
+        with span("caldav.discover", backend="caldav", server=self.config.url):
+            calendars = self.principal.calendars()
+        for calendar in calendars:
+            if calendar.id == calendar_id:
+                self._calendars[calendar_id] = calendar
+                self._validated.add(calendar_id)
+            if self.cache is not None:
+                entry = dict(self.cache.get(calendar.id) or {})
+                if entry.get('url') != str(calendar.url):
+                    # A moved collection invalidates its sync state
+                    entry = {'url': str(calendar.url)}
+                self.cache.set(calendar.id, entry)
+        if self.cache is not None:
+            self.cache.save()
+        if calendar_id not in self._calendars:
+            raise ValueError(f"Calendar not found: {calendar_id}")
+
+    def forget_calendar(self, calendar_id: str) -> None:
+        """Drop the cached collection of a calendar."""
+        self._calendars.pop(calendar_id, None)
+        self._validated.discard(calendar_id)
+        if self.cache is not None and self.cache.pop(calendar_id) is not None:
+            self.cache.save()
+
+    def _with_calendar(
+        self,
+        calendar_id: str,
+        operation: Callable[[caldav.Calendar], Any]
+    ) -> Any:
+        """Run an operation against a calendar, rediscovering stale URLs.
+
+        If the collection URL came from the persisted cache and has not
+        answered a request yet, a DAV error is taken as a sign that the
+        calendar moved: the entry is dropped, discovery runs once and the
+        operation is retried. A missing object, such as an event looked up
+        by UID, is only raised as such once the collection itself answers.
+        """
+        calendar = self.get_calendar(calendar_id)
+        if calendar_id in self._validated:
+            return operation(calendar)
+        try:
+            result = operation(calendar)
+        except caldav_error.DAVError as e:
+            if isinstance(e, caldav_error.NotFoundError) and self._collection_exists(calendar):
+                self._validated.add(calendar_id)
+                raise
+            logger.info(f"Cached URL for calendar {calendar_id} failed ({e}), rediscovering")
+            self.forget_calendar(calendar_id)
+            calendar = self.get_calendar(calendar_id)
+            result = operation(calendar)
+        self._validated.add(calendar_id)
+        return result
+
+    def _collection_exists(self, calendar: caldav.Calendar) -> bool:
+        """Check whether a calendar collection answers at its URL."""
+        try:
+            calendar.get_properties([dav.DisplayName()])
+        except caldav_error.DAVError:
+            return False
+        return True
+
+    def fetch_sync_state(self, calendar_id: str) -> Dict[str, Optional[str]]:
+        """Fetch the current ctag and sync token with a single PROPFIND."""
+        with span("caldav.propfind", backend="caldav", calendar=calendar_id):
+            props = self._with_calendar(
+                calendar_id,
+                lambda calendar: calendar.get_properties([GetCTag(), dav.SyncToken()])
+            )
+        return {
+            'ctag': props.get(GetCTag.tag),
+            'sync_token': props.get(dav.SyncToken.tag),
+        }
     
+    @traced("caldav.list_events", backend="caldav", operation="list")
     def list_events(
         self,
         calendar_id: str,
@@ -119,31 +180,217 @@ class CalDAVClient:
         end: Optional[datetime] = None
     ) -> List[CalendarEvent]:
         """List events in a calendar."""
-        calendar = self.get_calendar(calendar_id)
-        
         # Default to fetching events from the last week to next month
         if not start:
             start = datetime.now() - timedelta(days=7)
         if not end:
             end = datetime.now() + timedelta(days=30)
         
+        if self.slice_days and end - start > timedelta(days=self.slice_days):
+            if calendar_id not in self._validated:
+                # Check a cached URL once before the slices use it in parallel
+                self._with_calendar(calendar_id, lambda calendar: calendar.get_properties([dav.DisplayName()]))
+            events = fetch_sliced(
+                lambda slice_start, slice_end: self._date_search(calendar_id, slice_start, slice_end),
+                start, end, timedelta(days=self.slice_days), self.concurrency
+            )
+        else:
+            events = self._date_search(calendar_id, start, end)
+        current_span().set_attribute("events", len(events))
+        return events
+    
+    def _date_search(self, calendar_id: str, start: datetime, end: datetime) -> List[CalendarEvent]:
+        """Fetch and parse the events of a time range with a single query."""
+        with span("caldav.fetch", backend="caldav", calendar=calendar_id):
+            results = self._with_calendar(
+                calendar_id,
+                lambda calendar: calendar.date_search(start=start, end=end)
+            )
         events = []
-        for event in calendar.date_search(start=start, end=end):
-            try:
-                events.append(CalendarEvent.from_ical(event.data))
-            except Exception as e:
-                logger.warning(f"Failed to parse event: {e}")
+        failures = 0
+        with span("caldav.parse", backend="caldav", calendar=calendar_id) as parse_span:
+            for event in results:
+                try:
+                    data = event.data
+                    parse_span.add("bytes", len(data))
+                    events.append(CalendarEvent.from_ical(data))
+                except Exception as e:
+                    failures += 1
+                    if failures == 1:
+                        logger.warning("Failed to parse event in %s: %s", calendar_id, e)
+            parse_span.set_attribute("events", len(events))
+        if failures > 1:
+            logger.warning("Failed to parse %d events in %s", failures, calendar_id)
         
         return events
     
+    def iter_events(
+        self,
+        calendar_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        batch_size: int = 100
+    ) -> Iterator[CalendarEvent]:
+        """Yield the events of a calendar, keeping one batch in memory.
+
+        A calendar-query without calendar data lists the matching resources;
+        they are then downloaded and parsed in calendar-multiget batches.
+        Recurring events are expanded by the server, like list_events does.
+        """
+        if not start:
+            start = datetime.now() - timedelta(days=7)
+        if not end:
+            end = datetime.now() + timedelta(days=30)
+        time_range = f'start="{_utc_stamp(start)}" end="{_utc_stamp(end)}"'
+
+        query = (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            f'<C:calendar-query xmlns:D="DAV:" xmlns:C="{CALDAV_NS}">'
+            '<D:prop><D:getetag/></D:prop>'
+            '<C:filter><C:comp-filter name="VCALENDAR"><C:comp-filter name="VEVENT">'
+            f'<C:time-range {time_range}/>'
+            '</C:comp-filter></C:comp-filter></C:filter>'
+            '</C:calendar-query>'
+        )
+        with span("caldav.fetch", backend="caldav", calendar=calendar_id, operation="query") as fetch_span:
+            response = self._with_calendar(
+                calendar_id,
+                lambda calendar: self.client.report(str(calendar.url), query, depth=1)
+            )
+            hrefs = [href for href, _ in self._iter_multistatus(response)]
+            fetch_span.set_attribute("events", len(hrefs))
+        calendar_url = str(self.get_calendar(calendar_id).url)
+
+        failures = 0
+        for offset in range(0, len(hrefs), batch_size):
+            batch = hrefs[offset:offset + batch_size]
+            multiget = (
+                '<?xml version="1.0" encoding="utf-8"?>'
+                f'<C:calendar-multiget xmlns:D="DAV:" xmlns:C="{CALDAV_NS}">'
+                f'<D:prop><D:getetag/><C:calendar-data><C:expand {time_range}/></C:calendar-data></D:prop>'
+                + ''.join(f'<D:href>{escape(href)}</D:href>' for href in batch)
+                + '</C:calendar-multiget>'
+            )
+            with span("caldav.fetch", backend="caldav", calendar=calendar_id,
+                      operation="multiget", events=len(batch)):
+                response = self.client.report(calendar_url, multiget, depth=1)
+            parsed = []
+            with span("caldav.parse", backend="caldav", calendar=calendar_id) as parse_span:
+                for _, data in self._iter_multistatus(response):
+                    if not data:
+                        continue
+                    parse_span.add("bytes", len(data))
+                    try:
+                        parsed.extend(CalendarEvent.iter_from_ical(data))
+                    except Exception as e:
+                        failures += 1
+                        if failures == 1:
+                            logger.warning("Failed to parse event in %s: %s", calendar_id, e)
+                parse_span.set_attribute("events", len(parsed))
+            del response
+            yield from parsed
+        if failures > 1:
+            logger.warning("Failed to parse %d events in %s", failures, calendar_id)
+
+    @traced("caldav.list_events", backend="caldav", operation="busy")
+    def list_busy_events(
+        self,
+        calendar_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> List[CalendarEvent]:
+        """List events with only the properties needed for busy time.
+
+        A calendar-query with partial calendar-data retrieval asks the
+        server for UID, DTSTART, DTEND, DURATION and RRULE only, leaving out
+        descriptions, locations and attachments. If the server rejects the
+        query, this is remembered and list_events is used instead.
+        """
+        entry = (self.cache.get(calendar_id) if self.cache else None) or {}
+        if calendar_id in self._no_partial_data or entry.get('partial_data') is False:
+            return self.list_events(calendar_id, start=start, end=end)
+        if not start:
+            start = datetime.now() - timedelta(days=7)
+        if not end:
+            end = datetime.now() + timedelta(days=30)
+        time_range = f'start="{_utc_stamp(start)}" end="{_utc_stamp(end)}"'
+
+        query = (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            f'<C:calendar-query xmlns:D="DAV:" xmlns:C="{CALDAV_NS}">'
+            '<D:prop><C:calendar-data>'
+            f'<C:expand {time_range}/>'
+            '<C:comp name="VCALENDAR"><C:prop name="VERSION"/>'
+            '<C:comp name="VEVENT">'
+            '<C:prop name="UID"/><C:prop name="DTSTART"/><C:prop name="DTEND"/>'
+            '<C:prop name="DURATION"/><C:prop name="RRULE"/>'
+            '</C:comp><C:comp name="VTIMEZONE"/></C:comp>'
+            '</C:calendar-data></D:prop>'
+            '<C:filter><C:comp-filter name="VCALENDAR"><C:comp-filter name="VEVENT">'
+            f'<C:time-range {time_range}/>'
+            '</C:comp-filter></C:comp-filter></C:filter>'
+            '</C:calendar-query>'
+        )
+        def report(calendar: caldav.Calendar) -> Any:
+            response = self.client.report(str(calendar.url), query, depth=1)
+            if response.status not in (200, 207):
+                raise caldav_error.ReportError(f"HTTP {response.status}")
+            return response
+
+        try:
+            with span("caldav.fetch", backend="caldav", calendar=calendar_id, operation="busy"):
+                response = self._with_calendar(calendar_id, report)
+                resources = list(self._iter_multistatus(response))
+            if any(data is None for _, data in resources):
+                raise caldav_error.ReportError("calendar-data missing from the response")
+        except caldav_error.DAVError as e:
+            logger.info(
+                "Partial calendar data is not supported for %s (%s), fetching full events",
+                calendar_id, e
+            )
+            self._no_partial_data.add(calendar_id)
+            if self.cache is not None and calendar_id in self.cache:
+                self.cache.set(calendar_id, dict(self.cache.get(calendar_id), partial_data=False))
+                self.cache.save()
+            return self.list_events(calendar_id, start=start, end=end)
+
+        events = []
+        failures = 0
+        with span("caldav.parse", backend="caldav", calendar=calendar_id) as parse_span:
+            for _, data in resources:
+                parse_span.add("bytes", len(data))
+                try:
+                    events.extend(CalendarEvent.iter_from_ical(data))
+                except Exception as e:
+                    failures += 1
+                    if failures == 1:
+                        logger.warning("Failed to parse event in %s: %s", calendar_id, e)
+            parse_span.set_attribute("events", len(events))
+        current_span().set_attribute("events", len(events))
+        if failures > 1:
+            logger.warning("Failed to parse %d events in %s", failures, calendar_id)
+        return events
+
+    @staticmethod
+    def _iter_multistatus(response: Any) -> Iterator[tuple]:
+        """Yield (href, calendar data) of every resource in a multistatus response."""
+        tree = response.tree
+        if tree is None:
+            return
+        for item in tree.iter("{DAV:}response"):
+            href = item.findtext("{DAV:}href")
+            if not href or href.endswith("/"):
+                # The collection itself
+                continue
+            yield href, item.findtext(f".//{{{CALDAV_NS}}}calendar-data")
+
+    @traced("caldav.write", backend="caldav", operation="create")
     def create_event(
         self,
         calendar_id: str,
         event: CalendarEvent
     ) -> str:
         """Create a new event in the calendar."""
-        calendar = self.get_calendar(calendar_id)
-        
         cal = Calendar()
         cal.add('prodid', '-//Calendar Sync Tool//EN')
         cal.add('version', '2.0')
@@ -172,21 +419,18 @@ class CalDAVClient:
         
         cal.add_component(vevent)
         
-        calendar.save_event(cal.to_ical().decode('utf-8'))
+        ical = cal.to_ical().decode('utf-8')
+        current_span().set_attribute("bytes", len(ical))
+        self._with_calendar(calendar_id, lambda calendar: calendar.save_event(ical))
         return event.uid
     
+    @traced("caldav.write", backend="caldav", operation="update")
     def update_event(
         self,
         calendar_id: str,
         event: CalendarEvent
     ) -> None:
         """Update an existing event in the calendar."""
-        calendar = self.get_calendar(calendar_id)
-        events = calendar.event_by_uid(event.uid)
-        
-        if not events:
-            raise ValueError(f"Event not found: {event.uid}")
-        
         cal = Calendar()
         cal.add('prodid', '-//Calendar Sync Tool//EN')
         cal.add('version', '2.0')
@@ -215,18 +459,26 @@ class CalDAVClient:
         
         cal.add_component(vevent)
         
-        events[0].data = cal.to_ical().decode('utf-8')
+        ical = cal.to_ical().decode('utf-8')
+        current_span().set_attribute("bytes", len(ical))
+
+        def save(calendar: caldav.Calendar) -> None:
+            existing = calendar.event_by_uid(event.uid)
+            existing.data = ical
+            existing.save()
+
+        self._with_calendar(calendar_id, save)
     
+    @traced("caldav.write", backend="caldav", operation="delete")
     def delete_event(
         self,
         calendar_id: str,
         event_uid: str
     ) -> None:
-        """Delete an event from the calendar."""
-        calendar = self.get_calendar(calendar_id)
-        events = calendar.event_by_uid(event_uid)
-        
-        if not events:
-            raise ValueError(f"Event not found: {event_uid}")
-        
-        events[0].delete() 
\ No newline at end of file
+        """Delete an event from the calendar.
+
+        Raises caldav.lib.error.NotFoundError if there is no such event.
+        """
+        self._with_calendar(
+            calendar_id, lambda calendar: calendar.event_by_uid(event_uid).delete()
+        )
\ No newline at end of file
@@ -0,0 +1,355 @@
+"""Recording and replaying the HTTP exchanges of a sync.
+
+A ``RecordingTransport`` captures every request the CalDAV and Google
+clients make, with its response and duration, and saves them to a JSON
+cassette file. Credentials are never written: authorization and cookie
+headers are dropped and configured secrets are masked. A
+``ReplayTransport`` answers the same requests from the cassette without
+any network access, optionally adding latency to every request to model
+a slow link, and counts the requests made, so changes that add round
+trips show up offline.
+
+CalDAV traffic is captured with a requests adapter mounted on the
+session of the CalDAV client, Google traffic by wrapping the httplib2
+connection the API client uses.
+"""
+
+import abc
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_VERSION = 1
+REDACTED = "REDACTED"
+# Headers that carry credentials or session state
+SECRET_HEADERS = {"authorization", "cookie", "set-cookie", "proxy-authorization", "www-authenticate"}
+# Response headers that no longer apply to the decoded, redacted body
+BODY_HEADERS = {"content-length", "content-encoding", "transfer-encoding"}
+
+
+class CassetteMiss(Exception):
+    """Raised when a replayed request has no recorded counterpart."""
+
+
+def _encode_body(body: Any) -> Tuple[Optional[str], bool]:
+    """Encode a request or response body as text, base64 if it is not UTF-8."""
+    if body is None:
+        return None, False
+    if isinstance(body, str):
+        return body, False
+    if not isinstance(body, (bytes, bytearray)):
+        body = b"".join(body)
+    try:
+        return bytes(body).decode('utf-8'), False
+    except UnicodeDecodeError:
+        return base64.b64encode(bytes(body)).decode('ascii'), True
+
+
+def _decode_body(body: Optional[str], is_base64: bool) -> bytes:
+    """Decode a body stored by ``_encode_body``."""
+    if body is None:
+        return b""
+    return base64.b64decode(body) if is_base64 else body.encode('utf-8')
+
+
+def _without_query(url: str) -> str:
+    """Strip the query string of a URL."""
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, '', ''))
+
+
+class HttpTransport(abc.ABC):
+    """Base of the recording and replaying transports."""
+
+    replaying = False
+
+    def __init__(self, secrets: Iterable[Optional[str]] = (), latency: float = 0.0):
+        """Initialize the transport.
+
+        Args:
+            secrets: Values masked wherever they occur, such as passwords.
+            latency: Seconds added to every request.
+        """
+        # Longest first, so a secret containing another is masked whole
+        self.secrets = sorted({secret for secret in secrets if secret}, key=len, reverse=True)
+        self.latency = latency
+        # Requests made, by method and host
+        self.requests: Counter = Counter()
+        self.latency_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _redact(self, text: Optional[str]) -> Optional[str]:
+        """Mask the configured secrets in a text."""
+        if text is None:
+            return None
+        for secret in self.secrets:
+            text = text.replace(secret, REDACTED)
+        return text
+
+    def _redact_headers(self, headers: Dict[str, str]) -> Dict[str, str]:
+        """Drop credential headers and mask secrets in the others."""
+        return {
+            key: self._redact(str(value))
+            for key, value in headers.items()
+            if key.lower() not in SECRET_HEADERS
+        }
+
+    def mount(self, session: requests.Session) -> None:
+        """Route the requests of a requests session through the transport."""
+        adapter = _TransportAdapter(self)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+    def wrap_http(self, http: Any) -> "_TransportHttp":
+        """Route the requests of an httplib2-style connection through the transport."""
+        return _TransportHttp(self, http)
+
+    def _count(self, method: str, url: str) -> None:
+        """Count a request and add the injected latency."""
+        with self._lock:
+            self.requests[(method.upper(), urlsplit(url).netloc)] += 1
+            self.latency_seconds += self.latency
+        if self.latency:
+            time.sleep(self.latency)
+
+    @abc.abstractmethod
+    def exchange(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+        body: Any,
+        send: Optional[Any]
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """Handle one request; ``send`` performs it for real if given.
+
+        Returns the status, headers and body of the response.
+        """
+
+    def summary(self) -> str:
+        """Describe the requests made as a plain text table."""
+        total = sum(self.requests.values())
+        lines = [f"{'method':<8}  {'host':<40}  {'requests':>8}"]
+        for (method, host), count in sorted(self.requests.items()):
+            lines.append(f"{method:<8}  {host:<40}  {count:>8}")
+        lines.append(f"{'total':<8}  {'':<40}  {total:>8}")
+        if self.latency:
+            lines.append(f"injected latency: {self.latency_seconds:.3f} s "
+                         f"({self.latency * 1000:.0f} ms per request)")
+        return "\n".join(lines)
+
+    def save(self) -> None:
+        """Write anything recorded; nothing to do by default."""
+
+
+class RecordingTransport(HttpTransport):
+    """Performs requests and records them into a cassette file."""
+
+    def __init__(self, path: str, secrets: Iterable[Optional[str]] = ()):
+        """Initialize the recorder.
+
+        Args:
+            path: Cassette file written by ``save``.
+            secrets: Values masked wherever they occur, such as passwords.
+        """
+        super().__init__(secrets)
+        self.path = path
+        self.interactions: List[Dict[str, Any]] = []
+
+    def exchange(self, method, url, headers, body, send):
+        """Perform a request and record it."""
+        self._count(method, url)
+        started = time.perf_counter()
+        status, response_headers, content = send()
+        duration = time.perf_counter() - started
+        request_body, request_base64 = _encode_body(body)
+        response_body, response_base64 = _encode_body(content)
+        interaction = {
+            'request': {
+                'method': method.upper(),
+                'url': self._redact(url),
+                'headers': self._redact_headers(headers),
+                'body': request_body if request_base64 else self._redact(request_body),
+                'base64': request_base64,
+            },
+            'response': {
+                'status': status,
+                'headers': {
+                    key: value for key, value in self._redact_headers(response_headers).items()
+                    if key.lower() not in BODY_HEADERS
+                },
+                'body': response_body if response_base64 else self._redact(response_body),
+                'base64': response_base64,
+            },
+            'duration': round(duration, 6),
+        }
+        with self._lock:
+            self.interactions.append(interaction)
+        return status, response_headers, content
+
+    def save(self) -> None:
+        """Write the recorded interactions to the cassette file."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            document = {'version': CASSETTE_VERSION, 'interactions': list(self.interactions)}
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=1)
+        logger.info("Recorded %d HTTP exchange(s) to %s", len(document['interactions']), self.path)
+
+
+class ReplayTransport(HttpTransport):
+    """Answers requests from a cassette file without network access.
+
+    A request is matched to the first unused recording with the same
+    method, URL and body; failing that, with the same method and URL;
+    failing that, with the same method and URL without query string. The
+    looser matches cover requests that contain the current time, such as
+    the time range of a query.
+    """
+
+    replaying = True
+
+    def __init__(self, path: str, secrets: Iterable[Optional[str]] = (), latency: float = 0.0):
+        """Load a cassette.
+
+        Args:
+            path: Cassette file written by a RecordingTransport.
+            secrets: The secrets masked while recording, masked in requests
+                the same way before they are matched.
+            latency: Seconds added to every request.
+        """
+        super().__init__(secrets, latency)
+        self.path = path
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                document = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Failed to read cassette {path}: {e}")
+        self.interactions: List[Dict[str, Any]] = document.get('interactions', [])
+        self._used = [False] * len(self.interactions)
+        # Recorded time of the requests answered so far
+        self.recorded_seconds = 0.0
+
+    def _find(self, method: str, url: str, body: Optional[str]) -> Dict[str, Any]:
+        """Claim the best unused recording for a request."""
+        keys = (
+            lambda request: (request['method'], request['url'], request['body']),
+            lambda request: (request['method'], request['url']),
+            lambda request: (request['method'], _without_query(request['url'])),
+        )
+        wanted = (
+            (method, url, body),
+            (method, url),
+            (method, _without_query(url)),
+        )
+        with self._lock:
+            for key, target in zip(keys, wanted):
+                for index, interaction in enumerate(self.interactions):
+                    if not self._used[index] and key(interaction['request']) == target:
+                        self._used[index] = True
+                        self.recorded_seconds += interaction.get('duration', 0.0)
+                        return interaction
+        raise CassetteMiss(f"No recorded response for {method} {url}")
+
+    def exchange(self, method, url, headers, body, send):
+        """Answer a request from the cassette."""
+        self._count(method, url)
+        request_body, is_base64 = _encode_body(body)
+        if not is_base64:
+            request_body = self._redact(request_body)
+        response = self._find(method.upper(), self._redact(url), request_body)['response']
+        return (
+            response['status'],
+            dict(response['headers']),
+            _decode_body(response['body'], response.get('base64', False)),
+        )
+
+    def unused(self) -> int:
+        """Count the recordings no request asked for."""
+        return self._used.count(False)
+
+    def summary(self) -> str:
+        """Describe the requests made and how they compare to the recording."""
+        return super().summary() + (
+            f"\nrecorded time of replayed requests: {self.recorded_seconds:.3f} s"
+            f"\nrecorded requests not replayed: {self.unused()}"
+        )
+
+
+class _TransportAdapter(BaseAdapter):
+    """requests adapter sending everything through a transport."""
+
+    def __init__(self, transport: HttpTransport):
+        super().__init__()
+        self.transport = transport
+        self._http = HTTPAdapter()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        def send():
+            response = self._http.send(request, stream=False, timeout=timeout,
+                                       verify=verify, cert=cert, proxies=proxies)
+            return response.status_code, dict(response.headers), response.content
+
+        status, headers, content = self.transport.exchange(
+            request.method, request.url, dict(request.headers), request.body,
+            None if self.transport.replaying else send
+        )
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = content
+        response.url = request.url
+        response.request = request
+        response.reason = ""
+        response.connection = self
+        return response
+
+    def close(self) -> None:
+        self._http.close()
+
+
+class _TransportHttp:
+    """httplib2-style connection sending everything through a transport."""
+
+    def __init__(self, transport: HttpTransport, http: Any):
+        self.transport = transport
+        self.http = http
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=5, connection_type=None):
+        import httplib2
+
+        def send():
+            response, content = self.http.request(
+                uri, method, body=body, headers=headers,
+                redirections=redirections, connection_type=connection_type
+            )
+            headers_out = {key: value for key, value in response.items() if key != 'status'}
+            return response.status, headers_out, content
+
+        status, response_headers, content = self.transport.exchange(
+            method, uri, dict(headers or {}), body,
+            None if self.transport.replaying else send
+        )
+        return httplib2.Response(dict(response_headers, status=str(status))), content
+
+    def __getattr__(self, name: str) -> Any:
+        # Attributes such as credentials and timeout of the wrapped connection
+        if self.http is None:
+            raise AttributeError(name)
+        return getattr(self.http, name)
@@ -3,14 +3,28 @@
 import json
 import logging
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import List, Optional
+from typing import Any, Dict, List, Mapping, Optional
 
-from dotenv import load_dotenv
+from dotenv import dotenv_values, load_dotenv
 
 logger = logging.getLogger(__name__)
 
+# Values of keys containing one of these words are never logged
+SECRET_KEY_MARKERS = ("PASSWORD", "SECRET", "TOKEN")
+
+DEFAULT_GOOGLE_CREDENTIALS_FILE = (
+    'client_secret_571324167090-i9l373a0pn3amp4r055c7rfd5ool4bss.apps.googleusercontent.com.json'
+)
+
+
+def redact(key: str, value: Optional[str]) -> Optional[str]:
+    """Mask the value of a secret configuration key for logging."""
+    if value and any(marker in key.upper() for marker in SECRET_KEY_MARKERS):
+        return "********"
+    return value
+
 
 class SyncMode(Enum):
     """Synchronization mode for calendar pairs."""
@@ -18,6 +32,84 @@ class SyncMode(Enum):
     ONE_WAY = "one_way"
 
 
+class DuplicatePolicy(Enum):
+    """What to do with an event that duplicates another event of its target."""
+    OFF = "off"
+    LOG = "log"
+    SUPPRESS = "suppress"
+
+
+DURATION_UNITS = {"m": 1, "h": 60, "d": 24 * 60}
+
+
+def parse_minutes(value: str, default_unit: str = "m") -> int:
+    """Parse a duration such as ``90``, ``30m``, ``2h`` or ``7d`` into minutes."""
+    value = value.strip().lower()
+    unit = value[-1:] if value[-1:] in DURATION_UNITS else default_unit
+    number = value[:-1] if value[-1:] in DURATION_UNITS else value
+    if not number.isdigit() or int(number) <= 0:
+        raise ValueError(f"Invalid duration: {value!r}")
+    return int(number) * DURATION_UNITS[unit]
+
+
+def format_minutes(minutes: int) -> str:
+    """Format minutes in the largest unit that divides them."""
+    for unit, size in sorted(DURATION_UNITS.items(), key=lambda item: -item[1]):
+        if minutes % size == 0:
+            return f"{minutes // size}{unit}"
+    return f"{minutes}m"
+
+
+@dataclass(frozen=True)
+class HorizonTier:
+    """A part of the sync window with its own sync interval.
+
+    A tier reaches ``horizon_minutes`` from now and starts where the
+    previous tier ends, the first one at the start of today.
+    """
+    horizon_minutes: int
+    interval_minutes: int
+
+    def __str__(self) -> str:
+        return f"{format_minutes(self.horizon_minutes)}/{format_minutes(self.interval_minutes)}"
+
+
+def parse_horizon_tiers(value: str) -> List[HorizonTier]:
+    """Parse tiers written as ``horizon/interval,...``, e.g. ``2d/2m,30d/30m,90d/1h``.
+
+    Horizons default to days and intervals to minutes; ``off`` or an
+    empty value means no tiers.
+    """
+    value = value.strip()
+    if not value or value.lower() == "off":
+        return []
+    tiers = []
+    for item in value.split(","):
+        horizon, separator, interval = item.partition("/")
+        if not separator:
+            raise ValueError(f"Horizon tier must be in format: horizon/interval, not {item.strip()!r}")
+        tiers.append(HorizonTier(parse_minutes(horizon, "d"), parse_minutes(interval)))
+    for previous, tier in zip(tiers, tiers[1:]):
+        if tier.horizon_minutes <= previous.horizon_minutes:
+            raise ValueError(f"Horizon tiers must reach further out one after another: {value!r}")
+    return tiers
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    """A calendar of a backend, written as ``calendar@backend``."""
+    calendar_id: str
+    backend: str
+
+    @classmethod
+    def parse(cls, value: str) -> "Endpoint":
+        """Parse a ``calendar@backend`` string."""
+        calendar_id, _, backend = value.rpartition("@")
+        if not calendar_id.strip() or not backend.strip():
+            raise ValueError(f"Calendar must be in format: calendar@backend, not {value!r}")
+        return cls(calendar_id.strip(), backend.strip().lower())
+
+
 @dataclass
 class CalendarPair:
     """Configuration for a pair of calendars to sync."""
@@ -25,6 +117,19 @@ class CalendarPair:
     target_calendar: str
     sync_mode: SyncMode
     privacy: bool = False
+    # None to use HORIZON_TIERS
+    horizon_tiers: Optional[List[HorizonTier]] = None
+    source: Endpoint = field(init=False, repr=False, compare=False)
+    target: Endpoint = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.source = Endpoint.parse(self.source_calendar)
+        self.target = Endpoint.parse(self.target_calendar)
+
+    @property
+    def name(self) -> str:
+        """Get the pair name used for selection and persisted state."""
+        return f"{self.source_calendar}:{self.target_calendar}"
 
     @classmethod
     def from_string(cls, pair_string: str) -> "CalendarPair":
@@ -33,11 +138,12 @@ class CalendarPair:
         if len(parts) < 3:
             raise ValueError(
                 "Calendar pair must be in format: "
-                "source:target:mode[:privacy]"
+                "source:target:mode[:privacy[:tiers]]"
             )
         
         source, target, mode = parts[:3]
         privacy = parts[3].lower() == "true" if len(parts) > 3 else False
+        horizon_tiers = parse_horizon_tiers(parts[4]) if len(parts) > 4 and parts[4].strip() else None
         
         try:
             sync_mode = SyncMode(mode.lower())
@@ -47,7 +153,7 @@ class CalendarPair:
         if privacy and sync_mode == SyncMode.TWO_WAY:
             raise ValueError("Privacy mode is only valid for one-way sync")
         
-        return cls(source, target, sync_mode, privacy)
+        return cls(source, target, sync_mode, privacy, horizon_tiers)
 
 
 @dataclass
@@ -68,13 +174,49 @@ class Config:
     log_level: str
     privacy_event_title: str
     privacy_event_prefix: str
+    state_dir: str = ".r2-sync"
+    google_credentials_file: str = DEFAULT_GOOGLE_CREDENTIALS_FILE
+    google_token_file: str = "google_token.pickle"
+    log_file: Optional[str] = "calendar_sync.log"
+    log_format: str = "text"
+    log_max_bytes: int = 10 * 1024 * 1024
+    log_backup_count: int = 5
+    trace_file: Optional[str] = None
+    trace_endpoint: Optional[str] = None
+    stream_events: bool = False
+    event_spill_threshold: int = 50000
+    privacy_coalesce: bool = False
+    privacy_coalesce_gap_minutes: int = 0
+    force_resync_minutes: int = 360
+    fetch_slice_days: int = 0
+    fetch_concurrency: int = 4
+    breaker_failure_threshold: int = 2
+    breaker_reset_seconds: int = 300
+    import_days_back: int = 3650
+    import_days_ahead: int = 365
+    import_chunk_days: int = 30
+    import_concurrency: int = 8
+    duplicate_policy: DuplicatePolicy = DuplicatePolicy.LOG
+    memory_watchdog: bool = False
+    memory_soft_limit_mb: int = 0
+    memory_restart: bool = False
+    memory_trace_frames: int = 1
+    horizon_tiers: List[HorizonTier] = field(default_factory=list)
 
     @classmethod
     def load(cls) -> "Config":
         """Load configuration from environment variables."""
+        return cls.from_mapping(os.environ)
+
+    @classmethod
+    def from_mapping(cls, values: Mapping[str, Any]) -> "Config":
+        """Load configuration from a mapping of environment-style keys."""
         def get_env(key: str, required: bool = True) -> Optional[str]:
-            value = os.getenv(key)
-            logger.debug(f"Config.load() - Loading {key}: {value}")
+            value = values.get(key)
+            if value is not None and not isinstance(value, str):
+                # Structured values, e.g. from an accounts file
+                value = json.dumps(value) if isinstance(value, (list, dict)) else str(value)
+            logger.debug("Config.load() - Loading %s: %s", key, redact(key, value))
             if required and not value:
                 raise ValueError(f"Missing required environment variable: {key}")
             return value
@@ -102,6 +244,31 @@ class Config:
         except Exception as e:
             raise ValueError(f"Failed to parse calendar pairs: {e}")
 
+        # Imported here because the backends module depends on this one
+        from .backends import BACKENDS
+        for pair in calendar_pairs:
+            for endpoint in (pair.source, pair.target):
+                if endpoint.backend not in BACKENDS:
+                    raise ValueError(
+                        f"Unsupported calendar backend {endpoint.backend!r} in pair {pair.name}; "
+                        f"expected one of: {', '.join(sorted(BACKENDS))}"
+                    )
+
+        log_format = (get_env("LOG_FORMAT", False) or "text").lower()
+        if log_format not in ("text", "json"):
+            raise ValueError(f"LOG_FORMAT must be 'text' or 'json', not {log_format!r}")
+
+        duplicate_policy = (get_env("DUPLICATE_POLICY", False) or "log").lower()
+        try:
+            duplicate_policy = DuplicatePolicy(duplicate_policy)
+        except ValueError:
+            raise ValueError(f"DUPLICATE_POLICY must be 'off', 'log' or 'suppress', not {duplicate_policy!r}")
+
+        try:
+            horizon_tiers = parse_horizon_tiers(get_env("HORIZON_TIERS", False) or "")
+        except ValueError as e:
+            raise ValueError(f"Invalid HORIZON_TIERS: {e}")
+
         return cls(
             nextcloud=nextcloud,
             kerio=kerio,
@@ -109,5 +276,125 @@ class Config:
             sync_interval_minutes=int(get_env("SYNC_INTERVAL_MINUTES", False) or "30"),
             log_level=get_env("LOG_LEVEL", False) or "INFO",
             privacy_event_title=get_env("PRIVACY_EVENT_TITLE", False) or "Busy",
-            privacy_event_prefix=get_env("PRIVACY_EVENT_PREFIX", False) or "PRIVACY-SYNC-"
-        ) 
\ No newline at end of file
+            privacy_event_prefix=get_env("PRIVACY_EVENT_PREFIX", False) or "PRIVACY-SYNC-",
+            state_dir=get_env("STATE_DIR", False) or ".r2-sync",
+            google_credentials_file=(
+                get_env("GOOGLE_CREDENTIALS_FILE", False) or DEFAULT_GOOGLE_CREDENTIALS_FILE
+            ),
+            google_token_file=get_env("GOOGLE_TOKEN_FILE", False) or "google_token.pickle",
+            # An explicitly empty LOG_FILE disables the log file
+            log_file=values.get("LOG_FILE", "calendar_sync.log") or None,
+            log_format=log_format,
+            log_max_bytes=int(get_env("LOG_MAX_BYTES", False) or 10 * 1024 * 1024),
+            log_backup_count=int(get_env("LOG_BACKUP_COUNT", False) or "5"),
+            trace_file=get_env("TRACE_FILE", False) or None,
+            trace_endpoint=get_env("TRACE_OTLP_ENDPOINT", False) or None,
+            stream_events=(get_env("STREAM_EVENTS", False) or "false").lower() == "true",
+            event_spill_threshold=int(get_env("EVENT_SPILL_THRESHOLD", False) or "50000"),
+            privacy_coalesce=(get_env("PRIVACY_COALESCE", False) or "false").lower() == "true",
+            privacy_coalesce_gap_minutes=int(get_env("PRIVACY_COALESCE_GAP_MINUTES", False) or "0"),
+            force_resync_minutes=int(get_env("FORCE_RESYNC_MINUTES", False) or "360"),
+            fetch_slice_days=int(get_env("FETCH_SLICE_DAYS", False) or "0"),
+            fetch_concurrency=max(int(get_env("FETCH_CONCURRENCY", False) or "4"), 1),
+            breaker_failure_threshold=int(get_env("BREAKER_FAILURE_THRESHOLD", False) or "2"),
+            breaker_reset_seconds=int(get_env("BREAKER_RESET_SECONDS", False) or "300"),
+            import_days_back=int(get_env("IMPORT_DAYS_BACK", False) or "3650"),
+            import_days_ahead=int(get_env("IMPORT_DAYS_AHEAD", False) or "365"),
+            import_chunk_days=max(int(get_env("IMPORT_CHUNK_DAYS", False) or "30"), 1),
+            import_concurrency=max(int(get_env("IMPORT_CONCURRENCY", False) or "8"), 1),
+            duplicate_policy=duplicate_policy,
+            memory_watchdog=(get_env("MEMORY_WATCHDOG", False) or "false").lower() == "true",
+            memory_soft_limit_mb=int(get_env("MEMORY_SOFT_LIMIT_MB", False) or "0"),
+            memory_restart=(get_env("MEMORY_RESTART", False) or "false").lower() == "true",
+            memory_trace_frames=int(get_env("MEMORY_TRACE_FRAMES", False) or "1"),
+            horizon_tiers=horizon_tiers
+        )
+
+    def tiers_of(self, pair: CalendarPair) -> List[HorizonTier]:
+        """Get the horizon tiers of a pair, empty if it syncs its whole window every cycle."""
+        return pair.horizon_tiers if pair.horizon_tiers is not None else self.horizon_tiers
+
+    def state_path(self, name: str) -> str:
+        """Get the path of a file in the persistent state directory."""
+        return os.path.join(self.state_dir, name) 
+
+
+class EnvFile:
+    """A .env file applied to the process environment, reapplied when it changes.
+
+    Its values override the environment. Keys removed from the file get
+    back the value they had before the file was first applied.
+    """
+
+    def __init__(self, path: str):
+        """Initialize for a file; nothing is applied yet."""
+        self.path = path
+        # Environment values of the keys set from the file, before they were set
+        self._original: Dict[str, Optional[str]] = {}
+        self._stamp: Optional[tuple] = None
+
+    def _current_stamp(self) -> Optional[tuple]:
+        """Get the modification time and size of the file, None if it is missing."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def changed(self) -> bool:
+        """Check whether the file changed since it was last applied."""
+        return self._current_stamp() != self._stamp
+
+    def apply(self) -> None:
+        """Apply the current contents of the file to the environment."""
+        # Taken before reading, so that an edit made meanwhile is seen next time
+        self._stamp = self._current_stamp()
+        values = {key: value for key, value in dotenv_values(self.path).items() if value is not None}
+        logger.debug("Environment variables found:")
+        for key in [key for key in self._original if key not in values]:
+            original = self._original.pop(key)
+            if original is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = original
+        for key, value in values.items():
+            logger.debug("  %s: %s", key, redact(key, value))
+            self._original.setdefault(key, os.environ.get(key))
+            os.environ[key] = value
+
+
+def load_accounts(path: str) -> Dict[str, Config]:
+    """Load the configurations of several accounts from a JSON file.
+
+    The file holds a ``defaults`` object and an ``accounts`` list. Both use
+    the same keys as the environment variables; each account needs a unique
+    ``name`` and inherits every key it does not set from ``defaults``.
+    Unless set explicitly, every account keeps its state and Google token
+    in its own subdirectory of the default state directory.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            document = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"Failed to read accounts file {path}: {e}")
+
+    defaults = document.get("defaults", {})
+    accounts: Dict[str, Config] = {}
+    for entry in document.get("accounts", []):
+        name = entry.get("name")
+        if not name:
+            raise ValueError("Every account needs a name")
+        if name in accounts:
+            raise ValueError(f"Duplicate account name: {name}")
+        values = {**defaults, **entry}
+        if "STATE_DIR" not in entry:
+            values["STATE_DIR"] = os.path.join(values.get("STATE_DIR", ".r2-sync"), name)
+        if "GOOGLE_TOKEN_FILE" not in entry:
+            values["GOOGLE_TOKEN_FILE"] = os.path.join(values["STATE_DIR"], "google_token.pickle")
+        try:
+            accounts[name] = Config.from_mapping(values)
+        except ValueError as e:
+            raise ValueError(f"Invalid configuration for account {name}: {e}")
+    if not accounts:
+        raise ValueError(f"No accounts configured in {path}")
+    return accounts
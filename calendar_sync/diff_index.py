@@ -0,0 +1,186 @@
+"""Index of source and target events used to compute sync differences.
+
+The index keeps events in dictionaries until it holds more than a
+configurable number of them and then moves everything into a temporary
+SQLite database, so the memory needed to diff two calendars stays bounded
+no matter how large they are. Differences are read back as iterators.
+"""
+
+import logging
+import os
+import pickle
+import sqlite3
+import tempfile
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from .event_index import EventIndex, UidInterner
+from .events import CalendarEvent
+
+logger = logging.getLogger(__name__)
+
+SOURCE = 0
+TARGET = 1
+
+# Rows fetched from SQLite at a time while iterating
+FETCH_SIZE = 500
+
+
+class DiffIndex:
+    """Events of both sides of a calendar pair, keyed by UID.
+
+    As with a dictionary, a later event replaces an earlier one with the
+    same UID on the same side. Callers may key events by something else,
+    such as UID and start for occurrences; sides are then matched by key.
+    """
+
+    def __init__(self, spill_threshold: Optional[int] = None, spill_dir: Optional[str] = None):
+        """Initialize the index.
+
+        Args:
+            spill_threshold: Number of events after which the index moves to
+                disk; None keeps everything in memory.
+            spill_dir: Directory for the temporary database.
+        """
+        self.spill_threshold = spill_threshold
+        self.spill_dir = spill_dir
+        self._events: Tuple[Dict[str, CalendarEvent], Dict[str, CalendarEvent]] = ({}, {})
+        # Columnar views of both sides, built on first query
+        self._columns: Optional[Tuple[EventIndex, EventIndex]] = None
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_path: Optional[str] = None
+
+    def __enter__(self) -> "DiffIndex":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def spilled(self) -> bool:
+        """Whether the index lives on disk."""
+        return self._db is not None
+
+    def add(self, side: int, event: CalendarEvent, key: Optional[str] = None) -> None:
+        """Add an event to one side of the index, by default keyed by its UID."""
+        uid = str(event.uid) if key is None else key
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO events (side, uid, payload) VALUES (?, ?, ?)",
+                (side, uid, pickle.dumps(event, pickle.HIGHEST_PROTOCOL))
+            )
+            return
+        self._events[side][uid] = event
+        self._columns = None
+        if (self.spill_threshold is not None
+                and len(self._events[SOURCE]) + len(self._events[TARGET]) > self.spill_threshold):
+            self._spill()
+
+    def add_all(
+        self,
+        side: int,
+        events: Iterable[CalendarEvent],
+        key: Optional[Callable[[CalendarEvent], str]] = None
+    ) -> int:
+        """Add every event of an iterable to one side; returns how many."""
+        count = 0
+        for event in events:
+            self.add(side, event, None if key is None else key(event))
+            count += 1
+        return count
+
+    def _spill(self) -> None:
+        """Move all events into a temporary SQLite database."""
+        fd, self._db_path = tempfile.mkstemp(prefix="calendar-sync-", suffix=".db", dir=self.spill_dir)
+        os.close(fd)
+        self._db = sqlite3.connect(self._db_path)
+        self._db.execute("PRAGMA journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute(
+            "CREATE TABLE events (side INTEGER, uid TEXT, payload BLOB, "
+            "PRIMARY KEY (side, uid)) WITHOUT ROWID"
+        )
+        logger.info(
+            "Event index exceeded %d events, moving it to %s",
+            self.spill_threshold, self._db_path
+        )
+        events, self._events = self._events, ({}, {})
+        for side in (SOURCE, TARGET):
+            for uid, event in events[side].items():
+                self.add(side, event, uid)
+
+    def _columnar(self) -> Tuple[EventIndex, EventIndex]:
+        """Get columnar indexes of both sides of the in-memory index."""
+        if self._columns is None:
+            interner = UidInterner()
+            self._columns = (
+                EventIndex(self._events[SOURCE].values(), interner, self._events[SOURCE].keys()),
+                EventIndex(self._events[TARGET].values(), interner, self._events[TARGET].keys()),
+            )
+        return self._columns
+
+    def _query(self, sql: str, parameters: Tuple = ()) -> Iterator[Tuple]:
+        """Run a query and yield its rows in batches."""
+        cursor = self._db.execute(sql, parameters)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            yield from rows
+
+    def contains(self, side: int, uid: str) -> bool:
+        """Check whether a UID is present on one side."""
+        if self._db is None:
+            return str(uid) in self._events[side]
+        row = self._db.execute(
+            "SELECT 1 FROM events WHERE side = ? AND uid = ?", (side, str(uid))
+        ).fetchone()
+        return row is not None
+
+    def events(self, side: int) -> Iterator[CalendarEvent]:
+        """Iterate over the events of one side."""
+        if self._db is None:
+            yield from list(self._events[side].values())
+            return
+        for (payload,) in self._query("SELECT payload FROM events WHERE side = ? ORDER BY uid", (side,)):
+            yield pickle.loads(payload)
+
+    def only_in(self, side: int) -> Iterator[CalendarEvent]:
+        """Iterate over events of one side whose UID the other side lacks."""
+        other = 1 - side
+        if self._db is None:
+            columns = self._columnar()
+            yield from columns[side].only_in(columns[other])
+            return
+        for (payload,) in self._query(
+            "SELECT a.payload FROM events a WHERE a.side = ? AND NOT EXISTS "
+            "(SELECT 1 FROM events b WHERE b.side = ? AND b.uid = a.uid) ORDER BY a.uid",
+            (side, other)
+        ):
+            yield pickle.loads(payload)
+
+    def common(self) -> Iterator[Tuple[CalendarEvent, CalendarEvent]]:
+        """Iterate over (source, target) events with equal UID."""
+        if self._db is None:
+            source, target = self._columnar()
+            yield from source.common(target)
+            return
+        for source_payload, target_payload in self._query(
+            "SELECT a.payload, b.payload FROM events a JOIN events b "
+            "ON b.side = ? AND b.uid = a.uid WHERE a.side = ? ORDER BY a.uid",
+            (TARGET, SOURCE)
+        ):
+            yield pickle.loads(source_payload), pickle.loads(target_payload)
+
+    def close(self) -> None:
+        """Release memory and delete the temporary database."""
+        self._events = ({}, {})
+        self._columns = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        if self._db_path is not None:
+            try:
+                os.unlink(self._db_path)
+            except OSError:
+                pass
+            self._db_path = None
@@ -0,0 +1,177 @@
+"""Columnar index of calendar events for interval and membership queries.
+
+Start and end times are kept as arrays of epoch seconds and UIDs as
+integer codes, so interval and membership queries run as vectorised NumPy
+operations. NumPy is optional (``pip install r2-sync[fast]``) and imported
+when the first index is built; without it the same queries run as plain
+Python loops.
+"""
+
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from types import ModuleType
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .events import CalendarEvent, as_utc
+
+
+@lru_cache(maxsize=None)
+def _numpy() -> Optional[ModuleType]:
+    """Import NumPy on first use; None if it is not installed."""
+    try:
+        import numpy
+    except ImportError:  # pragma: no cover - depends on the installed extras
+        return None
+    return numpy
+
+
+class UidInterner:
+    """Assigns every distinct UID a small integer code.
+
+    Indexes that are compared with each other must share an interner.
+    """
+
+    def __init__(self):
+        """Initialize an empty interner."""
+        self.codes: Dict[str, int] = {}
+
+    def code(self, uid: str) -> int:
+        """Get the code of a UID, assigning a new one if needed."""
+        return self.codes.setdefault(str(uid), len(self.codes))
+
+
+def _epoch(value: datetime) -> int:
+    """Convert a datetime to epoch seconds, treating naive values as UTC."""
+    return int(as_utc(value).timestamp())
+
+
+def _from_epoch(value: int) -> datetime:
+    """Convert epoch seconds to an aware UTC datetime."""
+    return datetime.fromtimestamp(int(value), timezone.utc)
+
+
+class EventIndex:
+    """Read-only columns of a list of events.
+
+    Events without a start or end time take part in UID queries only.
+    """
+
+    def __init__(
+        self,
+        events: Iterable[CalendarEvent],
+        interner: Optional[UidInterner] = None,
+        keys: Optional[Iterable[str]] = None
+    ):
+        """Build the index; UID queries match ``keys`` if given, else the UIDs."""
+        self.interner = interner or UidInterner()
+        self.events: List[CalendarEvent] = list(events)
+        timed = [event.start is not None and event.end is not None for event in self.events]
+        # Untimed events get an empty interval that overlaps nothing
+        starts = [_epoch(event.start) if ok else 0 for event, ok in zip(self.events, timed)]
+        ends = [_epoch(event.end) if ok else 0 for event, ok in zip(self.events, timed)]
+        all_day = [event.is_all_day for event in self.events]
+        if keys is None:
+            keys = (event.uid for event in self.events)
+        uids = [self.interner.code(key) for key in keys]
+        # Queries use the same kind of columns the index was built with
+        self._np = np = _numpy()
+        if np is not None:
+            self.timed = np.array(timed, dtype=bool)
+            self.starts = np.array(starts, dtype=np.int64)
+            self.ends = np.array(ends, dtype=np.int64)
+            self.all_day = np.array(all_day, dtype=bool)
+            self.uids = np.array(uids, dtype=np.int64)
+        else:
+            self.timed, self.starts, self.ends, self.all_day = timed, starts, ends, all_day
+            self.uids = uids
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def _select(self, positions: Sequence[int]) -> List[CalendarEvent]:
+        """Get the events at the given positions."""
+        return [self.events[i] for i in positions]
+
+    def isin(self, other: "EventIndex") -> Sequence[bool]:
+        """Get whether the UID of each event also occurs in another index."""
+        np = self._np
+        if np is not None:
+            return np.isin(self.uids, other.uids)
+        theirs = set(other.uids)
+        return [uid in theirs for uid in self.uids]
+
+    def only_in(self, other: "EventIndex") -> List[CalendarEvent]:
+        """Get the events whose UID does not occur in another index."""
+        present = self.isin(other)
+        if self._np is not None:
+            return self._select(self._np.flatnonzero(~present))
+        return self._select([i for i, found in enumerate(present) if not found])
+
+    def common(self, other: "EventIndex") -> List[Tuple[CalendarEvent, CalendarEvent]]:
+        """Get (own, other) events with equal UID, ordered by UID code."""
+        return [(self.events[i], other.events[j]) for i, j in self._matches(other)]
+
+    def _matches(self, other: "EventIndex") -> Iterable[Tuple[int, int]]:
+        """Get the positions of events with equal UID in both indexes.
+
+        If a UID occurs more than once on a side, its last event is used,
+        as a dictionary keyed by UID would.
+        """
+        np = self._np
+        if np is not None:
+            mine = _last_positions(np, self.uids)
+            theirs = _last_positions(np, other.uids)
+            _, i, j = np.intersect1d(self.uids[mine], other.uids[theirs], return_indices=True)
+            return zip(mine[i].tolist(), theirs[j].tolist())
+        theirs_by_uid = {uid: j for j, uid in enumerate(other.uids)}
+        mine_by_uid = {uid: i for i, uid in enumerate(self.uids)}
+        return [
+            (i, theirs_by_uid[uid]) for uid, i in sorted(mine_by_uid.items()) if uid in theirs_by_uid
+        ]
+
+    def merged_intervals(self, gap: timedelta = timedelta(0)) -> List[Tuple[bool, datetime, datetime]]:
+        """Merge overlapping or adjacent events into (is_all_day, start, end) blocks.
+
+        Events less than ``gap`` apart are merged too; all-day and timed
+        events are merged separately. Bounds are aware UTC datetimes.
+        """
+        gap_seconds = int(gap.total_seconds())
+        np = self._np
+        if np is None:
+            blocks: List[List] = []
+            rows = zip(self.timed, self.all_day, self.starts, self.ends)
+            for all_day, start, end in sorted(row[1:] for row in rows if row[0]):
+                if blocks and blocks[-1][0] == all_day and start <= blocks[-1][2] + gap_seconds:
+                    blocks[-1][2] = max(blocks[-1][2], end)
+                else:
+                    blocks.append([all_day, start, end])
+            return [(all_day, _from_epoch(start), _from_epoch(end)) for all_day, start, end in blocks]
+
+        timed = np.flatnonzero(self.timed)
+        if not len(timed):
+            return []
+        order = timed[np.lexsort((self.ends[timed], self.starts[timed], self.all_day[timed]))]
+        all_day = self.all_day[order]
+        starts = self.starts[order]
+        ends = self.ends[order]
+        # Latest end so far within each group of all-day or timed events
+        group_start = np.ones(len(order), dtype=bool)
+        group_start[1:] = all_day[1:] != all_day[:-1]
+        reach = ends.copy()
+        for group in np.split(np.arange(len(order)), np.flatnonzero(group_start)[1:]):
+            reach[group] = np.maximum.accumulate(ends[group])
+        new_block = group_start.copy()
+        new_block[1:] |= starts[1:] > reach[:-1] + gap_seconds
+        first = np.flatnonzero(new_block)
+        last = np.append(first[1:] - 1, len(order) - 1)
+        return [
+            (bool(all_day[f]), _from_epoch(starts[f]), _from_epoch(reach[l]))
+            for f, l in zip(first.tolist(), last.tolist())
+        ]
+
+
+def _last_positions(np: ModuleType, codes: "np.ndarray") -> "np.ndarray":
+    """Get the position of the last occurrence of every distinct code."""
+    reversed_codes = codes[::-1]
+    _, first_in_reversed = np.unique(reversed_codes, return_index=True)
+    return len(codes) - 1 - first_in_reversed
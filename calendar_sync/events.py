@@ -0,0 +1,162 @@
+"""Backend independent representation of calendar events."""
+
+import hashlib
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+
+def as_utc(value: datetime) -> datetime:
+    """Convert a datetime to UTC, treating naive values as UTC."""
+    if value.tzinfo is None or value.utcoffset() is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def normalize_email(address: Any) -> Optional[str]:
+    """Get the lowercase email of an address such as ``mailto:Jane@example.com``."""
+    if address is None:
+        return None
+    value = str(address).strip()
+    if value.lower().startswith("mailto:"):
+        value = value[len("mailto:"):]
+    return value.lower() or None
+
+
+@dataclass
+class CalendarEvent:
+    """Representation of a calendar event."""
+    uid: str
+    summary: str
+    start: datetime
+    end: datetime
+    description: Optional[str] = None
+    location: Optional[str] = None
+    recurrence: Optional[str] = None
+    is_all_day: bool = False
+    ical_data: str = ""
+    last_modified: Optional[datetime] = None
+    sequence: int = 0
+    # Email address of the organizer of a meeting, if known
+    organizer: Optional[str] = None
+    
+    def __getitem__(self, key: str) -> any:
+        """Support dictionary-style access for backward compatibility."""
+        if hasattr(self, key):
+            return getattr(self, key)
+        raise KeyError(f"'{self.__class__.__name__}' object has no attribute '{key}'")
+    
+    def __setitem__(self, key: str, value: any) -> None:
+        """Support dictionary-style access for backward compatibility."""
+        if hasattr(self, key):
+            setattr(self, key, value)
+        else:
+            raise KeyError(f"'{self.__class__.__name__}' object has no attribute '{key}'")
+            
+    def content_hash(self) -> str:
+        """Get a hash of the fields compared between synced calendars."""
+        def normalize(value: Optional[datetime]) -> str:
+            if value is None:
+                return ""
+            if value.tzinfo is not None and value.utcoffset() is not None:
+                value = value.astimezone(timezone.utc)
+            return value.isoformat()
+
+        fields = (
+            self.summary, normalize(self.start), normalize(self.end),
+            self.description, self.location, self.is_all_day
+        )
+        digest = hashlib.sha1()
+        for value in fields:
+            digest.update(("" if value is None else str(value)).encode('utf-8'))
+            digest.update(b"\x1f")
+        return digest.hexdigest()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get a JSON-serializable copy of the event, without its iCalendar data."""
+        data = asdict(self)
+        data.pop('ical_data')
+        for key in ('start', 'end', 'last_modified'):
+            if data[key] is not None:
+                data[key] = data[key].isoformat()
+        for key in ('uid', 'summary', 'description', 'location', 'recurrence', 'organizer'):
+            if data[key] is not None and not isinstance(data[key], str):
+                # icalendar values, e.g. vRecur
+                data[key] = data[key].to_ical().decode('utf-8') if hasattr(data[key], 'to_ical') else str(data[key])
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CalendarEvent":
+        """Create a CalendarEvent from the output of to_dict."""
+        data = dict(data)
+        for key in ('start', 'end', 'last_modified'):
+            if data.get(key) is not None:
+                data[key] = datetime.fromisoformat(data[key])
+        if data.get('recurrence'):
+            from icalendar import vRecur
+            data['recurrence'] = vRecur.from_ical(data['recurrence'])
+        return cls(**data)
+
+    def version(self) -> Tuple[int, float]:
+        """Get a sortable version: the SEQUENCE, then the modification time."""
+        if self.last_modified is None:
+            return self.sequence, 0.0
+        return self.sequence, as_utc(self.last_modified).timestamp()
+
+    @classmethod
+    def from_ical(cls, ical_data: str) -> "CalendarEvent":
+        """Create a CalendarEvent from the first VEVENT of iCalendar data."""
+        for event in cls.iter_from_ical(ical_data):
+            return event
+        raise ValueError("No VEVENT component found in iCalendar data")
+
+    @classmethod
+    def iter_from_ical(cls, ical_data: str) -> Iterator["CalendarEvent"]:
+        """Create a CalendarEvent from every VEVENT of iCalendar data."""
+        # Imported here so that loading the package stays cheap
+        from icalendar import Calendar
+
+        cal = Calendar.from_ical(ical_data)
+        for component in cal.walk():
+            if component.name == "VEVENT":
+                yield cls._from_component(component, ical_data)
+
+    @classmethod
+    def _from_component(cls, event: Any, ical_data: str) -> "CalendarEvent":
+        """Create a CalendarEvent from a parsed VEVENT component."""
+        # Handle both datetime and date objects
+        start = event.get('dtstart').dt
+        if event.get('dtend') is not None:
+            end = event.get('dtend').dt
+        elif event.get('duration') is not None:
+            end = start + event.get('duration').dt
+        else:
+            # Without DTEND or DURATION an event lasts one day, or no time if it has a start time
+            end = start if isinstance(start, datetime) else start + timedelta(days=1)
+        
+        # Check if this is an all-day event (date objects instead of datetime)
+        is_all_day = not isinstance(start, datetime)
+        
+        # For all-day events, keep the date but set time to midnight
+        if is_all_day:
+            start = datetime.combine(start, datetime.min.time())
+            end = datetime.combine(end, datetime.min.time())
+        
+        # DTSTAMP is the modification time when LAST-MODIFIED is missing
+        modified = event.get('last-modified') or event.get('dtstamp')
+        organizer = event.get('organizer')
+        
+        return cls(
+            uid=event.get('uid'),
+            summary=event.get('summary'),
+            start=start,
+            end=end,
+            description=event.get('description'),
+            location=event.get('location'),
+            recurrence=event.get('rrule'),
+            is_all_day=is_all_day,
+            ical_data=ical_data,
+            last_modified=modified.dt if modified is not None else None,
+            sequence=int(event.get('sequence', 0)),
+            organizer=normalize_email(organizer)
+        )
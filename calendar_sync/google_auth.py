@@ -0,0 +1,160 @@
+"""Process-wide cache of Google credentials and Calendar API services.
+
+Credentials are loaded from the token file once per process and shared
+by every client using that file. A background thread refreshes them
+REFRESH_MARGIN seconds before they expire, so requests never wait for an
+OAuth round trip; google-auth would otherwise refresh them on the request
+path once they are about to expire. Services are built once per token
+file and thread, since the httplib2 connection of a service must not be
+used by two threads at a time, from a discovery document that is read
+once per process and kept in ``STATE_DIR``.
+"""
+
+import datetime
+import logging
+import os
+import pickle
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from google.auth.transport.requests import Request
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import DISCOVERY_URI, build_from_document
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ['https://www.googleapis.com/auth/calendar']
+# Seconds before expiry at which tokens are refreshed in the background
+REFRESH_MARGIN = 600
+# Seconds before a failed background refresh is retried
+RETRY_INTERVAL = 60
+
+_lock = threading.Lock()
+_document: Optional[str] = None
+_credentials: Dict[str, Any] = {}
+_refreshers: Dict[str, "TokenRefresher"] = {}
+_services: Dict[Tuple[str, int], Any] = {}
+
+
+def discovery_document(cache_path: Optional[str] = None) -> str:
+    """Get the discovery document of the Calendar API.
+
+    The copy bundled with googleapiclient is used if there is one; otherwise
+    it is downloaded once and kept in ``cache_path``.
+    """
+    global _document
+    with _lock:
+        if _document is not None:
+            return _document
+        from googleapiclient import discovery_cache
+        document = discovery_cache.get_static_doc('calendar', 'v3')
+        if document is None and cache_path and os.path.exists(cache_path):
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                document = f.read()
+        if document is None:
+            import httplib2
+            url = DISCOVERY_URI.format(api='calendar', apiVersion='v3')
+            response, content = httplib2.Http().request(url)
+            if response.status >= 400:
+                raise RuntimeError(f"Failed to fetch the Calendar API discovery document: HTTP {response.status}")
+            document = content.decode('utf-8')
+            if cache_path:
+                directory = os.path.dirname(cache_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(cache_path, 'w', encoding='utf-8') as f:
+                    f.write(document)
+        _document = document
+        return document
+
+
+def _save(token_file: str, creds: Any) -> None:
+    """Write credentials to their token file."""
+    with open(token_file, 'wb') as token:
+        pickle.dump(creds, token)
+
+
+def get_credentials(credentials_file: str, token_file: str) -> Any:
+    """Get the credentials stored in a token file, authorizing if there are none.
+
+    Loaded once per process; refreshed in the background from then on.
+    """
+    with _lock:
+        creds = _credentials.get(token_file)
+        if creds is None:
+            if os.path.exists(token_file):
+                with open(token_file, 'rb') as token:
+                    creds = pickle.load(token)
+            if not creds or not creds.valid:
+                if creds and creds.expired and creds.refresh_token:
+                    creds.refresh(Request())
+                else:
+                    flow = InstalledAppFlow.from_client_secrets_file(credentials_file, SCOPES)
+                    creds = flow.run_local_server(port=0)
+                _save(token_file, creds)
+            _credentials[token_file] = creds
+        if creds.refresh_token and token_file not in _refreshers:
+            _refreshers[token_file] = TokenRefresher(token_file, creds)
+            _refreshers[token_file].start()
+    return creds
+
+
+def get_service(credentials_file: str, token_file: str, cache_path: Optional[str] = None) -> Any:
+    """Get the Calendar API service of a token file for the calling thread."""
+    creds = get_credentials(credentials_file, token_file)
+    key = (token_file, threading.get_ident())
+    with _lock:
+        service = _services.get(key)
+    if service is None:
+        service = build_from_document(discovery_document(cache_path), credentials=creds)
+        with _lock:
+            service = _services.setdefault(key, service)
+    return service
+
+
+def build_service(http: Any, cache_path: Optional[str] = None) -> Any:
+    """Build a Calendar API service on a given connection, without caching it."""
+    return build_from_document(discovery_document(cache_path), http=http)
+
+
+def seconds_until_refresh(creds: Any) -> float:
+    """Get the seconds until credentials should be refreshed."""
+    if creds.expiry is None:
+        return RETRY_INTERVAL
+    expiry = creds.expiry
+    if expiry.tzinfo is None:
+        # google-auth keeps expiry times as naive UTC
+        expiry = expiry.replace(tzinfo=datetime.timezone.utc)
+    remaining = (expiry - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+    return max(remaining - REFRESH_MARGIN, 0.0)
+
+
+class TokenRefresher(threading.Thread):
+    """Refreshes the credentials of a token file shortly before they expire."""
+
+    def __init__(self, token_file: str, creds: Any):
+        """Initialize the refresher thread; it runs until the process exits."""
+        super().__init__(name=f"google-token-refresh-{os.path.basename(token_file)}", daemon=True)
+        self.token_file = token_file
+        self.creds = creds
+        self.refreshes = 0
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        """Sleep until the token is about to expire, then refresh it."""
+        delay = seconds_until_refresh(self.creds)
+        while not self._stopped.wait(delay):
+            try:
+                self.creds.refresh(Request())
+                _save(self.token_file, self.creds)
+                self.refreshes += 1
+                logger.debug("Refreshed the Google token of %s, valid until %s",
+                             self.token_file, self.creds.expiry)
+                delay = max(seconds_until_refresh(self.creds), RETRY_INTERVAL)
+            except Exception as e:
+                logger.warning("Failed to refresh the Google token of %s: %s", self.token_file, e)
+                delay = RETRY_INTERVAL
+
+    def stop(self) -> None:
+        """Stop refreshing."""
+        self._stopped.set()
@@ -1,41 +1,134 @@
-import os
-import pickle
 import re
 import datetime
 import logging
-from typing import Optional
+import threading
+from typing import Dict, Iterator, List, Optional, Set
 
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+import google_auth_httplib2
+import httplib2
+from googleapiclient.errors import HttpError
 
-# Import CalendarEvent from our existing caldav_client module
-from .caldav_client import CalendarEvent
+# Import CalendarEvent from our backend independent events module
+from .events import CalendarEvent, as_utc, normalize_email
+from .google_auth import build_service, get_credentials, get_service
+from .slicing import fetch_sliced
+from .state import JsonStore
+from .tracing import current_span, span, traced
 
-SCOPES = ['https://www.googleapis.com/auth/calendar']
+logger = logging.getLogger(__name__)
+
+# Prefix of the id cache keys holding the ids of recurring series
+SERIES_PREFIX = "series:"
 
 class GoogleCalendarClient:
-    def __init__(self, credentials_file='client_secret_571324167090-i9l373a0pn3amp4r055c7rfd5ool4bss.apps.googleusercontent.com.json', token_file='google_token.pickle'):
+    def __init__(self, credentials_file='client_secret_571324167090-i9l373a0pn3amp4r055c7rfd5ool4bss.apps.googleusercontent.com.json', token_file='google_token.pickle', id_cache: Optional[JsonStore] = None, slice_days: int = 0, concurrency: int = 4, transport=None, discovery_cache: Optional[str] = None):
         self.credentials_file = credentials_file
         self.token_file = token_file
+        # list_events fetches windows longer than slice_days in parallel slices
+        self.slice_days = slice_days
+        self.concurrency = concurrency
+        # Records or replays the HTTP exchanges of the client
+        self.transport = transport
+        # Where the API discovery document is kept if the library has no copy
+        self.discovery_cache = discovery_cache
+        self.credentials = None
+        # httplib2 connections must not be shared between threads
+        self._owner_thread = threading.get_ident()
+        self._local = threading.local()
+        # Google event ids by calendar and event UID, learned from list and
+        # insert responses and persisted in id_cache if given
+        self.id_cache = id_cache
+        self._event_ids: Dict[str, Dict[str, str]] = {}
+        # Ids of the recurring series listed events are instances of, by
+        # calendar and event UID, persisted under SERIES_PREFIX + calendar
+        self._series_ids: Dict[str, Dict[str, str]] = {}
+        # UIDs listed or created since the ids were last saved, by calendar
+        self._seen_uids: Dict[str, Set[str]] = {}
         self.service = self.get_service()
 
     def get_service(self):
-        creds = None
-        if os.path.exists(self.token_file):
-            with open(self.token_file, 'rb') as token:
-                creds = pickle.load(token)
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
+        with span("google.auth", backend="google"):
+            return self._build_service()
+
+    def _build_service(self):
+        if self.transport is not None and self.transport.replaying:
+            # Answered from a cassette, so no credentials are needed
+            return build_service(self.transport.wrap_http(None), self.discovery_cache)
+        self.credentials = get_credentials(self.credentials_file, self.token_file)
+        if self.transport is not None:
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http())
+            return build_service(self.transport.wrap_http(http), self.discovery_cache)
+        # Shared by the clients of this token file on the same thread
+        return get_service(self.credentials_file, self.token_file, self.discovery_cache)
+
+    def _http(self) -> Optional[google_auth_httplib2.AuthorizedHttp]:
+        """Get the HTTP connection for requests made by the current thread.
+
+        Returns None on the thread that built the service, which then uses
+        the connection of the service.
+        """
+        if threading.get_ident() == self._owner_thread:
+            return None
+        if getattr(self._local, 'http', None) is None:
+            if self.transport is not None and self.transport.replaying:
+                self._local.http = self.transport.wrap_http(None)
             else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    self.credentials_file, SCOPES)
-                creds = flow.run_local_server(port=0)
-            with open(self.token_file, 'wb') as token:
-                pickle.dump(creds, token)
-        service = build('calendar', 'v3', credentials=creds)
-        return service
+                http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http())
+                self._local.http = self.transport.wrap_http(http) if self.transport is not None else http
+        return self._local.http
+
+    def _cached_ids(self, maps: Dict[str, Dict[str, str]], key: str) -> Dict[str, str]:
+        """Get a map of event ids, loading it from the id cache on first use."""
+        if key not in maps:
+            cached = self.id_cache.get(key) if self.id_cache is not None else None
+            maps[key] = dict(cached or {})
+        return maps[key]
+
+    def _ids(self, calendar_id: str) -> Dict[str, str]:
+        """Get the known event ids of a calendar by event UID."""
+        return self._cached_ids(self._event_ids, calendar_id)
+
+    def _series(self, calendar_id: str) -> Dict[str, str]:
+        """Get the ids of the recurring series of a calendar by event UID."""
+        return self._cached_ids(self._series_ids, SERIES_PREFIX + calendar_id)
+
+    def _remember_id(self, calendar_id: str, uid: str, event: dict) -> None:
+        """Learn the id of an event from a list or insert response.
+
+        Instances of a recurring event listed one by one share the UID of
+        the series. Updates target the instance, so a diverged instance
+        does not overwrite the series; deletes target the whole series.
+        """
+        self._ids(calendar_id)[uid] = event.get('id')
+        if event.get('recurringEventId'):
+            self._series(calendar_id)[uid] = event['recurringEventId']
+        self._seen_uids.setdefault(calendar_id, set()).add(uid)
+
+    def _forget_id(self, calendar_id: str, uid: str) -> None:
+        """Forget the ids of a deleted event."""
+        self._ids(calendar_id).pop(uid, None)
+        self._series(calendar_id).pop(uid, None)
+
+    def save_event_ids(self) -> None:
+        """Persist the known event ids.
+
+        Events are listed before they are updated or deleted, so of a
+        calendar read since the last save only the ids seen since are kept;
+        the others, such as those of deleted events, would only grow the
+        cache. Calendars not read keep their ids for writes still pending.
+        """
+        if self.id_cache is None:
+            return
+        maps = [(calendar_id, calendar_id, ids) for calendar_id, ids in self._event_ids.items()]
+        maps += [(key[len(SERIES_PREFIX):], key, ids) for key, ids in self._series_ids.items()]
+        for calendar_id, key, ids in maps:
+            if calendar_id in self._seen_uids:
+                seen = self._seen_uids[calendar_id]
+                for uid in [uid for uid in ids if uid not in seen]:
+                    del ids[uid]
+            self.id_cache.set(key, dict(ids))
+        self._seen_uids = {}
+        self.id_cache.save()
 
     def _sanitize_event_id(self, uid: str) -> str:
         # Google event id must be between 5 and 1024 characters, and may contain only lowercase letters, digits, hyphens, and underscores.
@@ -45,8 +138,6 @@ class GoogleCalendarClient:
         return sanitized
 
     def _convert_event_to_body(self, event: CalendarEvent, include_id: bool = False) -> dict:
-        logger = logging.getLogger(__name__)
-        logger.debug("[GoogleCalendarClient] Converting event to body. UID: %s, Start: %s (%s), End: %s (%s)", event.uid, event.start, type(event.start), event.end, type(event.end))
         if event.start is None or event.end is None:
             raise ValueError("Event missing start or end time")
         body = {
@@ -56,7 +147,8 @@ class GoogleCalendarClient:
         }
         if include_id:
             body['id'] = self._sanitize_event_id(event.uid)
-            body['iCalUID'] = event.uid
+        # Keeps the UID, so the event can be found by it, e.g. after a crash
+        body['iCalUID'] = event.uid
 
         if event.is_all_day:
             body['start'] = {'date': event.start.date().isoformat()}
@@ -91,102 +183,210 @@ class GoogleCalendarClient:
 
         return body
 
-    def list_events(self, calendar_id: str, start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None) -> list:
+    def _parse_event(self, e: dict) -> Optional[CalendarEvent]:
+        """Convert an event resource of the API into a CalendarEvent."""
+        start_info = e.get('start', {})
+        end_info = e.get('end', {})
+        start_str = start_info.get('dateTime') if 'dateTime' in start_info else start_info.get('date')
+        end_str = end_info.get('dateTime') if 'dateTime' in end_info else end_info.get('date')
+        try:
+            if 'dateTime' in start_info:
+                start_dt = datetime.datetime.fromisoformat(start_str.replace('Z','+00:00'))
+                end_dt = datetime.datetime.fromisoformat(end_str.replace('Z','+00:00'))
+                is_all_day = False
+            else:
+                start_dt = datetime.datetime.fromisoformat(start_str)
+                end_dt = datetime.datetime.fromisoformat(end_str)
+                is_all_day = True
+        except Exception:
+            return None
+        # Retrieve extendedProperties if set for privacy events
+        ext = e.get('extendedProperties', {}).get('private', {}).get('source_uid')
+        if ext:
+            final_uid = "PRIVACY-SYNC-" + ext
+        else:
+            final_uid = e.get('iCalUID', e.get('id'))
+        updated = e.get('updated')
+        organizer = e.get('organizer', {})
+        ce = CalendarEvent(
+            uid = final_uid,
+            summary = e.get('summary', ''),
+            start = start_dt,
+            end = end_dt,
+            description = e.get('description'),
+            location = e.get('location'),
+            recurrence = None,  # Recurrence handling can be expanded if needed
+            is_all_day = is_all_day,
+            ical_data = '',
+            last_modified = datetime.datetime.fromisoformat(updated.replace('Z','+00:00')) if updated else None,
+            sequence = e.get('sequence', 0),
+            # Google is the organizer of events created through the API
+            organizer = None if organizer.get('self') else normalize_email(organizer.get('email'))
+        )
+        return ce
+
+    def fetch_sync_state(self, calendar_id: str) -> Dict[str, Optional[str]]:
+        """Fetch the etag of the event collection, which changes with every event."""
+        with span("google.fetch", backend="google", calendar=calendar_id, operation="etag"):
+            result = self.service.events().list(
+                calendarId=calendar_id, maxResults=1, fields='etag'
+            ).execute()
+        return {'ctag': result.get('etag'), 'sync_token': None}
+
+    def _fetch_pages(self, calendar_id: str, start: Optional[datetime.datetime], end: Optional[datetime.datetime], page_size: int = 250):
+        """Yield the raw event resources of a time range one page at a time."""
         if start is None:
             start = datetime.datetime.utcnow()
         if end is None:
             end = start + datetime.timedelta(days=30)
 
-        time_min = start.isoformat() + 'Z'
-        time_max = end.isoformat() + 'Z'
+        # Naive times are UTC
+        time_min = as_utc(start).replace(tzinfo=None).isoformat() + 'Z'
+        time_max = as_utc(end).replace(tzinfo=None).isoformat() + 'Z'
 
-        events_result = self.service.events().list(calendarId=calendar_id,
-                                                     timeMin=time_min,
-                                                     timeMax=time_max,
-                                                     singleEvents=True,
-                                                     orderBy='startTime').execute()
-        events = events_result.get('items', [])
-        list_of_events = []
-        for e in events:
-            start_info = e.get('start', {})
-            end_info = e.get('end', {})
-            start_str = start_info.get('dateTime') if 'dateTime' in start_info else start_info.get('date')
-            end_str = end_info.get('dateTime') if 'dateTime' in end_info else end_info.get('date')
-            try:
-                if 'dateTime' in start_info:
-                    start_dt = datetime.datetime.fromisoformat(start_str.replace('Z','+00:00'))
-                    end_dt = datetime.datetime.fromisoformat(end_str.replace('Z','+00:00'))
-                    is_all_day = False
-                else:
-                    start_dt = datetime.datetime.fromisoformat(start_str)
-                    end_dt = datetime.datetime.fromisoformat(end_str)
-                    is_all_day = True
-            except Exception:
-                continue
-            # Retrieve extendedProperties if set for privacy events
-            ext = e.get('extendedProperties', {}).get('private', {}).get('source_uid')
-            if ext:
-                final_uid = "PRIVACY-SYNC-" + ext
-            else:
-                final_uid = e.get('iCalUID', e.get('id'))
-            ce = CalendarEvent(
-                uid = final_uid,
-                summary = e.get('summary', ''),
-                start = start_dt,
-                end = end_dt,
-                description = e.get('description'),
-                location = e.get('location'),
-                recurrence = None,  # Recurrence handling can be expanded if needed
-                is_all_day = is_all_day,
-                ical_data = ''
+        page_token = None
+        while True:
+            with span("google.fetch", backend="google", calendar=calendar_id) as fetch_span:
+                events_result = self.service.events().list(calendarId=calendar_id,
+                                                             timeMin=time_min,
+                                                             timeMax=time_max,
+                                                             singleEvents=True,
+                                                             orderBy='startTime',
+                                                             maxResults=page_size,
+                                                             pageToken=page_token).execute(http=self._http())
+                fetch_span.set_attribute("events", len(events_result.get('items', [])))
+            yield events_result.get('items', [])
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                break
+
+    @traced("google.list_events", backend="google", operation="list")
+    def list_events(self, calendar_id: str, start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None) -> list:
+        if start is None:
+            start = datetime.datetime.utcnow()
+        if end is None:
+            end = start + datetime.timedelta(days=30)
+        if self.slice_days and end - start > datetime.timedelta(days=self.slice_days):
+            list_of_events = fetch_sliced(
+                lambda slice_start, slice_end: self._list_window(calendar_id, slice_start, slice_end),
+                start, end, datetime.timedelta(days=self.slice_days), self.concurrency
             )
-            list_of_events.append(ce)
+        else:
+            list_of_events = self._list_window(calendar_id, start, end)
+        current_span().set_attribute("events", len(list_of_events))
+        return list_of_events
+
+    def _list_window(self, calendar_id: str, start: datetime.datetime, end: datetime.datetime) -> list:
+        """Fetch and parse the events of a time range."""
+        events = [e for page in self._fetch_pages(calendar_id, start, end) for e in page]
+        list_of_events = []
+        with span("google.parse", backend="google", calendar=calendar_id) as parse_span:
+            for e in events:
+                ce = self._parse_event(e)
+                if ce is not None:
+                    self._remember_id(calendar_id, ce.uid, e)
+                    list_of_events.append(ce)
+            parse_span.set_attribute("events", len(list_of_events))
         return list_of_events
 
+    def iter_events(self, calendar_id: str, start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None) -> Iterator[CalendarEvent]:
+        """Yield the events of a time range, keeping one page in memory."""
+        for page in self._fetch_pages(calendar_id, start, end):
+            for e in page:
+                ce = self._parse_event(e)
+                if ce is not None:
+                    self._remember_id(calendar_id, ce.uid, e)
+                    yield ce
+
+    @traced("google.write", backend="google", operation="create")
     def create_event(self, calendar_id: str, event: CalendarEvent) -> str:
-        logger = logging.getLogger(__name__)
         logger.debug("[GoogleCalendarClient] Creating event in Google Calendar. UID: %s, Start: %s, End: %s, All-day: %s", event.uid, event.start, event.end, event.is_all_day)
-        logger.debug("[GoogleCalendarClient] Event details: UID: %s, Start: %s (%s), End: %s (%s), All-day: %s", event.uid, event.start, type(event.start), event.end, type(event.end), event.is_all_day)
         try:
             # Do not include a custom id so Google generates a proper event id
             body = self._convert_event_to_body(event, include_id=False)
         except Exception as e:
             logger.error("[GoogleCalendarClient] Error converting event to body for UID %s. Details: Start: %s (%s), End: %s (%s). Exception: %s", event.uid, event.start, type(event.start), event.end, type(event.end), e)
             raise
-        created_event = self.service.events().insert(calendarId=calendar_id, body=body).execute()
+        created_event = self.service.events().insert(calendarId=calendar_id, body=body).execute(http=self._http())
+        self._remember_id(calendar_id, event.uid, created_event)
         logger.debug("[GoogleCalendarClient] Created event with ID: %s", created_event.get('id'))
         return created_event.get('id')
 
+    @traced("google.write", backend="google", operation="batch-create")
+    def create_events(self, calendar_id: str, events: List[CalendarEvent]) -> List[Optional[Exception]]:
+        """Create up to 50 events with one batch request.
+
+        Returns the error of every event, None for the ones created. Safe
+        to call from several threads at a time.
+        """
+        errors: List[Optional[Exception]] = [None] * len(events)
+
+        def created(request_id, response, exception):
+            index = int(request_id)
+            if exception is not None:
+                errors[index] = exception
+            else:
+                self._remember_id(calendar_id, events[index].uid, response)
+
+        batch = self.service.new_batch_http_request(callback=created)
+        for index, event in enumerate(events):
+            try:
+                body = self._convert_event_to_body(event, include_id=False)
+            except Exception as e:
+                errors[index] = e
+                continue
+            batch.add(self.service.events().insert(calendarId=calendar_id, body=body), request_id=str(index))
+        current_span().set_attribute("events", len(events))
+        batch.execute(http=self._http())
+        return errors
+
+    @traced("google.write", backend="google", operation="update")
     def update_event(self, calendar_id: str, event: CalendarEvent) -> None:
-        logger = logging.getLogger(__name__)
         logger.debug("[GoogleCalendarClient] Updating event in Google Calendar. UID: %s, Start: %s, End: %s, All-day: %s", event.uid, event.start, event.end, event.is_all_day)
-        logger.debug("[GoogleCalendarClient] Event details: UID: %s, Start: %s (%s), End: %s (%s), All-day: %s", event.uid, event.start, type(event.start), event.end, type(event.end), event.is_all_day)
         try:
-            event_id = self._sanitize_event_id(event.uid)
+            event_id = self._ids(calendar_id).get(event.uid) or self._sanitize_event_id(event.uid)
             body = self._convert_event_to_body(event, include_id=False)
         except Exception as e:
             logger.error("[GoogleCalendarClient] Error converting event to body for UID %s. Details: Start: %s (%s), End: %s (%s). Exception: %s", event.uid, event.start, type(event.start), event.end, type(event.end), e)
             raise
-        self.service.events().update(calendarId=calendar_id, eventId=event_id, body=body).execute()
+        # The UID of an event cannot change
+        del body['iCalUID']
+        # Patch leaves fields it does not mention alone, so clear them explicitly
+        body.setdefault('description', None)
+        body.setdefault('location', None)
+        self.service.events().patch(calendarId=calendar_id, eventId=event_id, body=body).execute()
         logger.debug("[GoogleCalendarClient] Updated event for UID: %s", event.uid)
 
+    @traced("google.write", backend="google", operation="delete")
     def delete_event(self, calendar_id: str, event_uid: str) -> None:
+        """Delete an event, with all instances if it is recurring.
+
+        Events whose id is not known, such as one created just before a
+        crash, are looked up by their UID. The id is only forgotten once
+        the event is gone, so a failed delete can be retried.
+        """
+        event_id = self._series(calendar_id).get(event_uid) or self._ids(calendar_id).get(event_uid)
+        if event_id is not None:
+            try:
+                self.service.events().delete(calendarId=calendar_id, eventId=event_id).execute(http=self._http())
+                self._forget_id(calendar_id, event_uid)
+                return
+            except HttpError as e:
+                if e.resp.status not in (404, 410):
+                    raise
+                # A stale id; the event may still be found by its UID
+                self._forget_id(calendar_id, event_uid)
         if event_uid.startswith("PRIVACY-SYNC-"):
             source_uid = event_uid[len("PRIVACY-SYNC-"):] 
-            events_result = self.service.events().list(
-                calendarId=calendar_id,
-                privateExtendedProperty=f"source_uid={source_uid}"
-            ).execute()
-            events = events_result.get('items', [])
-            for event in events:
-                self.service.events().delete(calendarId=calendar_id, eventId=event['id']).execute()
+            query = {'privateExtendedProperty': f"source_uid={source_uid}"}
         else:
-            event_id = self._sanitize_event_id(event_uid)
-            self.service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
+            query = {'iCalUID': event_uid}
+        events_result = self.service.events().list(calendarId=calendar_id, **query).execute(http=self._http())
+        for event in events_result.get('items', []):
+            self.service.events().delete(calendarId=calendar_id, eventId=event['id']).execute(http=self._http())
 
     def list_calendars(self) -> list:
         """List all calendars accessible by the authenticated Google account."""
-        logger = logging.getLogger(__name__)
         try:
             calendar_list = self.service.calendarList().list().execute()
             calendars = calendar_list.get('items', [])
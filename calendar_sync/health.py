@@ -0,0 +1,155 @@
+"""Circuit breakers that stop calling a backend while its server is down.
+
+Each backend has a breaker. It opens after a number of consecutive
+outage errors (connection failures, timeouts, 5xx and 429 responses);
+while it is open, calls to the backend fail at once with
+``BackendUnavailable`` and pairs using it are skipped. Once the reset
+timeout has passed the breaker is half-open: the next call is let
+through as a probe, and closes the breaker again if it succeeds.
+"""
+
+import http.client
+import logging
+import socket
+import threading
+import time
+from enum import Enum
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(Enum):
+    """State of a circuit breaker."""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+
+class BackendUnavailable(Exception):
+    """Raised instead of calling a backend whose circuit breaker is open."""
+
+
+def is_outage(error: BaseException) -> bool:
+    """Check whether an error means that the server is unreachable or failing.
+
+    Errors the server answered deliberately, such as a missing event or a
+    rejected request, do not count.
+    """
+    # googleapiclient errors carry ``resp``, requests errors ``response``
+    response = getattr(error, 'resp', None)
+    if response is None:
+        response = getattr(error, 'response', None)
+    status = getattr(response, 'status', None)
+    if status is None:
+        status = getattr(response, 'status_code', None)
+    if status is not None:
+        return int(status) >= 500 or int(status) == 429
+    if isinstance(error, (ConnectionError, TimeoutError, socket.timeout, http.client.HTTPException)):
+        return True
+    try:
+        import requests
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+    except ImportError:
+        pass
+    try:
+        import httplib2
+        if isinstance(error, httplib2.HttpLib2Error):
+            return True
+    except ImportError:
+        pass
+    return False
+
+
+class CircuitBreaker:
+    """Tracks the health of one backend."""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 2,
+        reset_timeout: float = 300.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """Initialize a closed breaker.
+
+        Args:
+            name: Name of the backend, for logging.
+            failure_threshold: Consecutive outage errors that open the breaker.
+            reset_timeout: Seconds the breaker stays open before a probe.
+            clock: Monotonic time source.
+        """
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self._state = CircuitState.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> CircuitState:
+        """Get the state, moving an open breaker to half-open once it may probe."""
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> CircuitState:
+        """Get the state; must be called with the lock held."""
+        if self._state == CircuitState.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+            self._state = CircuitState.HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def available(self) -> bool:
+        """Check whether calls may be made, without claiming the probe."""
+        return self.state != CircuitState.OPEN
+
+    def retry_in(self) -> float:
+        """Get the seconds until an open breaker lets a probe through."""
+        with self._lock:
+            if self._current_state() != CircuitState.OPEN:
+                return 0.0
+            return max(self._opened_at + self.reset_timeout - self.clock(), 0.0)
+
+    def allow_request(self) -> bool:
+        """Check whether a call may be made now; in half-open state only one at a time."""
+        with self._lock:
+            state = self._current_state()
+            if state == CircuitState.CLOSED:
+                return True
+            if state == CircuitState.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        """Record a call the server answered."""
+        with self._lock:
+            if self._state != CircuitState.CLOSED:
+                logger.info("Backend %s is reachable again", self.name)
+            self._state = CircuitState.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def release(self) -> None:
+        """End a call that neither proved nor disproved the health of the server."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self, error: Optional[BaseException] = None) -> None:
+        """Record an outage error."""
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self._state == CircuitState.HALF_OPEN or (
+                self._state == CircuitState.CLOSED and self.failures >= self.failure_threshold
+            ):
+                self._state = CircuitState.OPEN
+                self._opened_at = self.clock()
+                logger.warning(
+                    "Backend %s is unavailable (%s), pausing it for %.0f seconds",
+                    self.name, error, self.reset_timeout
+                )
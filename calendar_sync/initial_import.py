@@ -0,0 +1,331 @@
+"""Bulk import of the history and future of newly added calendar pairs.
+
+The regular sync reads a window of a few weeks and writes one event at a
+time. ``InitialImport`` copies a window of years instead: it walks the
+window in chunks, oldest first, and creates the events the target lacks
+on a thread pool, batching them on backends with the BATCH_WRITES
+capability. After every chunk the progress is checkpointed in
+``STATE_DIR``, so an interrupted import resumes with the first chunk that
+did not complete. Chunks are idempotent: events already in the target are
+skipped, so a chunk interrupted halfway is simply imported again.
+
+Imports are not journaled in the outbox; the checkpoint takes its place.
+"""
+
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .backends import Capability
+from .config import CalendarPair, DuplicatePolicy, SyncMode
+from .duplicates import DuplicateIndex
+from .events import CalendarEvent, as_utc
+from .slicing import time_slices
+from .state import JsonStore
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Most events Google accepts in one batch request
+BATCH_SIZE = 50
+# Seconds between progress reports
+REPORT_INTERVAL = 10.0
+
+
+@dataclass
+class ImportResult:
+    """Outcome of importing one calendar pair."""
+    pair: CalendarPair
+    success: bool
+    duration: float
+    created: int = 0
+    skipped: int = 0
+    failed: int = 0
+    error: Optional[str] = None
+
+
+class ImportProgress:
+    """Reports the throughput and remaining time of an import."""
+
+    def __init__(self, name: str, start: datetime, end: datetime, clock=time.monotonic):
+        """Initialize for the part of a window that is left to import."""
+        self.name = name
+        self.start = start
+        self.end = end
+        self.clock = clock
+        self.started = clock()
+        self.done_until = start
+        self.created = 0
+        self.skipped = 0
+        self.failed = 0
+        self._reported = self.started
+
+    def fraction(self) -> float:
+        """Get the share of the window imported so far."""
+        total = (self.end - self.start).total_seconds()
+        return min((self.done_until - self.start).total_seconds() / total, 1.0) if total > 0 else 1.0
+
+    def eta(self) -> Optional[float]:
+        """Estimate the seconds left from the time the imported share took."""
+        fraction = self.fraction()
+        if fraction <= 0:
+            return None
+        return (self.clock() - self.started) * (1 - fraction) / fraction
+
+    def rate(self) -> float:
+        """Get the events created per second."""
+        elapsed = self.clock() - self.started
+        return self.created / elapsed if elapsed > 0 else 0.0
+
+    def report(self, force: bool = False) -> None:
+        """Log the progress, at most every REPORT_INTERVAL seconds unless forced."""
+        now = self.clock()
+        if not force and now - self._reported < REPORT_INTERVAL:
+            return
+        self._reported = now
+        eta = self.eta()
+        logger.info(
+            "Importing %s: %.0f%% of the window, %d created (%.1f/s), %d already present, %d failed, ETA %s",
+            self.name, self.fraction() * 100, self.created, self.rate(), self.skipped, self.failed,
+            timedelta(seconds=round(eta)) if eta is not None else "unknown"
+        )
+
+
+class InitialImport:
+    """Imports the events of a wide window into the targets of calendar pairs."""
+
+    def __init__(self, sync_manager):
+        """Initialize the import for the pairs and backends of a SyncManager."""
+        self.manager = sync_manager
+        self.config = sync_manager.config
+        # Window and progress of every pair, by pair name
+        self.checkpoints = JsonStore(self.config.state_path("initial_import.json"))
+
+    def run(self, pairs: Optional[List[CalendarPair]] = None) -> List[ImportResult]:
+        """Import the given calendar pairs, or all configured pairs."""
+        pairs = pairs if pairs is not None else self.config.calendar_pairs
+        results = []
+        with ThreadPoolExecutor(max_workers=self.config.import_concurrency) as executor:
+            for pair in pairs:
+                results.append(self._import_pair(pair, executor))
+        return results
+
+    def _window(self, pair: CalendarPair) -> Tuple[datetime, datetime, datetime]:
+        """Get the window of a pair and how far it was imported.
+
+        The window of a checkpointed pair is kept, so that a resumed import
+        covers the same chunks as the interrupted one. Times are aware UTC,
+        which every backend reads the same way.
+        """
+        entry = self.checkpoints.get(pair.name)
+        if entry:
+            return (
+                as_utc(datetime.fromisoformat(entry['start'])),
+                as_utc(datetime.fromisoformat(entry['end'])),
+                as_utc(datetime.fromisoformat(entry['done_until'])),
+            )
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        start = today - timedelta(days=self.config.import_days_back)
+        end = today + timedelta(days=self.config.import_days_ahead)
+        return start, end, start
+
+    def _checkpoint(self, pair: CalendarPair, start: datetime, end: datetime, done_until: datetime) -> None:
+        """Persist how far a pair was imported."""
+        self.checkpoints.set(pair.name, {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'done_until': done_until.isoformat(),
+        })
+        self.checkpoints.save()
+
+    def _import_pair(self, pair: CalendarPair, executor: ThreadPoolExecutor) -> ImportResult:
+        """Import one calendar pair chunk by chunk."""
+        started = time.perf_counter()
+        start, end, done_until = self._window(pair)
+        if done_until >= end:
+            logger.info("Skipping %s: it was imported already", pair.name)
+            return ImportResult(pair, True, time.perf_counter() - started)
+        if pair.privacy and self.config.privacy_coalesce:
+            logger.info("Skipping %s: coalesced busy blocks are created by the regular sync", pair.name)
+            return ImportResult(pair, True, time.perf_counter() - started)
+        if done_until > start:
+            logger.info("Resuming the import of %s from %s", pair.name, done_until.date())
+        else:
+            logger.info("Importing %s from %s to %s", pair.name, start.date(), end.date())
+
+        progress = ImportProgress(pair.name, done_until, end)
+        # Once a chunk has failed events the checkpoint stays before it, so a rerun retries them
+        checkpoint_frozen = False
+        # UIDs created per target, in case a target does not list them back by UID
+        created: Dict[str, Set[str]] = {}
+        with span("import.pair", source=pair.source_calendar, target=pair.target_calendar) as pair_span:
+            try:
+                chunks = time_slices(done_until, end, timedelta(days=self.config.import_chunk_days))
+                for chunk_start, chunk_end in chunks:
+                    failed = progress.failed
+                    self._import_chunk(pair, chunk_start, chunk_end, executor, progress, created)
+                    progress.done_until = chunk_end
+                    if progress.failed > failed:
+                        checkpoint_frozen = True
+                    if not checkpoint_frozen:
+                        self._checkpoint(pair, start, end, chunk_end)
+                    progress.report()
+                result = ImportResult(
+                    pair, True, time.perf_counter() - started,
+                    progress.created, progress.skipped, progress.failed
+                )
+            except Exception as e:
+                logger.error("Failed to import %s: %s", pair.name, e)
+                pair_span.set_error(str(e))
+                result = ImportResult(
+                    pair, False, time.perf_counter() - started,
+                    progress.created, progress.skipped, progress.failed, str(e)
+                )
+            finally:
+                progress.report(force=True)
+                for backend in self.manager.backends.created():
+                    backend.save_state()
+            pair_span.set_attribute("created", progress.created)
+        if progress.failed:
+            logger.warning("%d event(s) of %s failed to import; run the import again to retry them",
+                           progress.failed, pair.name)
+        # The next regular sync of the pair must not be skipped as unchanged
+        self.manager.forget_tokens(pair)
+        self.manager.pair_tokens.save()
+        return result
+
+    def _read(self, calendar: str, start: datetime, end: datetime, busy_only: bool = False) -> List[CalendarEvent]:
+        """Read the events of a calendar in a chunk."""
+        backend, real_id = self.manager.backends.resolve(calendar)
+        if busy_only and backend.supports(Capability.FREE_BUSY):
+            return backend.list_busy_events(real_id, start=start, end=end)
+        return backend.list_events(real_id, start=start, end=end)
+
+    def _import_chunk(
+        self,
+        pair: CalendarPair,
+        start: datetime,
+        end: datetime,
+        executor: ThreadPoolExecutor,
+        progress: ImportProgress,
+        created: Dict[str, Set[str]]
+    ) -> None:
+        """Create the events of one chunk that are missing in the other calendar.
+
+        Two-way pairs are imported in both directions, from the events both
+        calendars had when the chunk was read.
+        """
+        with span("import.chunk", start=start.isoformat(), end=end.isoformat()):
+            source_events = self._read(pair.source_calendar, start, end, busy_only=pair.privacy)
+            target_events = self._read(pair.target_calendar, start, end)
+            directions = [(pair.target_calendar, self._missing(pair, source_events, target_events))]
+            if pair.sync_mode == SyncMode.TWO_WAY:
+                directions.append((pair.source_calendar, self._missing(pair, target_events, source_events)))
+            for calendar, (missing, present) in directions:
+                done = created.setdefault(calendar, set())
+                missing = [event for event in missing if event.uid not in done]
+                progress.skipped += present
+                self._upload(calendar, missing, executor, progress)
+                done.update(event.uid for event in missing)
+
+    def _missing(
+        self,
+        pair: CalendarPair,
+        events: Iterable[CalendarEvent],
+        existing: List[CalendarEvent]
+    ) -> Tuple[List[CalendarEvent], int]:
+        """Get the events to create from ``events`` and the number already present.
+
+        Busy events are matched to existing ones by their times, since the
+        occurrences of a recurring event share their UID and some servers
+        replace UIDs. Other events with a new UID are checked for duplicates
+        under DUPLICATE_POLICY; suppressed ones count as present.
+        """
+        handler = self.manager.privacy_handler
+        missing: List[CalendarEvent] = []
+        present = 0
+        seen: Set[Tuple[str, Optional[datetime]]] = set()
+        duplicates: Optional[DuplicateIndex] = None
+        uids: Set[str] = set()
+        if pair.privacy:
+            times = {(event.start, event.end) for event in existing if handler.is_privacy_event(event)}
+        else:
+            uids = {event.uid for event in existing}
+            if self.config.duplicate_policy != DuplicatePolicy.OFF:
+                duplicates = DuplicateIndex()
+                for event in existing:
+                    duplicates.add("", event)
+        for event in events:
+            # Each occurrence of a recurring event becomes its own busy event
+            key = (event.uid, event.start if pair.privacy else None)
+            if event.start is None or event.end is None or key in seen:
+                continue
+            seen.add(key)
+            if event.uid in uids or (pair.privacy and (event.start, event.end) in times):
+                present += 1
+            elif pair.privacy:
+                missing.append(handler.create_private_event(
+                    start=event.start,
+                    end=event.end,
+                    source_uid=event.uid,
+                    is_all_day=event.is_all_day
+                ))
+            elif duplicates is not None and self._is_duplicate(duplicates, event):
+                present += 1
+            else:
+                if duplicates is not None:
+                    duplicates.add("", event)
+                missing.append(event)
+        return missing, present
+
+    def _is_duplicate(self, duplicates: DuplicateIndex, event: CalendarEvent) -> bool:
+        """Log an event that duplicates another one; returns whether to suppress it."""
+        duplicate_uid = duplicates.find("", event)
+        if duplicate_uid is None:
+            return False
+        suppress = self.config.duplicate_policy == DuplicatePolicy.SUPPRESS
+        self.manager.log_sampler.log(
+            logging.WARNING, "Suspected duplicate events",
+            "Event %s looks like a duplicate of %s%s",
+            event.uid, duplicate_uid, ", not importing it" if suppress else ""
+        )
+        return suppress
+
+    def _upload(
+        self,
+        calendar: str,
+        events: List[CalendarEvent],
+        executor: ThreadPoolExecutor,
+        progress: ImportProgress
+    ) -> None:
+        """Create events in parallel, batched where the backend supports it."""
+        if not events:
+            return
+        backend, real_id = self.manager.backends.resolve(calendar)
+        size = BATCH_SIZE if backend.supports(Capability.BATCH_WRITES) else 1
+        batches = [events[i:i + size] for i in range(0, len(events), size)]
+        futures = {
+            executor.submit(contextvars.copy_context().run, backend.create_events, real_id, batch): batch
+            for batch in batches
+        }
+        try:
+            for future in as_completed(futures):
+                batch = futures[future]
+                for event, error in zip(batch, future.result()):
+                    if error is None:
+                        progress.created += 1
+                    else:
+                        progress.failed += 1
+                        self.manager.log_sampler.log(
+                            logging.ERROR, "Failed to import event",
+                            "Failed to import event %s into %s: %s", event.uid, calendar, error
+                        )
+                progress.report()
+        finally:
+            for future in futures:
+                future.cancel()
+            self.manager.log_sampler.flush()
@@ -0,0 +1,187 @@
+"""Asynchronous logging pipeline for the calendar sync tool.
+
+Log records are put on a bounded queue by the calling thread and written
+by a background listener thread, so slow disks or terminals never stall a
+sync. Formatting happens on the listener thread as well.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+# Attributes every LogRecord has; anything else was passed via ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handlers: List[logging.Handler] = []
+_extra_listeners: List[logging.handlers.QueueListener] = []
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Format a record as JSON, including any ``extra`` fields."""
+        document: Dict[str, Any] = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.processName != 'MainProcess':
+            document['process'] = record.processName
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                document[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            document['exception'] = record.exc_text
+        return json.dumps(document, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when full.
+
+    Only the message arguments are merged on the calling thread; the full
+    formatting is left to the handlers behind the listener.
+    """
+
+    def __init__(self, log_queue: Any):
+        """Initialize the handler."""
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Make a record safe to hand to another thread or process."""
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Put a record on the queue, dropping it if the queue is full."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _create_formatter(log_format: str) -> logging.Formatter:
+    """Create the formatter for the given format name."""
+    if log_format == "json":
+        return JsonFormatter()
+    return logging.Formatter(TEXT_FORMAT)
+
+
+def configure_logging(
+    level: str = "INFO",
+    log_file: Optional[str] = None,
+    log_format: str = "text",
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    queue_size: int = 10000
+) -> None:
+    """Route all logging through a queue to a background writer thread.
+
+    Records go to stdout and, if ``log_file`` is set, to a file rotated at
+    ``max_bytes``. Calling this again replaces the previous setup.
+    """
+    global _listener, _handlers
+    stop_logging()
+
+    formatter = _create_formatter(log_format)
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=queue_size)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(NonBlockingQueueHandler(log_queue))
+    root.setLevel(level)
+
+    _handlers = handlers
+    _listener = logging.handlers.QueueListener(log_queue, *handlers)
+    _listener.start()
+
+
+def attach_queue(log_queue: Any) -> None:
+    """Also write records that other processes put on ``log_queue``."""
+    listener = logging.handlers.QueueListener(log_queue, *_handlers)
+    listener.start()
+    _extra_listeners.append(listener)
+
+
+def configure_worker_logging(log_queue: Any, level: str) -> None:
+    """Send all records of a worker process to the supervisor's queue."""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(NonBlockingQueueHandler(log_queue))
+    root.setLevel(level)
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the background writer threads."""
+    global _listener
+    for listener in _extra_listeners:
+        listener.stop()
+    _extra_listeners.clear()
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for handler in _handlers:
+        handler.close()
+
+
+atexit.register(stop_logging)
+
+
+class LogSampler:
+    """Log the first few occurrences of a per-event message, count the rest.
+
+    Call ``flush`` at the end of a batch (e.g. a calendar pair) to log how
+    many messages of each kind were suppressed.
+    """
+
+    def __init__(self, logger: logging.Logger, limit: int = 5):
+        """Initialize the sampler."""
+        self.logger = logger
+        self.limit = limit
+        self.counts: Counter = Counter()
+        self._levels: Dict[str, int] = {}
+
+    def log(self, level: int, key: str, msg: str, *args: Any) -> None:
+        """Log a message unless ``key`` was already logged ``limit`` times."""
+        self.counts[key] += 1
+        self._levels[key] = level
+        if self.counts[key] <= self.limit:
+            self.logger.log(level, msg, *args)
+
+    def flush(self) -> None:
+        """Log a summary of suppressed messages and reset the counts."""
+        for key, count in self.counts.items():
+            if count > self.limit:
+                self.logger.log(
+                    self._levels[key], "%s: %d more message(s) suppressed", key, count - self.limit
+                )
+        self.counts.clear()
+        self._levels.clear()
@@ -0,0 +1,157 @@
+"""Memory watchdog for the long-running daemon.
+
+``MemoryWatchdog.check`` runs between sync cycles. It logs the resident
+set size of the process and how much it grew since the previous cycle,
+and, with tracemalloc enabled, the source lines whose allocations grew
+the most. Above a soft limit it first trims: the clients of all backends
+and the cached per-pair state are dropped, to be created again on first
+use, and garbage is collected. If that does not bring the process below
+the limit and restarts are allowed, the daemon re-executes itself with
+the same arguments once the state of the cycle has been saved.
+"""
+
+import ctypes
+import gc
+import logging
+import os
+import sys
+import tracemalloc
+from typing import Callable, List, Optional
+
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+MIB = 1024 * 1024
+
+
+def rss_bytes() -> Optional[int]:
+    """Get the resident set size of the process.
+
+    Read from ``/proc`` where it exists; elsewhere the peak size reported
+    by ``resource`` is the closest available value. None if neither works.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def release_free_memory() -> None:
+    """Collect garbage and return freed heap pages to the system where possible."""
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        # Not glibc
+        pass
+
+
+class MemoryWatchdog:
+    """Reports memory growth between sync cycles and enforces a soft limit."""
+
+    def __init__(
+        self,
+        trim: Callable[[], None],
+        soft_limit_mb: int = 0,
+        restart: bool = False,
+        trace_frames: int = 0,
+        top: int = 10
+    ):
+        """Initialize the watchdog.
+
+        Args:
+            trim: Drops caches; called when the soft limit is exceeded.
+            soft_limit_mb: RSS in MiB above which caches are trimmed; 0 for none.
+            restart: Whether to restart the process if trimming is not enough.
+            trace_frames: Frames kept per allocation by tracemalloc; 0 leaves
+                tracemalloc off, which avoids its overhead.
+            top: Number of allocation sites reported per cycle.
+        """
+        self.trim = trim
+        self.soft_limit = soft_limit_mb * MIB
+        self.restart = restart
+        self.top = top
+        self.cycles = 0
+        self._last_rss: Optional[int] = None
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        if trace_frames > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(trace_frames)
+
+    def _snapshot_growth(self) -> List[str]:
+        """Describe the allocation sites that grew most since the last check."""
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+        previous, self._snapshot = self._snapshot, snapshot
+        if previous is None:
+            return []
+        growth = [stat for stat in snapshot.compare_to(previous, 'lineno') if stat.size_diff > 0]
+        return [
+            f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}: "
+            f"{stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+d} blocks), {stat.size / 1024:.1f} KiB total"
+            for stat in growth[:self.top]
+        ]
+
+    def check(self) -> bool:
+        """Report memory after a cycle and enforce the soft limit.
+
+        Returns whether the process should restart.
+        """
+        self.cycles += 1
+        with span("memory.check", cycle=self.cycles) as check_span:
+            rss = rss_bytes()
+            growth = rss - self._last_rss if rss is not None and self._last_rss is not None else 0
+            self._last_rss = rss
+            if rss is not None:
+                check_span.set_attribute("rss_bytes", rss)
+                check_span.set_attribute("rss_growth_bytes", growth)
+                logger.info(
+                    "Memory after cycle %d: RSS %.1f MiB (%+.1f MiB)", self.cycles, rss / MIB, growth / MIB,
+                    extra={'rss_bytes': rss, 'rss_growth_bytes': growth}
+                )
+            sites = self._snapshot_growth()
+            if sites:
+                logger.info("Largest allocation growth since the last cycle:\n  %s", "\n  ".join(sites))
+
+            if not self.soft_limit or rss is None or rss <= self.soft_limit:
+                return False
+            logger.warning("RSS of %.1f MiB exceeds the soft limit of %.1f MiB, trimming caches",
+                           rss / MIB, self.soft_limit / MIB)
+            self.trim()
+            release_free_memory()
+            rss = rss_bytes()
+            self._last_rss = rss
+            check_span.set_attribute("trimmed_rss_bytes", rss)
+            if rss is None or rss <= self.soft_limit:
+                logger.info("RSS is %.1f MiB after trimming", (rss or 0) / MIB)
+                return False
+            if not self.restart:
+                logger.warning("RSS is still %.1f MiB after trimming", rss / MIB)
+                return False
+            logger.warning("RSS is still %.1f MiB after trimming, restarting", rss / MIB)
+            return True
+
+
+def restart_process() -> None:
+    """Replace the process with a fresh copy started with the same arguments."""
+    # Imported here to flush both before the process image is replaced
+    from .logging_setup import stop_logging
+    from .tracing import tracer
+
+    tracer.flush()
+    stop_logging()
+    argv = getattr(sys, 'orig_argv', None) or [sys.executable, "-m", "calendar_sync"] + sys.argv[1:]
+    os.execv(sys.executable, argv)
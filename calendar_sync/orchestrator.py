@@ -0,0 +1,275 @@
+"""Supervisor that syncs many accounts across a pool of worker processes."""
+
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .config import Config
+from .logging_setup import attach_queue, configure_worker_logging
+from .tracing import configure_tracing, span
+
+logger = logging.getLogger(__name__)
+
+# Weight of the latest cycle in the per-account cost estimate
+COST_SMOOTHING = 0.3
+# Rebalance once the busiest worker carries this much more than the average
+REBALANCE_THRESHOLD = 1.25
+
+
+@dataclass
+class AccountResult:
+    """Outcome of one sync cycle of an account."""
+    account: str
+    worker: int
+    success: bool
+    duration: float
+    failed_pairs: int = 0
+    error: Optional[str] = None
+
+
+def _sync_account(manager, account: str, worker_id: int) -> AccountResult:
+    """Run one sync cycle for an account inside a worker."""
+    started = time.perf_counter()
+    try:
+        with span("sync.account", account=account, worker=worker_id):
+            results = manager.sync_calendars()
+    except Exception as e:
+        logger.error(f"Sync of account {account} failed: {e}")
+        return AccountResult(account, worker_id, False, time.perf_counter() - started, error=str(e))
+    failed = sum(1 for result in results if not result.success)
+    return AccountResult(
+        account, worker_id, failed == 0, time.perf_counter() - started, failed_pairs=failed
+    )
+
+
+def _worker_main(
+    worker_id: int,
+    tasks: "multiprocessing.Queue",
+    results: "multiprocessing.Queue",
+    concurrency: int,
+    log_queue: "multiprocessing.Queue",
+    log_level: str
+) -> None:
+    """Serve sync cycles for the accounts assigned to this worker.
+
+    Each account keeps its own SyncManager, and with it its clients and
+    caches, for as long as it stays assigned to this worker. At most
+    ``concurrency`` accounts are synced at the same time.
+    """
+    configure_worker_logging(log_queue, log_level)
+    # Workers inherit the environment, so they trace to the same place
+    configure_tracing(os.getenv("TRACE_FILE"), os.getenv("TRACE_OTLP_ENDPOINT"))
+    from .sync_manager import SyncManager
+
+    managers: Dict[str, Tuple[Config, SyncManager]] = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            assignments = tasks.get()
+            if assignments is None:
+                break
+            for account in list(managers):
+                if account not in assignments:
+                    del managers[account]
+            futures = []
+            for account, config in assignments.items():
+                if account not in managers or managers[account][0] != config:
+                    managers[account] = (config, SyncManager(config))
+                manager = managers[account][1]
+                futures.append(executor.submit(_sync_account, manager, account, worker_id))
+            for future in as_completed(futures):
+                results.put(future.result())
+
+
+class AccountSupervisor:
+    """Shards accounts across worker processes and balances them by cost.
+
+    Accounts stay on their worker between cycles so their clients and
+    caches survive. The observed cycle time of every account is tracked
+    as a moving average, and accounts are redistributed (longest first,
+    onto the least loaded worker) once the load gets uneven.
+    """
+
+    def __init__(
+        self,
+        accounts: Dict[str, Config],
+        workers: int,
+        concurrency: int,
+        log_level: str = "INFO"
+    ):
+        """Initialize the supervisor."""
+        self.accounts = accounts
+        self.worker_count = max(1, min(workers, len(accounts)))
+        self.concurrency = max(1, concurrency)
+        self.log_level = log_level
+        self.costs: Dict[str, float] = {}
+        self.assignment: Dict[str, int] = {}
+        self._context = multiprocessing.get_context("spawn")
+        self._results = self._context.Queue()
+        self._log_queue = self._context.Queue()
+        self._workers: List[Tuple["multiprocessing.Process", "multiprocessing.Queue"]] = []
+
+    def start(self) -> None:
+        """Start the worker processes."""
+        attach_queue(self._log_queue)
+        for worker_id in range(self.worker_count):
+            self._workers.append(self._start_worker(worker_id))
+        self._rebalance()
+
+    def _start_worker(self, worker_id: int) -> Tuple["multiprocessing.Process", "multiprocessing.Queue"]:
+        """Start a single worker process."""
+        tasks = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, tasks, self._results, self.concurrency, self._log_queue, self.log_level),
+            name=f"calendar-sync-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        return process, tasks
+
+    def stop(self) -> None:
+        """Stop the worker processes."""
+        for process, tasks in self._workers:
+            tasks.put(None)
+        for process, _ in self._workers:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+        self._workers = []
+
+    def _cost(self, account: str) -> float:
+        """Get the estimated cycle cost of an account."""
+        if account in self.costs:
+            return self.costs[account]
+        # Unknown accounts are assumed to be average
+        return sum(self.costs.values()) / len(self.costs) if self.costs else 1.0
+
+    def _loads(self, assignment: Dict[str, int]) -> List[float]:
+        """Get the estimated load of every worker for an assignment."""
+        loads = [0.0] * self.worker_count
+        for account, worker_id in assignment.items():
+            loads[worker_id] += self._cost(account)
+        return [load / self.concurrency for load in loads]
+
+    def _rebalance(self) -> None:
+        """Assign new accounts and redistribute all of them if needed."""
+        for account in list(self.assignment):
+            if account not in self.accounts:
+                del self.assignment[account]
+        for account in self.accounts:
+            if account not in self.assignment:
+                loads = self._loads(self.assignment)
+                self.assignment[account] = loads.index(min(loads))
+
+        loads = self._loads(self.assignment)
+        average = sum(loads) / len(loads)
+        if not average or max(loads) <= average * REBALANCE_THRESHOLD:
+            return
+
+        assignment: Dict[str, int] = {}
+        balanced = [0.0] * self.worker_count
+        for account in sorted(self.accounts, key=self._cost, reverse=True):
+            worker_id = balanced.index(min(balanced))
+            assignment[account] = worker_id
+            balanced[worker_id] += self._cost(account)
+        moved = sum(1 for account in assignment if assignment[account] != self.assignment.get(account))
+        if moved:
+            logger.info(
+                f"Rebalanced {moved} account(s); worker loads "
+                f"{', '.join(f'{load:.1f}s' for load in self._loads(assignment))}"
+            )
+        self.assignment = assignment
+
+    def run_cycle(self) -> List[AccountResult]:
+        """Sync every account once and wait for all results."""
+        self._rebalance()
+        pending: Dict[int, Dict[str, Config]] = {i: {} for i in range(self.worker_count)}
+        for account, worker_id in self.assignment.items():
+            pending[worker_id][account] = self.accounts[account]
+        for worker_id, (_, tasks) in enumerate(self._workers):
+            tasks.put(pending[worker_id])
+
+        results: List[AccountResult] = []
+        while any(pending.values()):
+            try:
+                result = self._results.get(timeout=1)
+            except queue.Empty:
+                self._restart_dead_workers(pending, results)
+                continue
+            pending[result.worker].pop(result.account, None)
+            results.append(result)
+            previous = self.costs.get(result.account)
+            self.costs[result.account] = (
+                result.duration if previous is None
+                else COST_SMOOTHING * result.duration + (1 - COST_SMOOTHING) * previous
+            )
+        return results
+
+    def _restart_dead_workers(
+        self,
+        pending: Dict[int, Dict[str, Config]],
+        results: List[AccountResult]
+    ) -> None:
+        """Fail the accounts of crashed workers and start replacements."""
+        for worker_id, (process, _) in enumerate(self._workers):
+            if process.is_alive():
+                continue
+            logger.error(f"Worker {worker_id} exited with code {process.exitcode}, restarting it")
+            for account in pending[worker_id]:
+                results.append(AccountResult(account, worker_id, False, 0.0, error="worker crashed"))
+            pending[worker_id] = {}
+            self._workers[worker_id] = self._start_worker(worker_id)
+
+    def run_forever(self, interval_minutes: int) -> None:
+        """Run sync cycles until interrupted."""
+        while True:
+            started = time.monotonic()
+            results = self.run_cycle()
+            failed = [result.account for result in results if not result.success]
+            logger.info(
+                f"Synced {len(results)} account(s) in {time.monotonic() - started:.1f}s"
+                + (f", failed: {', '.join(sorted(failed))}" if failed else "")
+            )
+            time.sleep(max(0.0, interval_minutes * 60 - (time.monotonic() - started)))
+
+
+def run_accounts(
+    accounts: Dict[str, Config],
+    workers: int,
+    concurrency: int,
+    once: bool = False,
+    log_level: str = "INFO"
+) -> int:
+    """Sync several accounts across worker processes.
+
+    Returns the process exit status: with ``once`` a single cycle runs and
+    the status is 1 if any account failed; otherwise this runs until
+    interrupted.
+    """
+    supervisor = AccountSupervisor(accounts, workers, concurrency, log_level)
+    supervisor.start()
+    logger.info(
+        f"Started {supervisor.worker_count} worker(s) for {len(accounts)} account(s), "
+        f"{supervisor.concurrency} concurrent account(s) per worker"
+    )
+    try:
+        if once:
+            results = supervisor.run_cycle()
+            for result in sorted(results, key=lambda r: r.account):
+                status = "ok" if result.success else f"failed ({result.error or f'{result.failed_pairs} pair(s)'})"
+                print(f"{result.account}: {status} in {result.duration:.1f}s on worker {result.worker}",
+                      file=sys.stderr)
+            return 0 if all(result.success for result in results) else 1
+        interval = min(config.sync_interval_minutes for config in accounts.values())
+        supervisor.run_forever(interval)
+    except KeyboardInterrupt:
+        logger.info("Received shutdown signal")
+    finally:
+        supervisor.stop()
+    return 0
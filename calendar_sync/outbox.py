@@ -0,0 +1,217 @@
+"""Write-ahead journal of the writes made to target calendars.
+
+Every create, update and delete is appended to a JSON lines file before it
+is sent and marked done once it succeeded. Writes still pending when the
+process starts again, because it crashed or the request failed, are
+replayed. A write planned again while an earlier plan of the same action
+on the same event (or occurrence, for events with a start) is pending
+reuses its record, so failing cycles do not pile up copies of one write.
+Records are flushed to the operating system right away and synced to disk
+in batches.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, IO, Iterable, List, Optional, Tuple
+
+from .events import CalendarEvent
+
+logger = logging.getLogger(__name__)
+
+# Action, calendar, event UID and start of a write; occurrences of a
+# recurring event share their UID
+WriteKey = Tuple[str, str, str, Optional[str]]
+
+# Give up on a write after this many failed replays
+MAX_ATTEMPTS = 3
+
+
+class Outbox:
+    """Journal of planned writes, kept in a JSON lines file."""
+
+    def __init__(self, path: str, sync_every: int = 50):
+        """Initialize the outbox.
+
+        Args:
+            path: Path of the journal file.
+            sync_every: Number of records after which the file is synced to disk.
+        """
+        self.path = Path(path)
+        self.sync_every = sync_every
+        self._file: Optional[IO[str]] = None
+        self._next_id: Optional[int] = None
+        # Ids of the pending plans by the write they plan, and back
+        self._pending_ids: Dict[WriteKey, int] = {}
+        self._pending_keys: Dict[int, WriteKey] = {}
+        self._unsynced = 0
+        self._lock = threading.Lock()
+
+    def _read(self) -> List[Dict[str, Any]]:
+        """Read all records, skipping a line torn by a crash."""
+        records = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        logger.warning(f"Skipping damaged record in {self.path}")
+        except FileNotFoundError:
+            pass
+        return records
+
+    def _append(self, records: Iterable[Dict[str, Any]], sync: bool = False) -> None:
+        """Append records and flush them; must be called with the lock held."""
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        count = 0
+        for record in records:
+            self._file.write(json.dumps(record, separators=(',', ':')) + "\n")
+            count += 1
+        self._file.flush()
+        self._unsynced += count
+        if sync or self._unsynced >= self.sync_every:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    @staticmethod
+    def _key(record: Dict[str, Any]) -> WriteKey:
+        """Get the write planned by a plan record."""
+        start = (record.get('event') or {}).get('start')
+        return (record['action'], record['calendar'], str(record['uid']), start)
+
+    @staticmethod
+    def _collect(records: Iterable[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+        """Get the planned writes that are not done, by id, with their failed replays."""
+        planned: Dict[int, Dict[str, Any]] = {}
+        for record in records:
+            if record.get('op') == 'plan':
+                # A write planned again keeps the failed replays of its earlier plan
+                attempts = planned[record['id']]['attempts'] if record['id'] in planned else 0
+                planned[record['id']] = dict(record, attempts=attempts)
+            elif record.get('op') == 'done':
+                planned.pop(record['id'], None)
+            elif record.get('op') == 'failed' and record['id'] in planned:
+                planned[record['id']]['attempts'] += 1
+        return planned
+
+    def _allocate(self, keys: List[WriteKey]) -> List[int]:
+        """Get record ids for writes, reusing those of pending plans; must be called with the lock held."""
+        if self._next_id is None:
+            records = self._read()
+            self._next_id = max((record['id'] for record in records), default=-1) + 1
+            self._pending_keys = {op_id: self._key(record) for op_id, record in self._collect(records).items()}
+            self._pending_ids = {key: op_id for op_id, key in self._pending_keys.items()}
+        ids = []
+        for key in keys:
+            if key not in self._pending_ids:
+                self._pending_ids[key] = self._next_id
+                self._pending_keys[self._next_id] = key
+                self._next_id += 1
+            ids.append(self._pending_ids[key])
+        return ids
+
+    @staticmethod
+    def _plan_record(
+        action: str,
+        calendar_id: str,
+        event: Optional[CalendarEvent],
+        uid: Optional[str]
+    ) -> Dict[str, Any]:
+        """Build the record of a planned write, without its id."""
+        return {
+            'op': 'plan',
+            'action': action,
+            'calendar': calendar_id,
+            'uid': str(event.uid) if event is not None else uid,
+            'event': event.to_dict() if event is not None else None,
+        }
+
+    def plan(
+        self,
+        action: str,
+        calendar_id: str,
+        event: Optional[CalendarEvent] = None,
+        uid: Optional[str] = None
+    ) -> int:
+        """Record a write before it is sent; returns its id."""
+        with self._lock:
+            record = self._plan_record(action, calendar_id, event, uid)
+            record['id'] = self._allocate([self._key(record)])[0]
+            self._append([record])
+            op_id = record['id']
+        return op_id
+
+    def plan_many(self, action: str, calendar_id: str, events: List[CalendarEvent]) -> List[int]:
+        """Record a batch of writes with a single append and sync to disk."""
+        with self._lock:
+            records = [self._plan_record(action, calendar_id, event, None) for event in events]
+            ids = self._allocate([self._key(record) for record in records])
+            for record, op_id in zip(records, ids):
+                record['id'] = op_id
+            self._append(records, sync=True)
+        return ids
+
+    def done(self, op_id: int) -> None:
+        """Mark a write as done."""
+        with self._lock:
+            key = self._pending_keys.pop(op_id, None)
+            if key is not None:
+                del self._pending_ids[key]
+            self._append([{'op': 'done', 'id': op_id}])
+
+    def failed(self, op_id: int) -> None:
+        """Record a failed replay of a write."""
+        with self._lock:
+            self._append([{'op': 'failed', 'id': op_id}])
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """Get the planned writes that are not done, oldest first.
+
+        Each record has an ``attempts`` count of its failed replays.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            return list(self._collect(self._read()).values())
+
+    def compact(self) -> None:
+        """Rewrite the journal with only the pending writes."""
+        pending = self.pending()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if not pending and not self.path.exists():
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=f".{self.path.name}.", dir=str(self.path.parent))
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    for record in pending:
+                        attempts = record.pop('attempts')
+                        failed = {'op': 'failed', 'id': record['id']}
+                        for line in [record] + [failed] * attempts:
+                            f.write(json.dumps(line, separators=(',', ':')) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+            self._unsynced = 0
+
+    def close(self) -> None:
+        """Sync and close the journal file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
@@ -1,11 +1,13 @@
 """Privacy event handling for calendar synchronization."""
 
+import hashlib
 import uuid
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
 from collections.abc import Mapping
 
-from .caldav_client import CalendarEvent
+from .event_index import EventIndex
+from .events import CalendarEvent
 
 
 class PrivacyEvent:
@@ -41,6 +43,27 @@ class PrivacyEvent:
             is_all_day=is_all_day  # Preserve all-day status
         )
     
+    def coalesce(
+        self,
+        events: Iterable[CalendarEvent],
+        gap: timedelta = timedelta(0)
+    ) -> List[CalendarEvent]:
+        """Merge overlapping or adjacent events into as few busy blocks as possible.
+        
+        Events closer than ``gap`` are merged as well. All-day and timed
+        events form separate blocks. Each block's UID is derived from its
+        bounds, so an unchanged block keeps its UID from one sync to the next.
+        """
+        blocks = EventIndex(events).merged_intervals(gap)
+        return [self._create_block(start, end, is_all_day) for is_all_day, start, end in blocks]
+    
+    def _create_block(self, start: datetime, end: datetime, is_all_day: bool) -> CalendarEvent:
+        """Create a busy block with a UID derived from its bounds."""
+        key = f"{start.isoformat()}/{end.isoformat()}/{is_all_day}"
+        event = self.create_private_event(start=start, end=end, is_all_day=is_all_day)
+        event.uid = f"{self.prefix}BLOCK-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]}"
+        return event
+    
     def is_privacy_event(self, event: CalendarEvent) -> bool:
         """Check if an event is a privacy event."""
         return event.uid.startswith(self.prefix)
@@ -59,4 +82,5 @@ class PrivacyEvent:
             if uid_str.startswith(self.prefix):
                 return uid_str[len(self.prefix):]
             return uid_str
-        raise ValueError("Event does not have a valid UID") 
\ No newline at end of file
+        raise ValueError("Event does not have a valid UID") 
+
@@ -0,0 +1,191 @@
+"""Profiling of a sync cycle.
+
+``profile_cycle`` runs a block under cProfile and a sampling profiler at
+the same time and writes a ``.prof`` file, readable with ``pstats`` or
+snakeviz, and a ``.folded`` file of collapsed stacks, readable with
+flamegraph.pl or speedscope. The spans of the cycle are summed into the
+time every pair spent discovering calendars, fetching, parsing, diffing
+and writing.
+"""
+
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .tracing import Span, tracer
+
+logger = logging.getLogger(__name__)
+
+PHASES = ("discover", "fetch", "parse", "diff", "write")
+
+# Phase of every span name that counts towards one
+SPAN_PHASES = {
+    "caldav.discover": "discover",
+    "google.auth": "discover",
+    "caldav.propfind": "fetch",
+    "caldav.fetch": "fetch",
+    "google.fetch": "fetch",
+    "caldav.parse": "parse",
+    "google.parse": "parse",
+    "sync.reconcile": "diff",
+    "caldav.write": "write",
+    "google.write": "write",
+}
+
+
+class PhaseCollector:
+    """Sums the time spent in each phase per calendar pair.
+
+    Add it as a tracer listener. Time spent in a phase nested inside
+    another phase, such as writes during a reconcile, counts only for the
+    inner one. Spans outside any pair are reported as ``(cycle)``.
+    """
+
+    def __init__(self):
+        """Initialize an empty collector."""
+        self.phases: Dict[str, Counter] = defaultdict(Counter)
+        self.totals: Dict[str, float] = {}
+        # Finished spans whose pair is not known yet, by span id
+        self._pending: Dict[str, Span] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, span: Span) -> None:
+        """Record a finished span."""
+        with self._lock:
+            self._pending[span.span_id] = span
+            if span.name == "sync.pair":
+                name = f"{span.attributes.get('source')}:{span.attributes.get('target')}"
+                self.totals[name] = self.totals.get(name, 0.0) + span.duration
+                self._assign(span.span_id, name)
+            elif span.parent_id is None:
+                self._assign(span.span_id, "(cycle)")
+
+    def _assign(self, root_id: str, name: str) -> None:
+        """Attribute the pending spans below a root span to a pair."""
+        children: Dict[Optional[str], List[Span]] = defaultdict(list)
+        for span in self._pending.values():
+            children[span.parent_id].append(span)
+        # Spans with the phase of their nearest ancestor inside a phase
+        stack: List[Tuple[Span, Optional[str]]] = [(self._pending.pop(root_id), None)]
+        while stack:
+            span, outer = stack.pop()
+            phase = SPAN_PHASES.get(span.name)
+            if phase is not None:
+                self.phases[name][phase] += span.duration
+                if outer is not None:
+                    self.phases[name][outer] -= span.duration
+            for child in children.get(span.span_id, []):
+                self._pending.pop(child.span_id, None)
+                stack.append((child, phase or outer))
+
+    def format_table(self) -> str:
+        """Format the seconds per phase and pair as a plain text table."""
+        names = list(self.totals) + [name for name in self.phases if name not in self.totals]
+        width = max([len(name) for name in names] + [len("pair")])
+        header = f"{'pair':<{width}}" + "".join(f"  {phase:>8}" for phase in PHASES)
+        lines = [header + f"  {'other':>8}  {'total':>8}"]
+        for name in names:
+            phases = self.phases.get(name, Counter())
+            spent = [max(phases[phase], 0.0) for phase in PHASES]
+            row = f"{name:<{width}}" + "".join(f"  {seconds:>8.3f}" for seconds in spent)
+            if name in self.totals:
+                total = self.totals[name]
+                row += f"  {max(total - sum(spent), 0.0):>8.3f}  {total:>8.3f}"
+            lines.append(row)
+        return "\n".join(lines)
+
+
+class StackSampler:
+    """Samples the stack of a thread at a fixed interval.
+
+    Samples are kept as collapsed stacks: the frames from the outermost
+    one, joined by semicolons, with the number of samples they were seen in.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.005):
+        """Initialize the sampler.
+
+        Args:
+            thread_id: Thread to sample; defaults to the calling thread.
+            interval: Seconds between samples.
+        """
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start sampling in a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        """Take samples until stopped."""
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(frames))] += 1
+
+    def write_folded(self, path: str) -> None:
+        """Write the samples in the collapsed stack format of flamegraph.pl."""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@dataclass
+class ProfileResult:
+    """Files and phase table written by ``profile_cycle``."""
+    profile_path: str
+    folded_path: str
+    phases: PhaseCollector = field(repr=False)
+
+
+@contextmanager
+def profile_cycle(directory: str, interval: float = 0.005) -> Iterator[ProfileResult]:
+    """Profile the enclosed block and write its profile files into a directory.
+
+    The files are named after the start time, so every profiled cycle gets
+    its own pair of files.
+    """
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, time.strftime("cycle-%Y%m%d-%H%M%S"))
+    result = ProfileResult(stem + ".prof", stem + ".folded", PhaseCollector())
+    profiler = cProfile.Profile()
+    sampler = StackSampler(interval=interval)
+    tracer.add_listener(result.phases)
+    sampler.start()
+    profiler.enable()
+    try:
+        yield result
+    finally:
+        profiler.disable()
+        sampler.stop()
+        tracer.remove_listener(result.phases)
+        profiler.dump_stats(result.profile_path)
+        sampler.write_folded(result.folded_path)
+        logger.info("Wrote profile to %s and stack samples to %s",
+                    result.profile_path, result.folded_path)
+
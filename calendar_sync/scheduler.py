@@ -0,0 +1,182 @@
+"""The sync loop of the daemon.
+
+``Scheduler`` runs a sync cycle every sync interval, counted from the
+start of a cycle, and retries pairs skipped because a backend was
+unavailable as soon as its circuit breaker lets a probe through. While
+waiting it watches the .env file: a changed configuration is applied to
+the running sync manager, which keeps its clients, caches and per-pair
+state where the change does not affect them, and pairs that were added
+are synced at once instead of at the next cycle. Pairs with horizon
+tiers are also synced in between, whenever one of their tiers is due;
+such a sync only covers the due tiers.
+"""
+
+import logging
+import time
+from typing import Callable, List, NoReturn, Optional
+
+from .config import CalendarPair, Config, EnvFile
+from .memory import MemoryWatchdog, restart_process
+
+logger = logging.getLogger(__name__)
+
+
+def select_pairs(pairs: List[CalendarPair], selectors: List[str]) -> List[CalendarPair]:
+    """Select calendar pairs by 1-based position or by ``source:target`` name."""
+    selected = []
+    for selector in selectors:
+        if selector.isdigit() and 1 <= int(selector) <= len(pairs):
+            pair = pairs[int(selector) - 1]
+        else:
+            matches = [pair for pair in pairs if pair.name == selector]
+            if not matches:
+                raise ValueError(f"No calendar pair matches: {selector}")
+            pair = matches[0]
+        if pair not in selected:
+            selected.append(pair)
+    return selected
+
+
+class Scheduler:
+    """Runs the sync cycles of the daemon."""
+
+    def __init__(
+        self,
+        sync_manager,
+        selectors: Optional[List[str]] = None,
+        env_file: Optional[EnvFile] = None,
+        poll_interval: float = 5.0,
+        on_reload: Optional[Callable[[Config], None]] = None,
+        watchdog: Optional[MemoryWatchdog] = None
+    ):
+        """Initialize the scheduler.
+
+        Args:
+            sync_manager: The SyncManager running the cycles.
+            selectors: Only sync the pairs selected by these, as for ``--pair``.
+            env_file: The .env file to watch for configuration changes.
+            poll_interval: Seconds between checks of the .env file.
+            on_reload: Called with a reloaded configuration once it is applied.
+            watchdog: Checks the memory of the process after every cycle.
+        """
+        self.sync_manager = sync_manager
+        self.selectors = selectors
+        self.env_file = env_file
+        self.poll_interval = poll_interval
+        self.on_reload = on_reload
+        self.watchdog = watchdog
+
+    @property
+    def interval(self) -> float:
+        """Get the seconds between the starts of two cycles."""
+        return self.sync_manager.config.sync_interval_minutes * 60
+
+    def pairs(self, config: Optional[Config] = None) -> List[CalendarPair]:
+        """Get the pairs to sync under a configuration, the current one by default."""
+        config = config or self.sync_manager.config
+        if self.selectors:
+            return select_pairs(config.calendar_pairs, self.selectors)
+        return list(config.calendar_pairs)
+
+    def tiered_pairs(self) -> List[CalendarPair]:
+        """Get the pairs to sync that have horizon tiers."""
+        config = self.sync_manager.config
+        return [pair for pair in self.pairs() if config.tiers_of(pair)]
+
+    def _sync(self, pairs: List[CalendarPair]) -> list:
+        """Sync some pairs, logging instead of raising if the cycle fails."""
+        try:
+            return self.sync_manager.sync_calendars(pairs)
+        except Exception as e:
+            logger.error(f"Sync failed: {str(e)}")
+            return []
+
+    def reload(self) -> Optional[List[CalendarPair]]:
+        """Apply the .env file if its configuration changed.
+
+        Returns the pairs it added, or None if nothing changed. An invalid
+        configuration is logged and the current one kept.
+        """
+        old = self.sync_manager.config
+        try:
+            self.env_file.apply()
+            config = Config.load()
+            pairs = self.pairs(config)
+        except Exception as e:
+            logger.error(f"Keeping the current configuration, {self.env_file.path} is invalid: {str(e)}")
+            return None
+        if config == old:
+            return None
+        known = {pair.name for pair in self.pairs()}
+        self.sync_manager.reconfigure(config)
+        if self.on_reload is not None:
+            self.on_reload(config)
+        return [pair for pair in pairs if pair.name not in known]
+
+    def _wait(self, deadline: float) -> Optional[List[CalendarPair]]:
+        """Sleep until a monotonic deadline or until the configuration changes.
+
+        Returns the pairs added by a changed configuration, or None once
+        the deadline is reached.
+        """
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            if self.env_file is None:
+                time.sleep(remaining)
+                continue
+            time.sleep(min(remaining, self.poll_interval))
+            if self.env_file.changed():
+                added = self.reload()
+                if added is not None:
+                    return added
+
+    def run(self) -> NoReturn:
+        """Sync the pairs every interval until interrupted."""
+        due: Optional[List[CalendarPair]] = None
+        blocked: List[CalendarPair] = []
+        while True:
+            regular = due is None
+            if regular:
+                cycle_started = time.monotonic()
+                due, blocked = self.pairs(), []
+            synced = {pair.name for pair in due}
+            results = self._sync(due)
+            due = None
+            if regular and self.watchdog is not None and self.watchdog.check():
+                restart_process()
+            blocked = [pair for pair in blocked if pair.name not in synced]
+            blocked += [result.pair for result in results if result.unavailable]
+
+            while due is None:
+                next_cycle = cycle_started + self.interval
+                wake_at, waking = next_cycle, None
+                if blocked:
+                    retry_at = time.monotonic() + (self.sync_manager.next_retry() or 0.0)
+                    if retry_at < wake_at:
+                        wake_at, waking = retry_at, blocked
+                tiered = self.tiered_pairs()
+                tier_wait = self.sync_manager.next_tier_due(tiered) if tiered else None
+                if tier_wait is not None and time.monotonic() + tier_wait < wake_at:
+                    wake_at, waking = time.monotonic() + tier_wait, tiered
+                if waking is None:
+                    logger.info(f"Waiting {max(next_cycle - time.monotonic(), 0) / 60:.1f} minutes until next sync")
+                elif waking is blocked:
+                    logger.info("Retrying %d pair(s) with unavailable backends in %.0f seconds",
+                                len(blocked), wake_at - time.monotonic())
+                else:
+                    logger.debug("Syncing the due horizon tiers of %d pair(s) in %.0f seconds",
+                                 len(tiered), wake_at - time.monotonic())
+                added = self._wait(wake_at)
+                if added is None:
+                    if waking is None:
+                        break
+                    due = waking
+                else:
+                    # The interval may have changed; it still counts from the last cycle start
+                    names = {pair.name for pair in blocked}
+                    blocked = [pair for pair in self.pairs() if pair.name in names]
+                    if added:
+                        logger.info("Syncing %d added pair(s)", len(added))
+                        due = added
@@ -0,0 +1,87 @@
+"""Persistent state storage for the calendar sync tool."""
+
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class JsonStore:
+    """A small JSON document kept on disk and written atomically.
+
+    The document is loaded on first access and only written back when
+    ``save`` is called after a change, so reading cached state costs a
+    single file read per process.
+    """
+
+    def __init__(self, path: str):
+        """Initialize the store for the given file path."""
+        self.path = Path(path)
+        self._data: Optional[Dict[str, Any]] = None
+        self._dirty = False
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        """Get the loaded document, reading it from disk if needed."""
+        if self._data is None:
+            self._data = self._load()
+        return self._data
+
+    def _load(self) -> Dict[str, Any]:
+        """Read the document from disk, starting empty if it is unusable."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable state file {self.path}: {e}")
+            return {}
+        if not isinstance(data, dict):
+            logger.warning(f"Ignoring state file {self.path}: not a JSON object")
+            return {}
+        return data
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get a value from the store."""
+        return self.data.get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        """Set a value in the store."""
+        if self.data.get(key) != value:
+            self.data[key] = value
+            self._dirty = True
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        """Remove a value from the store and return it."""
+        if key in self.data:
+            self._dirty = True
+        return self.data.pop(key, default)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.data
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.data))
+
+    def save(self) -> None:
+        """Write the document to disk if it changed since the last save."""
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=f".{self.path.name}.", dir=str(self.path.parent)
+        )
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._dirty = False
@@ -1,306 +1,1041 @@
 """Calendar synchronization manager."""
 
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Set, Tuple
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-from .caldav_client import CalDAVClient, CalendarEvent
-from .config import Config, SyncMode
+from .backends import Backend, BackendRegistry, Capability
+from .config import CalendarPair, Config, DuplicatePolicy, HorizonTier, SyncMode
+from .diff_index import SOURCE, TARGET, DiffIndex
+from .duplicates import DuplicateIndex
+from .events import CalendarEvent
+from .health import BackendUnavailable, is_outage
+from .logging_setup import LogSampler
+from .outbox import MAX_ATTEMPTS, Outbox
 from .privacy import PrivacyEvent
+from .state import JsonStore
+from .tracing import span
+
+if TYPE_CHECKING:
+    from .caldav_client import CalDAVClient
+    from .cassette import HttpTransport
+    from .google_calendar_client import GoogleCalendarClient
 
 logger = logging.getLogger(__name__)
 
+# Busy events journaled to the outbox with a single append
+PLAN_BATCH_SIZE = 500
+
+
+@dataclass
+class PairResult:
+    """Outcome of synchronizing one calendar pair."""
+    pair: CalendarPair
+    success: bool
+    duration: float
+    error: Optional[str] = None
+    counts: Dict[str, int] = field(default_factory=dict)
+    # Failed or skipped because a backend of the pair is unavailable
+    unavailable: bool = False
+
 
 class SyncManager:
     """Manager for calendar synchronization operations."""
     
-    def __init__(self, config: Config):
-        """Initialize the sync manager."""
+    def __init__(self, config: Config, transport: Optional["HttpTransport"] = None):
+        """Initialize the sync manager.
+        
+        With a transport, the HTTP exchanges of all backends are recorded
+        or replayed through it.
+        """
         self.config = config
-        self.nextcloud = CalDAVClient(config.nextcloud)
-        self.kerio = CalDAVClient(config.kerio)
+        self.backends = BackendRegistry(config, transport)
+        self.privacy_handler = PrivacyEvent(
+            prefix=config.privacy_event_prefix,
+            title=config.privacy_event_title
+        )
+        # Write counts of the pair being synced, summarised once per pair
+        self.counts: Counter = Counter()
+        self._pair_states: Dict[str, JsonStore] = {}
+        # Events read this cycle from calendars shared by several pairs
+        self._read_cache: Dict[Tuple, List[CalendarEvent]] = {}
+        self._shared_calendars: Set[str] = set()
+        # Change tokens of both calendars of every pair, and of every horizon
+        # tier of a pair as ``pair#tier``, at its last clean sync
+        self.pair_tokens = JsonStore(config.state_path("pair_tokens.json"))
+        # Change tokens fetched this cycle, dropped when the calendar is written
+        self._tokens: Dict[str, Optional[str]] = {}
+        # Fingerprints of the events of the calendars written this cycle
+        self.duplicates = DuplicateIndex()
+        self._write_targets: Set[str] = set()
+        # Target events standing in for suppressed duplicates, kept by one-way cleanup
+        self._kept_duplicates: Set[Tuple[str, str]] = set()
+        # Monotonic start of the cycle that last synced each horizon tier, by pair name and tier
+        self._tiers_synced: Dict[Tuple[str, HorizonTier], float] = {}
+        # Start of the current cycle, shared by the tier windows of all its pairs; aware,
+        # since backends differ in how they read naive times
+        self._cycle_clock = time.monotonic()
+        self._cycle_now = datetime.now(timezone.utc)
+        # Journal of target writes, replayed if the process died mid-sync
+        self.outbox = Outbox(config.state_path("outbox.jsonl"))
+        self.log_sampler = LogSampler(logger)
+
+    def reconfigure(self, config: Config) -> None:
+        """Switch to a changed configuration, keeping what it did not affect.
+        
+        Backends whose settings did not change keep their clients, with
+        their connections and discovered calendars, and pairs that still
+        exist keep their sync state.
+        """
+        old, self.config = self.config, config
+        self.backends.reconfigure(config)
         self.privacy_handler = PrivacyEvent(
             prefix=config.privacy_event_prefix,
             title=config.privacy_event_title
         )
+        if config.state_dir != old.state_dir:
+            self.outbox.close()
+            self.outbox = Outbox(config.state_path("outbox.jsonl"))
+            self.pair_tokens = JsonStore(config.state_path("pair_tokens.json"))
+            self._pair_states = {}
+        else:
+            names = {pair.name for pair in config.calendar_pairs}
+            for name in [name for name in self.pair_tokens if name.split("#")[0] not in names]:
+                self.pair_tokens.pop(name)
+            self.pair_tokens.save()
+        names = {pair.name for pair in config.calendar_pairs}
+        self._tiers_synced = {key: synced for key, synced in self._tiers_synced.items() if key[0] in names}
+        logger.info("Configuration reloaded: %d calendar pair(s)", len(config.calendar_pairs))
+    
+    def trim_caches(self) -> None:
+        """Drop the clients and state kept between cycles; they are created again on first use."""
+        for backend in self.backends.created():
+            backend.reset_client()
+        self._pair_states.clear()
+        self.outbox.compact()
+    
+    @property
+    def nextcloud(self) -> "CalDAVClient":
+        """Get the Nextcloud client, creating it on first use."""
+        return self.backends.get("nextcloud").client
+
+    @property
+    def kerio(self) -> "CalDAVClient":
+        """Get the Kerio client, creating it on first use."""
+        return self.backends.get("kerio").client
+
+    @property
+    def google(self) -> "GoogleCalendarClient":
+        """Get the Google Calendar client, creating it on first use."""
+        return self.backends.get("google").client
+    
+    def sync_calendars(
+        self,
+        pairs: Optional[List[CalendarPair]] = None
+    ) -> List[PairResult]:
+        """Synchronize the given calendar pairs, or all configured pairs."""
+        pairs = pairs if pairs is not None else self.config.calendar_pairs
+        uses = Counter(
+            calendar_id for pair in pairs for calendar_id in (pair.source_calendar, pair.target_calendar)
+        )
+        self._shared_calendars = {calendar_id for calendar_id, count in uses.items() if count > 1}
+        self._cycle_clock = time.monotonic()
+        self._cycle_now = datetime.now(timezone.utc)
+        if self.config.duplicate_policy != DuplicatePolicy.OFF:
+            self._write_targets = {pair.target_calendar for pair in pairs} | {
+                pair.source_calendar for pair in pairs if pair.sync_mode == SyncMode.TWO_WAY
+            }
+        try:
+            with span("sync.cycle", pairs=len(pairs)) as cycle_span:
+                self._replay_outbox()
+                results = [self._sync_pair(pair) for pair in pairs]
+                cycle_span.set_attribute("failed", sum(1 for result in results if not result.success))
+        finally:
+            self._shared_calendars = set()
+            self._write_targets = set()
+            self._kept_duplicates.clear()
+            self.duplicates.clear()
+            self._read_cache.clear()
+            self._tokens.clear()
+            self.pair_tokens.save()
+            self.outbox.compact()
+            for backend in self.backends.created():
+                backend.save_state()
+        return results
+
+    def next_retry(self) -> Optional[float]:
+        """Get the seconds until the next unavailable backend may be probed, if any."""
+        waits = [
+            backend.breaker.retry_in()
+            for backend in self.backends.created() if not backend.breaker.available()
+        ]
+        return min(waits) if waits else None
+
+    def next_tier_due(self, pairs: List[CalendarPair]) -> Optional[float]:
+        """Get the seconds until a horizon tier of some pairs is due, None if they have none.
+        
+        Pairs with an unavailable backend are left to the retry of blocked pairs.
+        """
+        waits = [
+            self._tiers_synced.get((pair.name, tier), float("-inf")) + tier.interval_minutes * 60
+            - time.monotonic()
+            for pair in pairs if not self.backends.unavailable([pair.source_calendar, pair.target_calendar])
+            for tier in self.config.tiers_of(pair)
+        ]
+        return max(min(waits), 0.0) if waits else None
+    
+    def _due_tiers(self, pair: CalendarPair, tiers: List[HorizonTier]) -> List[HorizonTier]:
+        """Get the horizon tiers of a pair whose interval passed since they were last synced.
+        
+        Whenever the least frequent tier is due, all tiers are synced in one
+        pass, which also forgets two-way state of events that left the window
+        and lets unchanged pairs be skipped. Coalesced busy blocks may span
+        tiers, so such pairs always sync all of them.
+        """
+        due = [
+            tier for tier in tiers
+            if self._cycle_clock - self._tiers_synced.get((pair.name, tier), float("-inf"))
+            >= tier.interval_minutes * 60
+        ]
+        slowest = max(tiers, key=lambda tier: tier.interval_minutes)
+        if due and (slowest in due or (pair.privacy and self.config.privacy_coalesce)):
+            return list(tiers)
+        return due
+    
+    def _tier_windows(
+        self,
+        tiers: List[HorizonTier],
+        due: List[HorizonTier]
+    ) -> List[Tuple[datetime, datetime]]:
+        """Get the time ranges of the due tiers, joining adjacent ones."""
+        windows: List[Tuple[datetime, datetime]] = []
+        start = self._cycle_now.replace(hour=0, minute=0, second=0, microsecond=0)
+        for tier in tiers:
+            end = self._cycle_now + timedelta(minutes=tier.horizon_minutes)
+            if tier in due:
+                if windows and windows[-1][1] == start:
+                    windows[-1] = (windows[-1][0], end)
+                else:
+                    windows.append((start, end))
+            start = end
+        return windows
+    
+    def _change_token(self, calendar_id: str) -> Optional[str]:
+        """Get a value that changes whenever the calendar does.
+        
+        Returns None if the backend or server offers none. Fetched once per
+        cycle, and again after this tool wrote to the calendar.
+        """
+        if calendar_id not in self._tokens:
+            backend, real_id = self.backends.resolve(calendar_id)
+            token = None
+            if backend.supports(Capability.SYNC_TOKEN):
+                try:
+                    state = backend.fetch_sync_state(real_id)
+                    if state.get('ctag') or state.get('sync_token'):
+                        token = f"{state.get('ctag')}|{state.get('sync_token')}"
+                except Exception as e:
+                    logger.debug("Failed to fetch the change token of %s: %s", calendar_id, e)
+            self._tokens[calendar_id] = token
+        return self._tokens[calendar_id]
+    
+    def _pair_settings(self, pair: CalendarPair) -> str:
+        """Describe the settings that change what a pair writes."""
+        return ":".join(str(value) for value in (
+            pair.sync_mode.value, pair.privacy, self.config.privacy_event_title,
+            self.config.privacy_event_prefix, self.config.privacy_coalesce,
+            self.config.privacy_coalesce_gap_minutes
+        ))
+    
+    @staticmethod
+    def _token_key(pair: CalendarPair, tier: Optional[HorizonTier] = None) -> str:
+        """Get the key of the change tokens of a pair, or of one of its horizon tiers."""
+        return pair.name if tier is None else f"{pair.name}#{tier}"
+    
+    def forget_tokens(self, pair: CalendarPair) -> None:
+        """Forget the change tokens of a pair and its tiers, so that it is synced next time."""
+        for name in [name for name in self.pair_tokens if name.split("#")[0] == pair.name]:
+            self.pair_tokens.pop(name)
+    
+    def _pair_unchanged(self, pair: CalendarPair, tier: Optional[HorizonTier] = None) -> bool:
+        """Check whether neither calendar changed since the last clean sync of a pair.
+        
+        With ``tier``, since the last clean sync of that horizon tier. Every
+        pair is synced in full at least every FORCE_RESYNC_MINUTES, which
+        also moves the sync window along; 0 disables the check.
+        """
+        if self.config.force_resync_minutes <= 0:
+            return False
+        # Always fetched before the calendars are read, to be remembered afterwards
+        source = self._change_token(pair.source_calendar)
+        target = self._change_token(pair.target_calendar)
+        last = self.pair_tokens.get(self._token_key(pair, tier))
+        if not last or last.get('settings') != self._pair_settings(pair):
+            return False
+        if time.time() - last.get('synced_at', 0) >= self.config.force_resync_minutes * 60:
+            return False
+        return (source is not None and target is not None
+                and (source, target) == (last.get('source'), last.get('target')))
     
-    def sync_calendars(self) -> None:
-        """Synchronize all configured calendar pairs."""
-        for pair in self.config.calendar_pairs:
+    def _remember_tokens(self, pair: CalendarPair, tiers: Optional[List[HorizonTier]] = None) -> None:
+        """Remember the change tokens of a pair that synced cleanly.
+        
+        With ``tiers``, only those horizon tiers of the pair were synced.
+        Tokens of calendars this tool wrote to are fetched again; the others
+        are the ones fetched before the calendar was read.
+        """
+        if self.config.force_resync_minutes <= 0:
+            return
+        tokens = {
+            'source': self._change_token(pair.source_calendar),
+            'target': self._change_token(pair.target_calendar),
+            'settings': self._pair_settings(pair),
+            'synced_at': time.time(),
+        }
+        if tiers is None:
+            self.pair_tokens.set(pair.name, tokens)
+            tiers = self.config.tiers_of(pair)
+        for tier in tiers:
+            self.pair_tokens.set(self._token_key(pair, tier), tokens)
+    
+    def _replay_outbox(self) -> None:
+        """Send the journaled writes that did not complete earlier.
+        
+        Deletes are idempotent. A create may have reached the server before
+        the process died, so any copy is deleted first. Updates are not
+        replayed: the event may have been edited since, and the diff of the
+        pair redoes the update if it is still needed, resolving conflicts.
+        Writes to unavailable backends stay pending without using up their
+        attempts, since outages are what the journal is for.
+        """
+        pending = self.outbox.pending()
+        if not pending:
+            return
+        logger.info("Replaying %d unfinished write(s) from the outbox", len(pending))
+        self.counts = Counter()
+        with span("sync.replay", operations=len(pending)):
+            for record in pending:
+                op_id, action, calendar_id = record['id'], record['action'], record['calendar']
+                if not self.backends.resolve(calendar_id)[0].breaker.available():
+                    self.counts["postponed"] += 1
+                    continue
+                try:
+                    if action == "delete":
+                        self._delete_target_event(calendar_id, record['uid'], op_id=op_id)
+                        continue
+                    if action == "update":
+                        logger.debug("Leaving the update of event %s in %s to the diff", record['uid'], calendar_id)
+                        self.outbox.done(op_id)
+                        continue
+                    event = CalendarEvent.from_dict(record['event'])
+                    self._delete_target_event(calendar_id, event.uid, journal=False)
+                    self._create_target_event(calendar_id, event, op_id=op_id)
+                except Exception as e:
+                    if isinstance(e, BackendUnavailable) or is_outage(e):
+                        self.counts["postponed"] += 1
+                        self.log_sampler.log(
+                            logging.WARNING, "Postponed write replay",
+                            "Postponing %s of event %s in %s: %s", action, record['uid'], calendar_id, e
+                        )
+                    elif record['attempts'] + 1 >= MAX_ATTEMPTS:
+                        logger.error("Giving up on %s of event %s in %s: %s",
+                                     action, record['uid'], calendar_id, e)
+                        self.outbox.done(op_id)
+                    else:
+                        self.log_sampler.log(
+                            logging.WARNING, "Failed to replay write",
+                            "Failed to replay %s of event %s in %s: %s", action, record['uid'], calendar_id, e
+                        )
+                        self.outbox.failed(op_id)
+        self.log_sampler.flush()
+        logger.info(
+            "Replayed outbox: %d created, %d deleted, %d postponed",
+            self.counts["created"], self.counts["deleted"], self.counts["postponed"]
+        )
+
+    def _sync_pair(self, pair: CalendarPair) -> PairResult:
+        """Synchronize a single calendar pair."""
+        started = time.perf_counter()
+        self.counts = Counter()
+        tiers = self.config.tiers_of(pair)
+        due = self._due_tiers(pair, tiers) if tiers else []
+        if tiers and not due:
+            logger.debug("Skipping %s: no horizon tier is due", pair.name)
+            return PairResult(pair, True, time.perf_counter() - started, counts={"skipped": 1})
+        # The whole window, left to the backends without tiers, in one pass
+        windows = self._tier_windows(tiers, due) if tiers else [(None, None)]
+        complete = len(due) == len(tiers)
+        with span(
+            "sync.pair",
+            source=pair.source_calendar,
+            target=pair.target_calendar,
+            mode=pair.sync_mode.value,
+            privacy=pair.privacy
+        ) as pair_span:
             try:
-                logger.info(f"Syncing calendars: {pair.source_calendar} -> {pair.target_calendar}")
+                down = self.backends.unavailable([pair.source_calendar, pair.target_calendar])
+                if down:
+                    error = "Unavailable backend(s): " + ", ".join(sorted(backend.name for backend in down))
+                    logger.warning("Skipping %s: %s", pair.name, error)
+                    pair_span.set_error(error)
+                    return PairResult(
+                        pair, False, time.perf_counter() - started, error, unavailable=True
+                    )
+                if complete:
+                    unchanged: List[HorizonTier] = []
+                    skip = self._pair_unchanged(pair)
+                else:
+                    # Tiers whose calendars did not change since they were synced
+                    unchanged = [tier for tier in due if self._pair_unchanged(pair, tier)]
+                    skip = len(unchanged) == len(due)
+                if skip:
+                    logger.info("Skipping %s: neither calendar changed since the last sync", pair.name)
+                    pair_span.set_attribute("skipped", True)
+                    self._mark_tiers_synced(pair, due)
+                    return PairResult(pair, True, time.perf_counter() - started, counts={"skipped": 1})
+                if unchanged:
+                    self._mark_tiers_synced(pair, unchanged)
+                    due = [tier for tier in due if tier not in unchanged]
+                    windows = self._tier_windows(tiers, due)
                 
-                if pair.sync_mode == SyncMode.TWO_WAY:
-                    self._sync_two_way(pair.source_calendar, pair.target_calendar)
-                else:  # ONE_WAY
-                    self._sync_one_way(
-                        pair.source_calendar,
-                        pair.target_calendar,
-                        privacy_mode=pair.privacy
+                if complete:
+                    logger.info("Syncing calendars: %s -> %s", pair.source_calendar, pair.target_calendar)
+                else:
+                    pair_span.set_attribute("tiers", ",".join(str(tier) for tier in due))
+                    logger.info(
+                        "Syncing calendars: %s -> %s (horizon tier(s) %s)", pair.source_calendar,
+                        pair.target_calendar, ", ".join(str(tier) for tier in due)
                     )
                 
-                logger.info("Sync completed successfully")
+                for start, end in windows:
+                    if pair.sync_mode == SyncMode.TWO_WAY:
+                        self._sync_two_way(
+                            pair.source_calendar, pair.target_calendar, start, end, prune=complete
+                        )
+                    else:  # ONE_WAY
+                        self._sync_one_way(
+                            pair.source_calendar,
+                            pair.target_calendar,
+                            privacy_mode=pair.privacy,
+                            start=start,
+                            end=end
+                        )
+                self._mark_tiers_synced(pair, due)
+                
+                if self.counts["diverged"]:
+                    logger.info(
+                        "%d event(s) diverged (%d conflict(s)); wrote each to the stale side only, "
+                        "%d write(s) avoided",
+                        self.counts["diverged"], self.counts["conflicts"], self.counts["writes_avoided"]
+                    )
+                logger.info(
+                    "Sync completed successfully: %d created, %d updated, %d deleted, %d failed",
+                    self.counts["created"], self.counts["updated"],
+                    self.counts["deleted"], self.counts["failed"]
+                )
+                result = PairResult(
+                    pair, True, time.perf_counter() - started, counts=dict(self.counts)
+                )
+                if self.counts["failed"]:
+                    self.forget_tokens(pair)
+                else:
+                    # Tokens of some tiers only vouch for those tiers
+                    self._remember_tokens(pair, None if complete else due)
             except Exception as e:
-                logger.error(f"Failed to sync calendars: {str(e)}")
+                self.forget_tokens(pair)
+                logger.error("Failed to sync calendars: %s", e)
+                pair_span.set_error(str(e))
+                result = PairResult(
+                    pair, False, time.perf_counter() - started, str(e), counts=dict(self.counts),
+                    unavailable=_is_unreachable(e)
+                )
+                if not result.unavailable:
+                    # Retried when due again; unavailable pairs once their backend recovers
+                    self._mark_tiers_synced(pair, due)
+            finally:
+                self.log_sampler.flush()
+            for key, count in self.counts.items():
+                pair_span.set_attribute(key, count)
+        return result
+    
+    def _mark_tiers_synced(self, pair: CalendarPair, tiers: List[HorizonTier]) -> None:
+        """Record that some horizon tiers of a pair were synced in this cycle."""
+        for tier in tiers:
+            self._tiers_synced[(pair.name, tier)] = self._cycle_clock
     
+    def _new_index(self) -> DiffIndex:
+        """Create the index used to diff the events of a pair."""
+        return DiffIndex(spill_threshold=self.config.event_spill_threshold or None)
+
     def _sync_one_way(
         self,
         source_calendar: str,
         target_calendar: str,
-        privacy_mode: bool = False
+        privacy_mode: bool = False,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
     ) -> None:
-        """Perform one-way synchronization between calendars."""
-        # Get events from source calendar
-        source_events = self._get_source_events(source_calendar)
+        """Perform one-way synchronization between calendars.
         
-        # For Google and Kerio calendars in privacy mode, perform a full deletion of busy events in the sync period
-        if privacy_mode and (target_calendar.endswith("@google") or target_calendar.endswith("@kerio")):
-            from datetime import datetime, timedelta
-            now = datetime.utcnow()
-            sync_end = now + timedelta(days=30)
-            if target_calendar.endswith("@google"):
-                if not hasattr(self, 'google'):
-                    from .google_calendar_client import GoogleCalendarClient
-                    self.google = GoogleCalendarClient()
-                real_calendar_id = target_calendar[:-7].strip()
-                existing_events = self.google.list_events(real_calendar_id, start=now, end=sync_end)
-                for event in existing_events:
-                    if event.summary == self.privacy_handler.title:
-                        try:
-                            self.google.delete_event(real_calendar_id, event.uid)
-                            logger.info(f"Deleted busy event {event.uid} from Google during sync cleanup.")
-                        except Exception as e:
-                            if hasattr(e, 'resp') and e.resp.status == 404:
-                                logger.info(f"Busy event {event.uid} already deleted (404).")
-                            else:
-                                logger.error(f"Failed to delete busy event {event.uid}: {e}")
-                target_events = []
-            elif target_calendar.endswith("@kerio"):
-                real_calendar_id = target_calendar.replace("@kerio", "").strip()
-                existing_events = self.kerio.list_events(real_calendar_id, start=now, end=sync_end)
-                for event in existing_events:
-                    if event.summary == self.privacy_handler.title:
-                        try:
-                            self.kerio.delete_event(real_calendar_id, event.uid)
-                            logger.info(f"Deleted busy event {event.uid} from Kerio during sync cleanup.")
-                        except Exception as e:
-                            if "not subscriptable" in str(e):
-                                logger.info(f"Busy event {event.uid} already deleted or not deletable (non subscriptable error).")
-                            else:
-                                logger.error(f"Failed to delete busy event {event.uid} on Kerio: {e}")
-                target_events = []
-        else:
-            target_events = self._get_target_events(target_calendar)
+        Only events overlapping ``start`` to ``end`` are read and reconciled;
+        without them the backend's default sync window is used.
+        """
+        if privacy_mode:
+            if self.config.privacy_coalesce:
+                self._sync_busy_blocks(source_calendar, target_calendar, start, end)
+            else:
+                self._sync_busy_events(source_calendar, target_calendar, start, end)
+            return
         
-        # Create sets of event UIDs for comparison (for non-Google or non-privacy or after deletion)
-        source_uids = {event.uid for event in source_events}
-        target_uids = {event.uid for event in target_events}
-        privacy_uids = {
-            self.privacy_handler.get_source_uid(event)
-            for event in target_events
-            if self.privacy_handler.is_privacy_event(event)
-        }
+        with self._new_index() as index:
+            index.add_all(SOURCE, self._get_source_events(source_calendar, start, end))
+            index.add_all(TARGET, self._get_target_events(target_calendar, start, end))
+            
+            with span("sync.reconcile", source=source_calendar, target=target_calendar):
+                for source_event in index.only_in(SOURCE):
+                    try:
+                        # Skip events with missing start or end time
+                        if source_event.start is None or source_event.end is None:
+                            self.log_sampler.log(
+                                logging.ERROR, "Skipped events without start or end",
+                                "Skipping event %s due to missing start or end time", source_event.uid
+                            )
+                            continue
+                        self._create_target_event(target_calendar, source_event)
+                    except Exception as e:
+                        if _is_unreachable(e):
+                            raise
+                        self.counts["failed"] += 1
+                        self.log_sampler.log(
+                            logging.ERROR, "Failed to sync event",
+                            "Failed to sync event %s: %s", source_event.uid, e
+                        )
+                
+                # Remove obsolete events from target
+                for target_event in index.only_in(TARGET):
+                    if (target_calendar, str(target_event.uid)) in self._kept_duplicates:
+                        continue
+                    try:
+                        self._delete_target_event(target_calendar, target_event.uid)
+                    except Exception as e:
+                        if _is_unreachable(e):
+                            raise
+                        self.counts["failed"] += 1
+                        self.log_sampler.log(
+                            logging.ERROR, "Failed to clean up event",
+                            "Failed to clean up event %s: %s", target_event.uid, e
+                        )
+
+    def _sync_busy_events(
+        self,
+        source_calendar: str,
+        target_calendar: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> None:
+        """Mirror every source event as a busy event.
         
-        # Process each source event: in privacy mode, always create a new busy event since we've wiped old ones
-        for source_event in source_events:
-            try:
-                # Skip events with missing start or end time
-                if source_event.start is None or source_event.end is None:
-                    logger.error(f"Skipping event {source_event.uid} due to missing start or end time")
+        The events are not keyed by UID, so each occurrence of an expanded
+        recurring event gets its own busy event. Targets whose backend needs
+        it have all busy events of the range wiped and created again; on
+        others busy events are written in place and those whose source event
+        is gone are deleted. Busy events pass through the diff index, so
+        large calendars spill to disk instead of being held in memory.
+        """
+        source_uids: Set[str] = set()
+        
+        def busy_events() -> Iterable[CalendarEvent]:
+            for event in self._get_source_events(source_calendar, start, end, busy_only=True):
+                source_uids.add(str(event.uid))
+                if event.start is None or event.end is None:
+                    self.log_sampler.log(
+                        logging.ERROR, "Skipped events without start or end",
+                        "Skipping event %s due to missing start or end time", event.uid
+                    )
                     continue
+                yield self.privacy_handler.create_private_event(
+                    start=event.start,
+                    end=event.end,
+                    source_uid=event.uid,
+                    is_all_day=event.is_all_day
+                )
+        
+        target_backend, _ = self.backends.resolve(target_calendar)
+        with self._new_index() as index:
+            creates: Iterable[Tuple[CalendarEvent, Optional[int]]]
+            if target_backend.wipe_privacy_events:
+                index.add_all(SOURCE, busy_events(), key=_occurrence_key)
+                # Journal the busy events first, so that a crash after the
+                # wipe is repaired by replaying the outbox on restart
+                op_ids: List[int] = []
+                for batch in _batches(index.events(SOURCE), PLAN_BATCH_SIZE):
+                    op_ids.extend(self.outbox.plan_many("create", target_calendar, batch))
+                self._delete_busy_events(target_calendar, start, end)
+                creates = zip(index.events(SOURCE), op_ids)
+            else:
+                index.add_all(TARGET, (
+                    event for event in self._get_target_events(target_calendar, start, end)
+                    if self.privacy_handler.is_privacy_event(event)
+                ), key=_occurrence_key)
+                creates = ((busy_event, None) for busy_event in busy_events())
+            
+            with span("sync.reconcile", source=source_calendar, target=target_calendar):
+                for busy_event, op_id in creates:
+                    try:
+                        self._create_target_event(target_calendar, busy_event, op_id=op_id)
+                    except Exception as e:
+                        if _is_unreachable(e):
+                            raise
+                        self.counts["failed"] += 1
+                        self.log_sampler.log(
+                            logging.ERROR, "Failed to sync event",
+                            "Failed to sync event %s: %s", busy_event.uid, e
+                        )
+                
+                # Remove busy events whose source event is gone (nothing is left after a wipe)
+                for target_event in index.events(TARGET):
+                    if self.privacy_handler.get_source_uid(target_event) in source_uids:
+                        continue
+                    try:
+                        self._delete_target_event(target_calendar, target_event.uid)
+                    except Exception as e:
+                        if _is_unreachable(e):
+                            raise
+                        self.counts["failed"] += 1
+                        self.log_sampler.log(
+                            logging.ERROR, "Failed to clean up event",
+                            "Failed to clean up event %s: %s", target_event.uid, e
+                        )
 
-                if privacy_mode:
-                    # Create new privacy (busy) event for each source event
-                    privacy_event = self.privacy_handler.create_private_event(
-                        start=source_event.start,
-                        end=source_event.end,
-                        source_uid=source_event.uid,
-                        is_all_day=source_event.is_all_day
+    def _sync_busy_blocks(
+        self,
+        source_calendar: str,
+        target_calendar: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> None:
+        """Mirror the source calendar as coalesced busy blocks.
+        
+        Blocks have stable UIDs, so only blocks that appeared are created
+        and only busy events that no longer match a block are deleted.
+        """
+        source_count = 0
+        
+        def timed_events() -> Iterable[CalendarEvent]:
+            nonlocal source_count
+            for event in self._get_source_events(source_calendar, start, end, busy_only=True):
+                if event.start is None or event.end is None:
+                    self.log_sampler.log(
+                        logging.ERROR, "Skipped events without start or end",
+                        "Skipping event %s due to missing start or end time", event.uid
                     )
-                    self._create_target_event(target_calendar, privacy_event)
-                else:
-                    if source_event.uid not in target_uids:
-                        # Create new event with full details
-                        self._create_target_event(target_calendar, source_event)
-            except Exception as e:
-                logger.error(f"Failed to sync event {source_event.uid}: {str(e)}")
+                    continue
+                source_count += 1
+                yield event
         
-        # For non-Google or non-privacy mode, remove obsolete events from target
-        if not (privacy_mode and target_calendar.endswith("@google")):
-            for target_event in target_events:
-                try:
-                    if privacy_mode and self.privacy_handler.is_privacy_event(target_event):
-                        source_uid = self.privacy_handler.get_source_uid(target_event)
-                        if source_uid not in source_uids:
-                            self._delete_target_event(target_calendar, target_event.uid)
-                    elif not privacy_mode and target_event.uid not in source_uids:
+        blocks = self.privacy_handler.coalesce(
+            timed_events(), timedelta(minutes=self.config.privacy_coalesce_gap_minutes)
+        )
+        logger.debug("Coalesced %d source event(s) into %d busy block(s)", source_count, len(blocks))
+        
+        with self._new_index() as index:
+            index.add_all(SOURCE, blocks)
+            index.add_all(TARGET, (
+                event for event in self._get_target_events(target_calendar, start, end)
+                if self.privacy_handler.is_privacy_event(event)
+                or event.summary == self.privacy_handler.title
+            ))
+            
+            with span(
+                "sync.reconcile", source=source_calendar, target=target_calendar, blocks=len(blocks)
+            ):
+                for block in index.only_in(SOURCE):
+                    try:
+                        self._create_target_event(target_calendar, block)
+                    except Exception as e:
+                        if _is_unreachable(e):
+                            raise
+                        self.counts["failed"] += 1
+                        self.log_sampler.log(
+                            logging.ERROR, "Failed to sync event",
+                            "Failed to sync event %s: %s", block.uid, e
+                        )
+                for target_event in index.only_in(TARGET):
+                    try:
                         self._delete_target_event(target_calendar, target_event.uid)
-                except Exception as e:
-                    logger.error(f"Failed to clean up event {target_event.uid}: {str(e)}")
+                    except Exception as e:
+                        if _is_unreachable(e):
+                            raise
+                        self.counts["failed"] += 1
+                        self.log_sampler.log(
+                            logging.ERROR, "Failed to clean up event",
+                            "Failed to clean up event %s: %s", target_event.uid, e
+                        )
+    
+    def _delete_busy_events(
+        self,
+        target_calendar: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> None:
+        """Delete all busy events of a calendar in a time range, by default the next 30 days."""
+        if start is None:
+            start = datetime.now(timezone.utc)
+        if end is None:
+            end = start + timedelta(days=30)
+        # Collect the UIDs first so deleting does not disturb paging
+        busy_uids = [
+            event.uid
+            for event in self._get_target_events(target_calendar, start=start, end=end)
+            if event.summary == self.privacy_handler.title
+        ]
+        backend, real_calendar_id = self.backends.resolve(target_calendar)
+        if busy_uids:
+            self._invalidate_reads(target_calendar)
+        for uid in busy_uids:
+            try:
+                backend.delete_event(real_calendar_id, uid)
+                self.duplicates.remove(target_calendar, uid)
+                self.counts["deleted"] += 1
+                logger.debug("Deleted busy event %s from %s during sync cleanup.", uid, target_calendar)
+            except Exception as e:
+                if _is_unreachable(e):
+                    raise
+                if _is_not_found(e):
+                    self.log_sampler.log(
+                        logging.INFO, "Busy event already deleted",
+                        "Busy event %s already deleted.", uid
+                    )
+                else:
+                    self.counts["failed"] += 1
+                    self.log_sampler.log(
+                        logging.ERROR, "Failed to delete busy event",
+                        "Failed to delete busy event %s: %s", uid, e
+                    )
     
     def _sync_two_way(
         self,
         calendar1: str,
-        calendar2: str
+        calendar2: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        prune: bool = True
     ) -> None:
-        """Perform two-way synchronization between calendars."""
-        # Get events from both calendars
-        events1 = self._get_source_events(calendar1)
-        events2 = self._get_source_events(calendar2)
+        """Perform two-way synchronization between calendars.
         
-        # Create dictionaries for easy lookup
-        events1_dict = {event.uid: event for event in events1}
-        events2_dict = {event.uid: event for event in events2}
+        With ``prune``, the state of events not seen is forgotten, which is
+        only right if the range covers the whole sync window.
+        """
+        state = self._pair_state(calendar1, calendar2)
+        seen: Set[str] = set()
+        with self._new_index() as index:
+            # Get events from both calendars, skipping privacy events in two-way sync
+            for side, calendar_id in ((SOURCE, calendar1), (TARGET, calendar2)):
+                index.add_all(side, (
+                    event for event in self._get_source_events(calendar_id, start, end)
+                    if not self.privacy_handler.is_privacy_event(event)
+                    and event.summary != self.privacy_handler.title
+                ))
+            
+            with span("sync.reconcile", source=calendar1, target=calendar2):
+                # Create events missing on either side
+                for side, target in ((SOURCE, calendar2), (TARGET, calendar1)):
+                    for event in index.only_in(side):
+                        seen.add(str(event.uid))
+                        try:
+                            self._create_target_event(target, event)
+                            state.set(str(event.uid), event.content_hash())
+                        except Exception as e:
+                            if _is_unreachable(e):
+                                raise
+                            self.counts["failed"] += 1
+                            self.log_sampler.log(
+                                logging.ERROR, f"Failed to sync event to {target}",
+                                "Failed to sync event %s to %s: %s", event.uid, target, e
+                            )
+                
+                # Write each diverged event once, to the stale side
+                for event1, event2 in index.common():
+                    uid = str(event1.uid)
+                    seen.add(uid)
+                    hash1, hash2 = event1.content_hash(), event2.content_hash()
+                    if hash1 == hash2:
+                        state.set(uid, hash1)
+                        continue
+                    self.counts["diverged"] += 1
+                    if self._resolve_conflict(event1, event2, hash1, hash2, state.get(uid)) == SOURCE:
+                        event, target, winning_hash = event1, calendar2, hash1
+                    else:
+                        event, target, winning_hash = event2, calendar1, hash2
+                    try:
+                        self._update_target_event(target, event)
+                        # The up-to-date side is left alone
+                        self.counts["writes_avoided"] += 1
+                        state.set(uid, winning_hash)
+                    except Exception as e:
+                        if _is_unreachable(e):
+                            raise
+                        self.counts["failed"] += 1
+                        self.log_sampler.log(
+                            logging.ERROR, f"Failed to sync event to {target}",
+                            "Failed to sync event %s to %s: %s", uid, target, e
+                        )
         
-        # Skip privacy events in two-way sync
-        events1_dict = {uid: event for uid, event in events1_dict.items() if not self.privacy_handler.is_privacy_event(event) and event.summary != self.privacy_handler.title}
-        events2_dict = {uid: event for uid, event in events2_dict.items() if not self.privacy_handler.is_privacy_event(event) and event.summary != self.privacy_handler.title}
+        # Forget events that left both calendars or the sync window
+        if prune:
+            for uid in state:
+                if uid not in seen:
+                    state.pop(uid)
+        state.save()
+    
+    def _pair_state(self, calendar1: str, calendar2: str) -> JsonStore:
+        """Get the last synced content hashes of a two-way pair."""
+        name = re.sub(r'[^A-Za-z0-9._-]+', '_', f"{calendar1}:{calendar2}")
+        if name not in self._pair_states:
+            self._pair_states[name] = JsonStore(self.config.state_path(f"two_way_{name}.json"))
+        return self._pair_states[name]
+    
+    def _resolve_conflict(
+        self,
+        event1: CalendarEvent,
+        event2: CalendarEvent,
+        hash1: str,
+        hash2: str,
+        synced_hash: Optional[str]
+    ) -> int:
+        """Decide which side's version of a diverged event wins.
         
-        # Sync calendar1 -> calendar2
-        for uid, event in events1_dict.items():
-            try:
-                if uid not in events2_dict:
-                    self._create_target_event(calendar2, event)
-                else:
-                    # Compare events and update if needed
-                    event2 = events2_dict[uid]
-                    if (event.summary != event2.summary or
-                        event.start != event2.start or
-                        event.end != event2.end or
-                        event.description != event2.description or
-                        event.location != event2.location or
-                        event.is_all_day != event2.is_all_day):
-                        self._update_target_event(calendar2, event)
-            except Exception as e:
-                logger.error(f"Failed to sync event {uid} to calendar2: {str(e)}")
+        A side still matching the last synced content is stale. If both
+        sides changed, or the event was never synced, the higher SEQUENCE
+        and then the later LAST-MODIFIED/DTSTAMP wins, calendar1 on a tie.
+        """
+        if synced_hash == hash2:
+            return SOURCE
+        if synced_hash == hash1:
+            return TARGET
+        if synced_hash is not None:
+            self.counts["conflicts"] += 1
+        return TARGET if event2.version() > event1.version() else SOURCE
+    
+    def _fetch_events(
+        self,
+        backend: Backend,
+        calendar_id: str,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        busy_only: bool = False
+    ) -> Iterable[CalendarEvent]:
+        """Fetch events from a backend, streaming them if configured and supported.
         
-        # Sync calendar2 -> calendar1
-        for uid, event in events2_dict.items():
-            try:
-                if uid not in events1_dict:
-                    self._create_target_event(calendar1, event)
-                else:
-                    # Compare events and update if needed
-                    event1 = events1_dict[uid]
-                    if (event.summary != event1.summary or
-                        event.start != event1.start or
-                        event.end != event1.end or
-                        event.description != event1.description or
-                        event.location != event1.location or
-                        event.is_all_day != event1.is_all_day):
-                        self._update_target_event(calendar1, event)
-            except Exception as e:
-                logger.error(f"Failed to sync event {uid} to calendar1: {str(e)}")
+        With ``busy_only`` only the times and UIDs of the events are needed,
+        which backends that support it fetch without the event details.
+        """
+        if busy_only and backend.supports(Capability.FREE_BUSY):
+            return backend.list_busy_events(calendar_id, start=start, end=end)
+        if self.config.stream_events and backend.supports(Capability.STREAMING):
+            return backend.iter_events(calendar_id, start=start, end=end)
+        return backend.list_events(calendar_id, start=start, end=end)
+    
+    def _read_events(
+        self,
+        calendar_id: str,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        busy_only: bool = False
+    ) -> Iterable[CalendarEvent]:
+        """Fetch events, reusing what was read earlier in this cycle.
+        
+        Only calendars used by more than one pair of the cycle are kept,
+        and they are dropped as soon as this tool writes to them. Full
+        events also serve reads that only need busy times.
+        """
+        backend, real_id = self.backends.resolve(calendar_id)
+        if calendar_id not in self._shared_calendars:
+            return self._index_duplicates(
+                calendar_id, self._fetch_events(backend, real_id, start, end, busy_only), busy_only
+            )
+        key = (calendar_id, start, end)
+        events = self._read_cache.get(key + (False,))
+        if events is None and busy_only:
+            events = self._read_cache.get(key + (True,))
+        if events is None:
+            events = list(self._fetch_events(backend, real_id, start, end, busy_only))
+            self._read_cache[key + (busy_only,)] = events
+        else:
+            logger.debug("Reusing %d event(s) of %s read earlier in this cycle", len(events), calendar_id)
+        return self._index_duplicates(calendar_id, events, busy_only)
+    
+    def _index_duplicates(
+        self,
+        calendar_id: str,
+        events: Iterable[CalendarEvent],
+        busy_only: bool
+    ) -> Iterable[CalendarEvent]:
+        """Fingerprint the events of a calendar this cycle writes to as they are read."""
+        if busy_only or calendar_id not in self._write_targets:
+            return events
+        
+        def indexed() -> Iterable[CalendarEvent]:
+            for event in events:
+                self.duplicates.add(calendar_id, event)
+                yield event
+        return indexed()
+    
+    def _is_duplicate(self, calendar_id: str, event: CalendarEvent) -> bool:
+        """Check an event about to be created against the events of its target.
+        
+        Suspected duplicates are logged, and with the suppress policy not
+        created. Returns whether the event should be skipped.
+        """
+        if calendar_id not in self._write_targets:
+            return False
+        duplicate_uid = self.duplicates.find(calendar_id, event)
+        if duplicate_uid is None:
+            return False
+        self.counts["duplicates"] += 1
+        suppress = self.config.duplicate_policy == DuplicatePolicy.SUPPRESS
+        self.log_sampler.log(
+            logging.WARNING, "Suspected duplicate events",
+            "Event %s looks like a duplicate of %s in %s%s",
+            event.uid, duplicate_uid, calendar_id, ", not creating it" if suppress else ""
+        )
+        if suppress:
+            self._kept_duplicates.add((calendar_id, duplicate_uid))
+        return suppress
+    
+    def _invalidate_reads(self, calendar_id: str) -> None:
+        """Forget the events read from a calendar this cycle, before writing to it."""
+        self._tokens.pop(calendar_id, None)
+        for key in [key for key in self._read_cache if key[0] == calendar_id]:
+            del self._read_cache[key]
     
     def _get_source_events(
         self,
         calendar_id: str,
         start: Optional[datetime] = None,
-        end: Optional[datetime] = None
-    ) -> List[CalendarEvent]:
+        end: Optional[datetime] = None,
+        busy_only: bool = False
+    ) -> Iterable[CalendarEvent]:
         """Get events from the source calendar."""
-        if "@nextcloud" in calendar_id:
-            return self.nextcloud.list_events(
-                calendar_id.replace("@nextcloud", ""),
-                start=start,
-                end=end
-            )
-        else:
-            return self.kerio.list_events(
-                calendar_id.replace("@kerio", ""),
-                start=start,
-                end=end
-            )
+        return self._read_events(calendar_id, start, end, busy_only)
     
     def _get_target_events(
         self,
         calendar_id: str,
         start: Optional[datetime] = None,
         end: Optional[datetime] = None
-    ) -> List[CalendarEvent]:
+    ) -> Iterable[CalendarEvent]:
         """Get events from the target calendar."""
-        if "@nextcloud" in calendar_id:
-            return self.nextcloud.list_events(
-                calendar_id.replace("@nextcloud", ""), start, end
-            )
-        elif "@kerio" in calendar_id:
-            return self.kerio.list_events(
-                calendar_id.replace("@kerio", ""), start, end
-            )
-        elif "@google" in calendar_id:
-            if not hasattr(self, 'google'):
-                from .google_calendar_client import GoogleCalendarClient
-                self.google = GoogleCalendarClient()
-            return self.google.list_events(
-                calendar_id.replace("@google", "").strip(), start, end
-            )
-        else:
-            raise ValueError(f"Unsupported calendar identifier: {calendar_id}")
+        return self._read_events(calendar_id, start, end)
     
     def _create_target_event(
         self,
         calendar_id: str,
-        event: CalendarEvent
+        event: CalendarEvent,
+        op_id: Optional[int] = None
     ) -> None:
-        """Create an event in the target calendar for Nextcloud, Google, or Kerio."""
-        if "@nextcloud" in calendar_id:
-            target = self.nextcloud
-            real_id = calendar_id.replace("@nextcloud", "")
-        elif "@kerio" in calendar_id:
-            target = self.kerio
-            real_id = calendar_id.replace("@kerio", "")
-        elif calendar_id.endswith("@google"):
-            if not hasattr(self, 'google'):
-                from .google_calendar_client import GoogleCalendarClient
-                self.google = GoogleCalendarClient()
-            target = self.google
-            real_id = calendar_id[:-7].strip()
-        else:
-            raise ValueError(f"Unsupported calendar identifier: {calendar_id}")
+        """Create an event in the target calendar.
+        
+        The write is journaled in the outbox unless ``op_id`` names a
+        journal record planned earlier. Suspected duplicates of events
+        already in the calendar are skipped with the suppress policy.
+        """
+        if self._is_duplicate(calendar_id, event):
+            if op_id is not None:
+                self.outbox.done(op_id)
+            return
+        if op_id is None:
+            op_id = self.outbox.plan("create", calendar_id, event=event)
+        target, real_id = self.backends.resolve(calendar_id)
+        self._invalidate_reads(calendar_id)
         target.create_event(real_id, event)
+        self._observe_write(calendar_id, event)
+        self.counts["created"] += 1
+        self.outbox.done(op_id)
+    
+    def _observe_write(self, calendar_id: str, event: CalendarEvent) -> None:
+        """Keep the fingerprints of a calendar current after writing an event to it."""
+        if calendar_id in self._write_targets:
+            self.duplicates.add(calendar_id, event)
     
     def _update_target_event(
         self,
         calendar_id: str,
-        event: CalendarEvent
+        event: CalendarEvent,
+        op_id: Optional[int] = None
     ) -> None:
-        """Update an event in the target calendar for Nextcloud, Google, or Kerio."""
-        if "@nextcloud" in calendar_id:
-            target = self.nextcloud
-            real_id = calendar_id.replace("@nextcloud", "")
-        elif "@kerio" in calendar_id:
-            target = self.kerio
-            real_id = calendar_id.replace("@kerio", "")
-        elif calendar_id.endswith("@google"):
-            if not hasattr(self, 'google'):
-                from .google_calendar_client import GoogleCalendarClient
-                self.google = GoogleCalendarClient()
-            target = self.google
-            real_id = calendar_id[:-7].strip()
-        else:
-            raise ValueError(f"Unsupported calendar identifier: {calendar_id}")
+        """Update an event in the target calendar."""
+        if op_id is None:
+            op_id = self.outbox.plan("update", calendar_id, event=event)
+        target, real_id = self.backends.resolve(calendar_id)
+        self._invalidate_reads(calendar_id)
         target.update_event(real_id, event)
+        self._observe_write(calendar_id, event)
+        self.counts["updated"] += 1
+        self.outbox.done(op_id)
     
     def _delete_target_event(
         self,
         calendar_id: str,
-        event_uid: str
+        event_uid: str,
+        op_id: Optional[int] = None,
+        journal: bool = True
     ) -> None:
-        """Delete an event from the target calendar for Nextcloud, Google, or Kerio."""
-        if "@nextcloud" in calendar_id:
-            self.nextcloud.delete_event(
-                calendar_id.replace("@nextcloud", ""),
-                event_uid
-            )
-        elif "@kerio" in calendar_id:
-            self.kerio.delete_event(
-                calendar_id.replace("@kerio", ""),
-                event_uid
-            )
-        elif calendar_id.endswith("@google"):
-            if not hasattr(self, 'google'):
-                from .google_calendar_client import GoogleCalendarClient
-                self.google = GoogleCalendarClient()
-            target = self.google
-            real_id = calendar_id[:-7].strip()
-            target.delete_event(real_id, event_uid) 
\ No newline at end of file
+        """Delete an event from the target calendar.
+        
+        An event that is already gone counts as deleted, so that deletes
+        can be replayed. Without ``journal`` the delete is not recorded in
+        the outbox, for deletes that are part of a journaled write.
+        """
+        if op_id is None and journal:
+            op_id = self.outbox.plan("delete", calendar_id, uid=event_uid)
+        target, real_id = self.backends.resolve(calendar_id)
+        self._invalidate_reads(calendar_id)
+        self.duplicates.remove(calendar_id, event_uid)
+        try:
+            target.delete_event(real_id, event_uid)
+            self.counts["deleted"] += 1
+        except Exception as e:
+            if not _is_not_found(e):
+                raise
+            logger.debug("Event %s was already deleted from %s", event_uid, calendar_id)
+        if op_id is not None:
+            self.outbox.done(op_id)
+
+
+def _occurrence_key(event: CalendarEvent) -> str:
+    """Key an event by UID and start, since occurrences share their UID."""
+    return f"{event.uid}|{event.start.isoformat() if event.start else ''}"
+
+
+def _batches(events: Iterable[CalendarEvent], size: int) -> Iterator[List[CalendarEvent]]:
+    """Split events into lists of at most ``size``."""
+    batch: List[CalendarEvent] = []
+    for event in events:
+        batch.append(event)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _is_unreachable(error: Exception) -> bool:
+    """Check whether a write failed because its backend is down.
+
+    Such errors fail the whole pair instead of a single event, so the pair
+    is reported unavailable and its remaining writes are not attempted.
+    """
+    return isinstance(error, BackendUnavailable) or is_outage(error)
+
+
+def _is_not_found(error: Exception) -> bool:
+    """Check whether a backend error means that the event does not exist."""
+    from caldav.lib.error import NotFoundError
+    
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    return status in (404, 410) or isinstance(error, NotFoundError)
@@ -0,0 +1,62 @@
+"""Timing helpers for startup and sync phase breakdowns."""
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+
+def process_uptime() -> Optional[float]:
+    """Get the seconds since the current process was started.
+
+    Only available where ``/proc`` exists; returns None elsewhere.
+    """
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            # The command name may contain spaces, so split after it
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime', 'r') as f:
+            system_uptime = float(f.read().split()[0])
+        started_ticks = int(fields[19])
+        return system_uptime - started_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class PhaseTimer:
+    """Collects wall-clock durations of named phases."""
+
+    def __init__(self):
+        """Initialize the timer, counting the interpreter startup if known."""
+        self.phases: List[Tuple[str, float]] = []
+        uptime = process_uptime()
+        if uptime is not None:
+            self.phases.append(("process startup", max(uptime, 0.0)))
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as a named phase."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name: str, duration: float) -> None:
+        """Record a phase that was timed elsewhere."""
+        self.phases.append((name, duration))
+
+    def total(self) -> float:
+        """Get the summed duration of all recorded phases."""
+        return sum(duration for _, duration in self.phases)
+
+    def format_table(self) -> str:
+        """Format the recorded phases as a plain text table."""
+        total = self.total()
+        width = max([len(name) for name, _ in self.phases] + [len("total")])
+        lines = [f"{'phase':<{width}}  {'seconds':>9}  {'share':>6}"]
+        for name, duration in self.phases:
+            share = duration / total * 100 if total else 0.0
+            lines.append(f"{name:<{width}}  {duration:>9.3f}  {share:>5.1f}%")
+        lines.append(f"{'total':<{width}}  {total:>9.3f}")
+        return "\n".join(lines)
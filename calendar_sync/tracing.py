@@ -0,0 +1,286 @@
+"""Lightweight tracing of sync cycles, backend calls and parsing.
+
+Spans are kept in memory and exported in batches using the OTLP/JSON
+encoding, either appended to a local file (one export request per line,
+like the OpenTelemetry file exporter) or posted to an OTLP/HTTP collector.
+Tracing is disabled until ``configure_tracing`` is called, in which case
+``span`` costs next to nothing.
+"""
+
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "calendar-sync"
+# Export once this many spans are buffered, even inside a running trace
+MAX_BUFFERED_SPANS = 512
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "calendar_sync_current_span", default=None
+)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    """Encode an attribute value as an OTLP AnyValue."""
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Encode attributes as a list of OTLP KeyValues."""
+    return [
+        {'key': key, 'value': _otlp_value(value)}
+        for key, value in attributes.items()
+        if value is not None
+    ]
+
+
+class Span:
+    """A timed operation with attributes."""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        """Start a span."""
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        """Get the duration of the span in seconds."""
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e9
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Set an attribute of the span."""
+        self.attributes[key] = value
+
+    def add(self, key: str, amount: float = 1) -> None:
+        """Add to a numeric attribute of the span."""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def set_error(self, message: str) -> None:
+        """Mark the span as failed without raising through it."""
+        self.error = message
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Encode the span as an OTLP/JSON span."""
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,  # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': _otlp_attributes(self.attributes),
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """Stand-in used while tracing is disabled."""
+    duration = 0.0
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def add(self, key: str, amount: float = 1) -> None:
+        pass
+
+    def set_error(self, message: str) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class FileSpanExporter:
+    """Append OTLP/JSON export requests to a local file, one per line."""
+
+    def __init__(self, path: str):
+        """Initialize the exporter."""
+        self.path = path
+
+    def export(self, request: Dict[str, Any]) -> None:
+        """Write one export request."""
+        line = (json.dumps(request, separators=(',', ':')) + "\n").encode('utf-8')
+        # A single append keeps lines of concurrent processes intact
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+class OTLPHttpExporter:
+    """Post OTLP/JSON export requests to an OTLP/HTTP collector."""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        """Initialize the exporter for a collector base URL."""
+        endpoint = endpoint.rstrip('/')
+        self.url = endpoint if endpoint.endswith('/v1/traces') else endpoint + '/v1/traces'
+        self.timeout = timeout
+
+    def export(self, request: Dict[str, Any]) -> None:
+        """Send one export request."""
+        import requests
+
+        response = requests.post(self.url, json=request, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class Tracer:
+    """Creates spans and exports finished ones in batches."""
+
+    def __init__(self, exporters: Optional[List[Any]] = None):
+        """Initialize the tracer; without exporters or listeners it is disabled."""
+        self.exporters = exporters or []
+        # Called with every finished span, e.g. by the profiler
+        self.listeners: List[Callable[[Span], None]] = []
+        self._buffer: List[Span] = []
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether spans are recorded."""
+        return bool(self.exporters or self.listeners)
+
+    def add_listener(self, listener: Callable[[Span], None]) -> None:
+        """Call a function with every span as it finishes."""
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Span], None]) -> None:
+        """Stop calling a function added with ``add_listener``."""
+        self.listeners.remove(listener)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Any]:
+        """Record the enclosed block as a span, nested in the current one."""
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+        parent = _current_span.get()
+        span = Span(
+            name,
+            parent.trace_id if parent else os.urandom(16).hex(),
+            parent.span_id if parent else None,
+            attributes
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self._finish(span, is_root=parent is None)
+
+    def _finish(self, span: Span, is_root: bool) -> None:
+        """Buffer a finished span and export when a trace completes."""
+        for listener in list(self.listeners):
+            try:
+                listener(span)
+            except Exception as e:
+                logger.warning("Span listener %r failed: %s", listener, e)
+        if not self.exporters:
+            return
+        with self._lock:
+            self._buffer.append(span)
+            if not is_root and len(self._buffer) < MAX_BUFFERED_SPANS:
+                return
+            spans, self._buffer = self._buffer, []
+        self._export(spans)
+
+    def _export(self, spans: List[Span]) -> None:
+        """Send spans to every exporter."""
+        request = {
+            'resourceSpans': [{
+                'resource': {'attributes': _otlp_attributes({
+                    'service.name': SERVICE_NAME,
+                    'process.pid': os.getpid(),
+                })},
+                'scopeSpans': [{
+                    'scope': {'name': 'calendar_sync'},
+                    'spans': [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+        for exporter in self.exporters:
+            try:
+                exporter.export(request)
+            except Exception as e:
+                logger.warning("Failed to export %d span(s) with %s: %s",
+                               len(spans), type(exporter).__name__, e)
+
+    def flush(self) -> None:
+        """Export all buffered spans."""
+        with self._lock:
+            spans, self._buffer = self._buffer, []
+        if spans:
+            self._export(spans)
+
+
+tracer = Tracer()
+atexit.register(tracer.flush)
+
+
+def configure_tracing(trace_file: Optional[str] = None, endpoint: Optional[str] = None) -> None:
+    """Enable tracing to a local file and/or an OTLP/HTTP collector."""
+    exporters: List[Any] = []
+    if trace_file:
+        exporters.append(FileSpanExporter(trace_file))
+    if endpoint:
+        exporters.append(OTLPHttpExporter(endpoint))
+    tracer.flush()
+    tracer.exporters = exporters
+
+
+def span(name: str, **attributes: Any):
+    """Record the enclosed block as a span of the global tracer."""
+    return tracer.span(name, **attributes)
+
+
+def current_span() -> Any:
+    """Get the innermost active span, or a no-op span."""
+    return _current_span.get() or _NOOP_SPAN
+
+
+def traced(name: str, **attributes: Any) -> Callable:
+    """Record every call of a client method as a span.
+
+    The first argument after ``self`` is recorded as the ``calendar``
+    attribute, since all client methods take the calendar id first.
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(self, *args: Any, **kwargs: Any) -> Any:
+            if not tracer.enabled:
+                return func(self, *args, **kwargs)
+            calendar = args[0] if args else kwargs.get('calendar_id')
+            with tracer.span(name, calendar=calendar, **attributes):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
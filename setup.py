@@ -36,6 +36,9 @@ setup(
         "pytz==2023.3",
         "python-dateutil==2.8.2",
     ],
+    extras_require={
+        "fast": ["numpy>=1.22"],
+    },
     entry_points={
         "console_scripts": [
             "r2-sync=calendar_sync.__main__:main",
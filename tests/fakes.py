@@ -0,0 +1,100 @@
+"""In-memory calendar clients and helpers for testing the sync engine."""
+
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from calendar_sync.config import Config
+from calendar_sync.events import CalendarEvent
+from calendar_sync.sync_manager import SyncManager
+
+# Inside the default sync window of the tests
+BASE = datetime.now(timezone.utc).replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+
+def make_event(
+    uid: str,
+    summary: str = "Meeting",
+    start: Optional[datetime] = None,
+    hours: float = 1,
+    **fields
+) -> CalendarEvent:
+    """Create a timed event, by default tomorrow at 09:00 UTC."""
+    start = start or BASE
+    return CalendarEvent(uid=uid, summary=summary, start=start, end=start + timedelta(hours=hours), **fields)
+
+
+class FakeClient:
+    """A calendar client keeping the events of every calendar in memory.
+
+    Every call is recorded in ``calls``. Writes raise ``fail_writes`` if it
+    is set, and the change token moves with every write.
+    """
+
+    def __init__(self, events: Optional[Dict[str, List[CalendarEvent]]] = None):
+        self.calendars: Dict[str, Dict[str, CalendarEvent]] = {
+            calendar_id: {str(event.uid): event for event in calendar_events}
+            for calendar_id, calendar_events in (events or {}).items()
+        }
+        self.calls: List[tuple] = []
+        self.fail_writes: Optional[Exception] = None
+        self.version = 0
+
+    def events(self, calendar_id: str) -> Dict[str, CalendarEvent]:
+        return self.calendars.setdefault(calendar_id, {})
+
+    def list_events(self, calendar_id, start=None, end=None):
+        self.calls.append(("list", calendar_id, start, end))
+        return [
+            event for event in self.events(calendar_id).values()
+            if start is None or end is None or (event.start < end and event.end > start)
+        ]
+
+    iter_events = list_busy_events = list_events
+
+    def fetch_sync_state(self, calendar_id):
+        self.calls.append(("state", calendar_id))
+        return {'ctag': f"{calendar_id}-{self.version}", 'sync_token': None}
+
+    def _write(self, action, calendar_id, uid):
+        self.calls.append((action, calendar_id, uid))
+        if self.fail_writes is not None:
+            raise self.fail_writes
+        self.version += 1
+
+    def create_event(self, calendar_id, event):
+        self._write("create", calendar_id, str(event.uid))
+        self.events(calendar_id)[str(event.uid)] = event
+
+    def create_events(self, calendar_id, events):
+        for event in events:
+            self.create_event(calendar_id, event)
+        return [None] * len(events)
+
+    def update_event(self, calendar_id, event):
+        self._write("update", calendar_id, str(event.uid))
+        self.events(calendar_id)[str(event.uid)] = event
+
+    def delete_event(self, calendar_id, event_uid):
+        self._write("delete", calendar_id, str(event_uid))
+        self.events(calendar_id).pop(str(event_uid), None)
+
+    def save_event_ids(self):
+        pass
+
+    def writes(self) -> List[tuple]:
+        return [call for call in self.calls if call[0] in ("create", "update", "delete")]
+
+
+def make_manager(state_dir, pairs: List[str], clients: Dict[str, FakeClient], **settings) -> SyncManager:
+    """Create a SyncManager whose backends use the given fake clients."""
+    values = {
+        'NEXTCLOUD_URL': "https://nextcloud.invalid", 'NEXTCLOUD_USERNAME': "user", 'NEXTCLOUD_PASSWORD': "secret",
+        'KERIO_URL': "https://kerio.invalid", 'KERIO_USERNAME': "user", 'KERIO_PASSWORD': "secret",
+        'CALENDAR_PAIRS': json.dumps(pairs), 'STATE_DIR': str(state_dir),
+    }
+    values.update(settings)
+    manager = SyncManager(Config.from_mapping(values))
+    for name, client in clients.items():
+        manager.backends.get(name)._client = client
+    return manager
@@ -0,0 +1,70 @@
+"""Tests for backends and the capabilities the sync engine relies on."""
+
+import pytest
+
+from fakes import FakeClient, make_event, make_manager
+from calendar_sync import backends
+from calendar_sync.backends import Backend, Capability
+
+
+class RecordingClient(FakeClient):
+    """A fake client recording which way events were read."""
+
+    def iter_events(self, calendar_id, start=None, end=None):
+        self.calls.append(("iter", calendar_id))
+        return iter(list(self.events(calendar_id).values()))
+
+    def list_busy_events(self, calendar_id, start=None, end=None):
+        self.calls.append(("busy", calendar_id))
+        return list(self.events(calendar_id).values())
+
+
+@pytest.fixture
+def plain(monkeypatch):
+    """Register a backend without any capability."""
+    monkeypatch.setitem(backends.BACKENDS, "plain", lambda config, transport: Backend("plain", RecordingClient))
+
+
+def read_calls(client):
+    return [call[0] for call in client.calls if call[0] in ("list", "iter", "busy", "state")]
+
+
+def test_backend_without_capabilities_is_read_plainly(tmp_path, plain):
+    source = RecordingClient({'a': [make_event("e1")]})
+    manager = make_manager(
+        tmp_path, ["a@plain:b@kerio:one_way:true"], {'plain': source, 'kerio': FakeClient()},
+        STREAM_EVENTS="true"
+    )
+    [result] = manager.sync_calendars()
+    assert result.success
+    assert read_calls(source) == ["list"]
+
+    # Without change tokens the pair cannot be skipped
+    source.calls.clear()
+    [result] = manager.sync_calendars()
+    assert "skipped" not in result.counts
+    assert read_calls(source) == ["list"]
+
+
+@pytest.mark.parametrize("privacy, stream, read", [
+    (True, "true", ["state", "busy"]),
+    (False, "true", ["state", "iter"]),
+    (False, "false", ["state", "list"]),
+])
+def test_caldav_capabilities_choose_how_to_read(tmp_path, privacy, stream, read):
+    source = RecordingClient({'a': [make_event("e1")]})
+    manager = make_manager(
+        tmp_path, [f"a@nextcloud:b@kerio:one_way:{str(privacy).lower()}"],
+        {'nextcloud': source, 'kerio': FakeClient()}, STREAM_EVENTS=stream
+    )
+    [result] = manager.sync_calendars()
+    assert result.success
+    assert read_calls(source) == read
+
+
+def test_declared_capabilities(tmp_path):
+    manager = make_manager(tmp_path, ["a@nextcloud:b@google:one_way:false"], {})
+    caldav, google = manager.backends.get("nextcloud"), manager.backends.get("google")
+    assert caldav.supports(Capability.FREE_BUSY) and not caldav.supports(Capability.BATCH_WRITES)
+    assert google.supports(Capability.BATCH_WRITES) and not google.supports(Capability.FREE_BUSY)
+    assert all(backend.supports(Capability.SYNC_TOKEN) for backend in (caldav, google))
@@ -0,0 +1,40 @@
+"""Tests for privacy pairs mirroring source events as busy events."""
+
+from datetime import timedelta
+
+import pytest
+
+from fakes import BASE, FakeClient, make_event, make_manager
+from calendar_sync import sync_manager
+
+
+def busy_sources(manager, client, calendar_id):
+    return sorted(manager.privacy_handler.get_source_uid(event) for event in client.events(calendar_id).values())
+
+
+@pytest.mark.parametrize("source, target", [("nextcloud", "kerio"), ("kerio", "nextcloud")])
+def test_busy_events_spill_and_follow_the_source(tmp_path, monkeypatch, source, target):
+    monkeypatch.setattr(sync_manager, "PLAN_BATCH_SIZE", 2)
+    events = [make_event(f"e{i}", start=BASE + timedelta(hours=i)) for i in range(5)]
+    source_client, target_client = FakeClient({'a': events}), FakeClient()
+    manager = make_manager(
+        tmp_path, [f"a@{source}:b@{target}:one_way:true"],
+        {source: source_client, target: target_client},
+        EVENT_SPILL_THRESHOLD="3", FORCE_RESYNC_MINUTES="0"
+    )
+    planned = []
+    plan_many = manager.outbox.plan_many
+    monkeypatch.setattr(manager.outbox, "plan_many", lambda *args: planned.append(len(args[2])) or plan_many(*args))
+
+    [result] = manager.sync_calendars()
+    assert result.success
+    assert busy_sources(manager, target_client, "b") == [f"e{i}" for i in range(5)]
+    # Only the target that is wiped journals its busy events up front, in batches
+    assert planned == ([2, 2, 1] if target == "kerio" else [])
+    assert manager.outbox.pending() == []
+
+    del source_client.events("a")["e1"], source_client.events("a")["e3"]
+    source_client.version += 1
+    [result] = manager.sync_calendars()
+    assert result.success
+    assert busy_sources(manager, target_client, "b") == ["e0", "e2", "e4"]
@@ -0,0 +1,107 @@
+"""Tests for recording and replaying HTTP exchanges."""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+import requests
+
+from calendar_sync.cassette import CassetteMiss, HttpTransport, RecordingTransport, ReplayTransport
+
+SECRET = "hunter2"
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Echoes the method, path and body of every request."""
+
+    def _answer(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+        payload = json.dumps({'method': self.command, 'path': self.path, 'body': body}).encode('utf-8')
+        self.send_response(207 if self.command == "PROPFIND" else 200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Set-Cookie', f"session={SECRET}")
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_PUT = do_PROPFIND = _answer
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def exchanges(session: requests.Session, base: str):
+    """Make a fixed series of requests and return what they answered."""
+    return [
+        (response.status_code, response.json())
+        for response in (
+            session.request("PROPFIND", f"{base}/dav/calendars/", data="<propfind/>"),
+            session.get(f"{base}/events", params={'timeMin': "2024-05-06T00:00:00Z"}),
+            session.put(f"{base}/dav/calendars/work/a.ics", data=f"BEGIN:VCALENDAR\nX-TOKEN:{SECRET}"),
+            session.get(f"{base}/events", params={'timeMin': "2024-05-06T00:00:00Z"}),
+        )
+    ]
+
+
+def test_replay_answers_recorded_requests(server, tmp_path):
+    path = str(tmp_path / "cassettes" / "sync.json")
+    recorder = RecordingTransport(path, secrets=[SECRET])
+    session = requests.Session()
+    session.auth = ("user", SECRET)
+    recorder.mount(session)
+    recorded = exchanges(session, server)
+    recorder.save()
+
+    text = open(path, encoding='utf-8').read()
+    assert SECRET not in text
+    assert "Authorization" not in text
+
+    player = ReplayTransport(path, secrets=[SECRET])
+    session = requests.Session()
+    session.auth = ("user", SECRET)
+    player.mount(session)
+    replayed = exchanges(session, server)
+    # Secrets echoed by the server were masked in the recorded responses
+    assert replayed[2][1]['body'] == "BEGIN:VCALENDAR\nX-TOKEN:REDACTED"
+    assert replayed[:2] + replayed[3:] == recorded[:2] + recorded[3:]
+    assert player.requests == recorder.requests
+    host = server.split("//")[1]
+    assert dict(player.requests) == {("PROPFIND", host): 1, ("GET", host): 2, ("PUT", host): 1}
+    assert player.unused() == 0
+    assert "recorded requests not replayed: 0" in player.summary()
+
+    with pytest.raises(CassetteMiss):
+        session.get(f"{server}/events")
+
+
+def test_replay_matches_requests_that_differ_in_query(server, tmp_path):
+    path = str(tmp_path / "sync.json")
+    recorder = RecordingTransport(path)
+    session = requests.Session()
+    recorder.mount(session)
+    session.get(f"{server}/events", params={'timeMin': "2024-05-06T00:00:00Z"})
+    recorder.save()
+
+    player = ReplayTransport(path, latency=0.001)
+    session = requests.Session()
+    player.mount(session)
+    response = session.get(f"{server}/events", params={'timeMin': "2024-05-07T00:00:00Z"})
+    assert response.json()['path'] == "/events?timeMin=2024-05-06T00%3A00%3A00Z"
+    assert player.latency_seconds == pytest.approx(0.001)
+
+
+def test_transport_base_is_abstract():
+    with pytest.raises(TypeError):
+        HttpTransport()
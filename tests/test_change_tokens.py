@@ -0,0 +1,65 @@
+"""Tests for skipping pairs whose calendars did not change since the last sync."""
+
+from fakes import FakeClient, make_event, make_manager
+
+
+def setup(tmp_path, **settings):
+    nextcloud = FakeClient({'a': [make_event("e1")]})
+    kerio = FakeClient()
+    manager = make_manager(
+        tmp_path, ["a@nextcloud:b@kerio:one_way:false"], {'nextcloud': nextcloud, 'kerio': kerio}, **settings
+    )
+    return manager, nextcloud, kerio
+
+
+def reads(client):
+    return [call for call in client.calls if call[0] == "list"]
+
+
+def test_unchanged_pair_is_skipped_without_reading_events(tmp_path):
+    manager, nextcloud, kerio = setup(tmp_path)
+    [result] = manager.sync_calendars()
+    assert result.counts["created"] == 1
+    nextcloud.calls.clear()
+    kerio.calls.clear()
+
+    # The target changed only through this tool's own writes
+    [result] = manager.sync_calendars()
+    assert result.counts == {"skipped": 1}
+    assert reads(nextcloud) == reads(kerio) == []
+
+
+def test_changed_calendar_is_synced(tmp_path):
+    manager, nextcloud, kerio = setup(tmp_path)
+    manager.sync_calendars()
+    nextcloud.events("a")["e2"] = make_event("e2")
+    nextcloud.version += 1
+
+    [result] = manager.sync_calendars()
+    assert result.counts["created"] == 1
+    assert sorted(kerio.events("b")) == ["e1", "e2"]
+
+
+def test_failed_writes_sync_the_pair_again(tmp_path):
+    manager, nextcloud, kerio = setup(tmp_path)
+    kerio.fail_writes = ValueError("invalid event")
+    [result] = manager.sync_calendars()
+    assert result.counts["failed"] == 1
+
+    kerio.fail_writes = None
+    nextcloud.calls.clear()
+    [result] = manager.sync_calendars()
+    assert "skipped" not in result.counts
+    assert reads(nextcloud)
+    assert sorted(kerio.events("b")) == ["e1"]
+
+
+def test_zero_force_resync_minutes_disables_the_check(tmp_path):
+    manager, nextcloud, kerio = setup(tmp_path, FORCE_RESYNC_MINUTES="0")
+    manager.sync_calendars()
+    nextcloud.calls.clear()
+
+    [result] = manager.sync_calendars()
+    assert "skipped" not in result.counts
+    assert ("state", "a") not in nextcloud.calls
+    assert reads(nextcloud)
@@ -0,0 +1,31 @@
+"""Tests for parsing configuration values."""
+
+import pytest
+
+from calendar_sync.config import HorizonTier, parse_horizon_tiers
+
+
+def test_parse_horizon_tiers_with_units():
+    tiers = parse_horizon_tiers("2d/2m, 30d/30m, 90d/1h")
+    assert tiers == [
+        HorizonTier(2 * 24 * 60, 2),
+        HorizonTier(30 * 24 * 60, 30),
+        HorizonTier(90 * 24 * 60, 60),
+    ]
+    assert [str(tier) for tier in tiers] == ["2d/2m", "30d/30m", "90d/1h"]
+
+
+def test_parse_horizon_tiers_default_units():
+    assert parse_horizon_tiers("7/15") == [HorizonTier(7 * 24 * 60, 15)]
+    assert parse_horizon_tiers("12h/5") == [HorizonTier(12 * 60, 5)]
+
+
+@pytest.mark.parametrize("value", ["", "  ", "off", "OFF"])
+def test_parse_horizon_tiers_off(value):
+    assert parse_horizon_tiers(value) == []
+
+
+@pytest.mark.parametrize("value", ["2d", "2d/0m", "x/5m", "30d/30m,2d/2m", "2d/2m,2d/5m"])
+def test_parse_horizon_tiers_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        parse_horizon_tiers(value)
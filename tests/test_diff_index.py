@@ -0,0 +1,88 @@
+"""Tests for the index used to diff source and target events."""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from calendar_sync.diff_index import SOURCE, TARGET, DiffIndex
+from calendar_sync.events import CalendarEvent
+
+
+def make_event(uid: str, summary: str = "Meeting", day: int = 6) -> CalendarEvent:
+    start = datetime(2024, 5, day, 9, tzinfo=timezone.utc)
+    return CalendarEvent(uid=uid, summary=summary, start=start, end=start + timedelta(hours=1))
+
+
+def fill(index: DiffIndex) -> DiffIndex:
+    index.add_all(SOURCE, [
+        make_event("only-source"),
+        make_event("same"),
+        make_event("moved"),
+        make_event("renamed", "Draft"),
+        # Replaces the earlier event with the same UID
+        make_event("renamed", "Final"),
+    ])
+    index.add_all(TARGET, [
+        make_event("only-target"),
+        make_event("same"),
+        make_event("moved", day=7),
+        make_event("renamed", "Draft"),
+    ])
+    return index
+
+
+def snapshot(index: DiffIndex):
+    def uids(events):
+        return sorted(str(event.uid) for event in events)
+
+    def pairs(matches):
+        return sorted((str(source.uid), source.summary, target.start) for source, target in matches)
+
+    return {
+        'only_source': uids(index.only_in(SOURCE)),
+        'only_target': uids(index.only_in(TARGET)),
+        'common': pairs(index.common()),
+        'changed': pairs(
+            (source, target) for source, target in index.common()
+            if source.content_hash() != target.content_hash()
+        ),
+        'source': uids(index.events(SOURCE)),
+        'contains': [index.contains(TARGET, uid) for uid in ("same", "only-source")],
+    }
+
+
+@pytest.mark.parametrize("spill_threshold", [0, 3])
+def test_spilled_index_matches_in_memory_index(tmp_path, spill_threshold):
+    with fill(DiffIndex()) as memory, fill(DiffIndex(spill_threshold, str(tmp_path))) as spilled:
+        assert not memory.spilled
+        assert spilled.spilled
+        assert snapshot(spilled) == snapshot(memory)
+
+
+def test_in_memory_differences():
+    with fill(DiffIndex()) as index:
+        result = snapshot(index)
+    assert result['only_source'] == ["only-source"]
+    assert result['only_target'] == ["only-target"]
+    assert [uid for uid, _, _ in result['common']] == ["moved", "renamed", "same"]
+    assert [(uid, summary) for uid, summary, _ in result['changed']] == [("moved", "Meeting"), ("renamed", "Final")]
+
+
+def test_close_deletes_temporary_database(tmp_path):
+    index = fill(DiffIndex(0, str(tmp_path)))
+    assert list(tmp_path.iterdir())
+    index.close()
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize("spill_threshold", [None, 0])
+def test_events_keyed_by_occurrence(tmp_path, spill_threshold):
+    def occurrence(event):
+        return f"{event.uid}|{event.start.isoformat()}"
+
+    with DiffIndex(spill_threshold, str(tmp_path)) as index:
+        index.add_all(SOURCE, [make_event("series", day=day) for day in (6, 7, 8)], key=occurrence)
+        index.add_all(TARGET, [make_event("series", day=7)], key=occurrence)
+        assert sorted(event.start.day for event in index.events(SOURCE)) == [6, 7, 8]
+        assert sorted(event.start.day for event in index.only_in(SOURCE)) == [6, 8]
+        assert [source.start.day for source, _ in index.common()] == [7]
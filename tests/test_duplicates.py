@@ -0,0 +1,52 @@
+"""Tests for detecting the same meeting arriving in a calendar under different UIDs."""
+
+import pytest
+
+from fakes import FakeClient, make_event, make_manager
+from calendar_sync.duplicates import DuplicateIndex
+
+PAIRS = ["a@nextcloud:c@kerio:one_way:false", "b@kerio:c@kerio:one_way:false"]
+
+
+def setup(tmp_path, policy):
+    # The same invitation, received at both addresses
+    nextcloud = FakeClient({'a': [make_event("invite-nextcloud", "Planning")]})
+    kerio = FakeClient({'b': [make_event("invite-kerio", " planning ")]})
+    manager = make_manager(
+        tmp_path, PAIRS, {'nextcloud': nextcloud, 'kerio': kerio},
+        DUPLICATE_POLICY=policy, FORCE_RESYNC_MINUTES="0"
+    )
+    return manager, kerio
+
+
+def test_suppressed_duplicate_is_not_created(tmp_path):
+    manager, kerio = setup(tmp_path, "suppress")
+    first, second = manager.sync_calendars()
+    assert first.counts["created"] == 1
+    assert second.counts["duplicates"] == 1
+    assert list(kerio.events("c")) == ["invite-nextcloud"]
+
+    # The copy standing in for the duplicate is not cleaned up by the second pair
+    manager.sync_calendars()
+    assert list(kerio.events("c")) == ["invite-nextcloud"]
+    assert not [call for call in kerio.writes() if call[0] == "delete"]
+
+
+@pytest.mark.parametrize("policy, duplicates", [("log", 1), ("off", 0)])
+def test_other_policies_create_the_duplicate(tmp_path, policy, duplicates):
+    manager, kerio = setup(tmp_path, policy)
+    first, second = manager.sync_calendars()
+    assert second.counts.get("duplicates", 0) == duplicates
+    assert ("create", "c", "invite-kerio") in kerio.writes()
+
+
+def test_index_compares_organizers_only_when_both_are_known():
+    index = DuplicateIndex()
+    index.add("c", make_event("copy", "Planning"))
+    index.add("c", make_event("invite", "Planning", organizer="mailto:Boss@example.com"))
+    assert index.find("c", make_event("other", "Planning", organizer="boss@example.com")) == "copy"
+    index.remove("c", "copy")
+    assert index.find("c", make_event("other", "Planning", organizer="boss@example.com")) == "invite"
+    assert index.find("c", make_event("other", "Planning", organizer="someone@example.com")) is None
+    assert index.find("c", make_event("invite", "Planning")) is None
+    assert index.find("c", make_event("other", "Review")) is None
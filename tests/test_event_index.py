@@ -0,0 +1,96 @@
+"""Tests for the columnar event index."""
+
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from calendar_sync import event_index
+from calendar_sync.event_index import EventIndex
+from calendar_sync.events import CalendarEvent
+
+
+def at(hour: int, minute: int = 0, day: int = 6) -> datetime:
+    return datetime(2024, 5, day, hour, minute, tzinfo=timezone.utc)
+
+
+def make_event(uid: str, start: datetime, end: datetime, is_all_day: bool = False) -> CalendarEvent:
+    return CalendarEvent(uid=uid, summary=uid, start=start, end=end, is_all_day=is_all_day)
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    """Run a test with NumPy and with the plain Python fallback."""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(event_index, "_numpy", lambda: None)
+    return request.param
+
+
+def test_merged_intervals(backend):
+    index = EventIndex([
+        make_event("late", at(15), at(16)),
+        make_event("a", at(9), at(10)),
+        # Inside the previous event, must not shorten the block
+        make_event("inside", at(9, 15), at(9, 30)),
+        make_event("adjacent", at(10), at(11)),
+        make_event("apart", at(12), at(13)),
+        make_event("holiday", at(0), at(0, day=7), is_all_day=True),
+        make_event("untimed", None, None),
+    ])
+    assert index.merged_intervals() == [
+        (False, at(9), at(11)),
+        (False, at(12), at(13)),
+        (False, at(15), at(16)),
+        (True, at(0), at(0, day=7)),
+    ]
+
+
+def test_merged_intervals_with_gap(backend):
+    index = EventIndex([
+        make_event("a", at(9), at(10)),
+        make_event("b", at(10, 10), at(11)),
+        make_event("c", at(11, 30), at(12)),
+    ])
+    assert index.merged_intervals(timedelta(minutes=15)) == [
+        (False, at(9), at(11)),
+        (False, at(11, 30), at(12)),
+    ]
+    assert index.merged_intervals(timedelta(minutes=30)) == [(False, at(9), at(12))]
+
+
+def test_merged_intervals_of_naive_times_are_utc(backend):
+    naive = datetime(2024, 5, 6, 9)
+    index = EventIndex([make_event("a", naive, naive + timedelta(hours=1))])
+    assert index.merged_intervals() == [(False, at(9), at(10))]
+
+
+def test_merged_intervals_empty(backend):
+    assert EventIndex([]).merged_intervals() == []
+    assert EventIndex([make_event("untimed", None, None)]).merged_intervals() == []
+
+
+def test_membership(backend):
+    interner = event_index.UidInterner()
+    mine = EventIndex([
+        make_event("both", at(9), at(10)),
+        make_event("mine", at(9), at(10)),
+        # The last event of a UID is the one matched
+        make_event("both", at(11), at(12)),
+        make_event("untimed", None, None),
+    ], interner)
+    theirs = EventIndex([make_event("untimed", None, None), make_event("both", at(9), at(10))], interner)
+    assert [str(event.uid) for event in mine.only_in(theirs)] == ["mine"]
+    assert [(own.start, other.start) for own, other in mine.common(theirs)] == [(at(11), at(9)), (None, None)]
+
+
+def test_numpy_is_not_imported_at_startup():
+    code = "import sys, calendar_sync.sync_manager; print('numpy' in sys.modules)"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=root
+    ).stdout
+    assert output.strip() == "False"
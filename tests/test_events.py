@@ -0,0 +1,42 @@
+"""Tests for parsing calendar events."""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from calendar_sync.events import CalendarEvent
+
+pytest.importorskip("icalendar")
+
+
+def vevent(*lines: str) -> str:
+    return "\r\n".join(
+        ["BEGIN:VCALENDAR", "VERSION:2.0", "BEGIN:VEVENT", "UID:busy@example.com", *lines,
+         "END:VEVENT", "END:VCALENDAR", ""]
+    )
+
+
+def test_end_from_duration():
+    # Busy time as partial calendar data returns it: no DTEND, only DURATION
+    event = CalendarEvent.from_ical(vevent("DTSTART:20240506T090000Z", "DURATION:PT1H30M"))
+    assert event.start == datetime(2024, 5, 6, 9, tzinfo=timezone.utc)
+    assert event.end - event.start == timedelta(hours=1, minutes=30)
+    assert not event.is_all_day
+
+
+def test_all_day_end_from_duration():
+    event = CalendarEvent.from_ical(vevent("DTSTART;VALUE=DATE:20240506", "DURATION:P2D"))
+    assert event.is_all_day
+    assert (event.start, event.end) == (datetime(2024, 5, 6), datetime(2024, 5, 8))
+
+
+def test_end_without_dtend_or_duration():
+    timed = CalendarEvent.from_ical(vevent("DTSTART:20240506T090000Z"))
+    assert timed.end == timed.start
+    all_day = CalendarEvent.from_ical(vevent("DTSTART;VALUE=DATE:20240506"))
+    assert all_day.end == datetime(2024, 5, 7)
+
+
+def test_end_from_dtend():
+    event = CalendarEvent.from_ical(vevent("DTSTART:20240506T090000Z", "DTEND:20240506T100000Z"))
+    assert event.end == datetime(2024, 5, 6, 10, tzinfo=timezone.utc)
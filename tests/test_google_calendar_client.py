@@ -0,0 +1,167 @@
+"""Tests for the Google event ids learned by the Google Calendar client."""
+
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+from googleapiclient.errors import HttpError
+from httplib2 import Response
+
+from calendar_sync.events import CalendarEvent
+from calendar_sync.google_calendar_client import GoogleCalendarClient
+from calendar_sync.state import JsonStore
+
+
+def resource(event_id: str, uid: str, day: int, series: str = None, summary: str = None) -> dict:
+    event = {
+        'id': event_id,
+        'iCalUID': uid,
+        'summary': summary or uid,
+        'start': {'dateTime': f"2024-05-{day:02d}T09:00:00Z"},
+        'end': {'dateTime': f"2024-05-{day:02d}T10:00:00Z"},
+    }
+    if series:
+        event['recurringEventId'] = series
+    return event
+
+
+class FakeRequest:
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+
+    def execute(self, http=None):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class FakeEvents:
+    """Records the calls made to the events collection of the API."""
+
+    def __init__(self):
+        self.calls = []
+        self.items = []
+        self.fail_delete = None
+
+    def patch(self, calendarId, eventId, body):
+        self.calls.append(("patch", eventId, body))
+        return FakeRequest({'id': eventId})
+
+    def delete(self, calendarId, eventId):
+        self.calls.append(("delete", eventId))
+        error, self.fail_delete = self.fail_delete, None
+        return FakeRequest(error=error)
+
+    def list(self, calendarId, **query):
+        self.calls.append(("list", query))
+        return FakeRequest({'items': self.items})
+
+    def insert(self, calendarId, body):
+        self.calls.append(("insert", body))
+        return FakeRequest({'id': "generated"})
+
+
+class FakeService:
+    def __init__(self):
+        self.collection = FakeEvents()
+
+    def events(self):
+        return self.collection
+
+
+def http_error(status: int) -> HttpError:
+    return HttpError(Response({'status': status}), b"")
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(GoogleCalendarClient, "get_service", lambda self: FakeService())
+    path = tmp_path / "google_event_ids.json"
+    path.write_text(json.dumps({'work': {'deleted@example.com': "gone"}}), encoding='utf-8')
+    return GoogleCalendarClient(id_cache=JsonStore(str(path)))
+
+
+def listing(client: GoogleCalendarClient, pages):
+    client._fetch_pages = lambda calendar_id, start, end: iter(pages)
+    return client._list_window("work", None, None)
+
+
+def weekly_series(client: GoogleCalendarClient, summary: str = None):
+    return listing(client, [[
+        resource("weekly_20240506T090000Z", "weekly@example.com", 6, series="weekly"),
+        resource("weekly_20240513T090000Z", "weekly@example.com", 14, series="weekly", summary=summary),
+        resource("single", "single@example.com", 7),
+    ]])
+
+
+def test_diverged_instance_is_updated_alone(client):
+    events = weekly_series(client, summary="Moved to Tuesday")
+    moved = events[1]
+    client.update_event("work", moved)
+    [(action, event_id, body)] = client.service.collection.calls
+    assert (action, event_id) == ("patch", "weekly_20240513T090000Z")
+    assert body['summary'] == "Moved to Tuesday"
+    assert 'iCalUID' not in body
+
+
+def test_delete_of_recurring_event_targets_series(client):
+    weekly_series(client)
+    client.delete_event("work", "weekly@example.com")
+    client.delete_event("work", "single@example.com")
+    assert client.service.collection.calls == [("delete", "weekly"), ("delete", "single")]
+    assert "weekly@example.com" not in client._ids("work")
+    assert "weekly@example.com" not in client._series("work")
+
+
+def test_failed_delete_keeps_the_id(client):
+    weekly_series(client)
+    client.service.collection.fail_delete = http_error(503)
+    with pytest.raises(HttpError):
+        client.delete_event("work", "single@example.com")
+    assert client._ids("work")["single@example.com"] == "single"
+    client.delete_event("work", "single@example.com")
+    assert client.service.collection.calls == [("delete", "single"), ("delete", "single")]
+
+
+def test_unknown_event_is_deleted_by_uid(client):
+    # Created just before a crash, so its generated id was never saved
+    client.service.collection.items = [{'id': "generated"}]
+    client.delete_event("work", "lost@example.com")
+    assert client.service.collection.calls == [
+        ("list", {'iCalUID': "lost@example.com"}),
+        ("delete", "generated"),
+    ]
+
+
+def test_created_events_keep_their_uid(client):
+    start = datetime(2024, 5, 6, 9, tzinfo=timezone.utc)
+    event = CalendarEvent(uid="new@example.com", summary="New", start=start, end=start.replace(hour=10))
+    assert client.create_event("work", event) == "generated"
+    assert client.service.collection.calls[0][1]['iCalUID'] == "new@example.com"
+    assert client._ids("work")["new@example.com"] == "generated"
+
+
+def test_save_drops_ids_not_seen_since_last_save(client, tmp_path):
+    path = tmp_path / "google_event_ids.json"
+    # Not read yet, so the ids are kept for pending writes
+    client._ids("work")
+    client.save_event_ids()
+    assert json.loads(path.read_text(encoding='utf-8')) == {'work': {'deleted@example.com': "gone"}}
+
+    weekly_series(client)
+    client.save_event_ids()
+    assert json.loads(path.read_text(encoding='utf-8')) == {
+        'work': {'weekly@example.com': "weekly_20240513T090000Z", 'single@example.com': "single"},
+        'series:work': {'weekly@example.com': "weekly"},
+    }
+
+    listing(client, [[resource("other", "other@example.com", 8)]])
+    client.save_event_ids()
+    assert json.loads(path.read_text(encoding='utf-8')) == {
+        'work': {'other@example.com': "other"},
+        'series:work': {},
+    }
@@ -0,0 +1,66 @@
+"""Tests for the circuit breaker."""
+
+from calendar_sync.health import CircuitBreaker, CircuitState
+
+
+class FakeClock:
+    """Monotonic clock advanced by hand."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_opens_after_threshold_of_consecutive_failures():
+    breaker = CircuitBreaker("kerio", failure_threshold=2, reset_timeout=60, clock=FakeClock())
+    breaker.record_failure()
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.available()
+    assert not breaker.allow_request()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("kerio", failure_threshold=2, clock=FakeClock())
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_half_open_lets_one_probe_through():
+    clock = FakeClock()
+    breaker = CircuitBreaker("kerio", failure_threshold=1, reset_timeout=60, clock=clock)
+    breaker.record_failure()
+    assert breaker.retry_in() == 60
+    clock.now = 59
+    assert breaker.state == CircuitState.OPEN
+    clock.now = 60
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.retry_in() == 0
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.release()
+    assert breaker.allow_request()
+
+
+def test_probe_success_closes_and_failure_reopens():
+    clock = FakeClock()
+    breaker = CircuitBreaker("kerio", failure_threshold=3, reset_timeout=60, clock=clock)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now = 60
+    assert breaker.allow_request()
+    breaker.record_failure()
+    # A failed probe opens the breaker again at once, for a full reset timeout
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.retry_in() == 60
+    clock.now = 120
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.failures == 0
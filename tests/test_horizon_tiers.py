@@ -0,0 +1,80 @@
+"""Tests for syncing the horizon tiers of a pair at their own intervals."""
+
+from datetime import datetime, timedelta, timezone
+
+from fakes import BASE, FakeClient, make_event, make_manager
+from calendar_sync.config import HorizonTier
+
+NEAR = HorizonTier(24 * 60, 10)
+FAR = HorizonTier(30 * 24 * 60, 60)
+
+
+def setup(tmp_path):
+    nextcloud = FakeClient({'a': [make_event("soon"), make_event("later", start=BASE + timedelta(days=10))]})
+    kerio = FakeClient()
+    manager = make_manager(
+        tmp_path, ["a@nextcloud:b@kerio:one_way:false"], {'nextcloud': nextcloud, 'kerio': kerio},
+        HORIZON_TIERS="1d/10m,30d/1h"
+    )
+    return manager, manager.config.calendar_pairs[0], nextcloud, kerio
+
+
+def elapse(manager, pair, tier, minutes):
+    """Pretend the last sync of a tier was some minutes earlier."""
+    manager._tiers_synced[(pair.name, tier)] -= minutes * 60
+
+
+def midnight(manager):
+    return manager._cycle_now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def windows(client):
+    return [(call[2], call[3]) for call in client.calls if call[0] == "list"]
+
+
+def test_first_cycle_syncs_all_tiers_in_one_window(tmp_path):
+    manager, pair, nextcloud, kerio = setup(tmp_path)
+    [result] = manager.sync_calendars()
+    assert result.success
+    assert sorted(kerio.events("b")) == ["later", "soon"]
+    assert windows(nextcloud) == [(midnight(manager), manager._cycle_now + timedelta(days=30))]
+    assert {pair.name, f"{pair.name}#1d/10m", f"{pair.name}#30d/1h"} <= set(manager.pair_tokens)
+
+
+def test_only_due_tiers_are_synced(tmp_path):
+    manager, pair, nextcloud, kerio = setup(tmp_path)
+    manager.sync_calendars()
+    [result] = manager.sync_calendars()
+    assert result.counts == {"skipped": 1}
+
+    nextcloud.calls.clear()
+    # Inside the near tier, which runs from midnight to a day from now
+    nextcloud.events("a")["new"] = make_event("new", start=datetime.now(timezone.utc) + timedelta(hours=1))
+    nextcloud.version += 1
+    elapse(manager, pair, NEAR, 11)
+    [result] = manager.sync_calendars()
+    assert result.counts["created"] == 1
+    assert windows(nextcloud) == [(midnight(manager), manager._cycle_now + timedelta(days=1))]
+    # The far tier still vouches only for the calendars as they were when it was synced
+    near, far = (manager.pair_tokens.get(f"{pair.name}#{tier}") for tier in (NEAR, FAR))
+    assert near['source'] != far['source']
+
+
+def test_due_tier_with_unchanged_calendars_is_skipped(tmp_path):
+    manager, pair, nextcloud, kerio = setup(tmp_path)
+    manager.sync_calendars()
+    nextcloud.calls.clear()
+    elapse(manager, pair, NEAR, 11)
+    [result] = manager.sync_calendars()
+    assert result.counts == {"skipped": 1}
+    assert windows(nextcloud) == []
+
+
+def test_slowest_tier_due_syncs_all_tiers(tmp_path):
+    manager, pair, nextcloud, kerio = setup(tmp_path)
+    manager.sync_calendars()
+    elapse(manager, pair, FAR, 61)
+    assert manager._due_tiers(pair, [NEAR, FAR]) == [NEAR, FAR]
+    elapse(manager, pair, NEAR, 11)
+    manager._tiers_synced[(pair.name, FAR)] = manager._cycle_clock
+    assert manager._due_tiers(pair, [NEAR, FAR]) == [NEAR]
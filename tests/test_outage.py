@@ -0,0 +1,51 @@
+"""Tests for pairs whose backend goes down while they are synced."""
+
+from fakes import FakeClient, make_event, make_manager
+from calendar_sync.health import CircuitState
+
+
+def test_unreachable_target_fails_the_pair(tmp_path):
+    nextcloud = FakeClient({'a': [make_event(f"e{i}") for i in range(5)]})
+    kerio = FakeClient()
+    kerio.fail_writes = ConnectionError("connection refused")
+    manager = make_manager(tmp_path, ["a@nextcloud:b@kerio:one_way:false"], {'nextcloud': nextcloud, 'kerio': kerio})
+
+    [result] = manager.sync_calendars()
+    assert not result.success
+    assert result.unavailable
+    # The first write showed the server is down; the others were not attempted
+    assert len(kerio.writes()) == 1
+    assert manager.backends.get("kerio").breaker.failures == 1
+    assert len(manager.outbox.pending()) == 1
+
+    kerio.fail_writes = None
+    [result] = manager.sync_calendars()
+    assert result.success
+    assert sorted(kerio.events("b")) == [f"e{i}" for i in range(5)]
+    assert manager.outbox.pending() == []
+
+
+def test_breaker_opens_when_writes_keep_failing(tmp_path):
+    nextcloud = FakeClient({'a': [make_event("e1")]})
+    kerio = FakeClient()
+    kerio.fail_writes = ConnectionError("connection refused")
+    manager = make_manager(tmp_path, ["a@nextcloud:b@kerio:one_way:false"], {'nextcloud': nextcloud, 'kerio': kerio})
+
+    manager.sync_calendars()
+    manager.sync_calendars()
+    assert manager.backends.get("kerio").breaker.state == CircuitState.OPEN
+    [result] = manager.sync_calendars()
+    assert result.unavailable
+    assert manager.next_retry() is not None
+
+
+def test_rejected_write_fails_only_its_event(tmp_path):
+    nextcloud = FakeClient({'a': [make_event("e1"), make_event("e2")]})
+    kerio = FakeClient()
+    kerio.fail_writes = ValueError("invalid event")
+    manager = make_manager(tmp_path, ["a@nextcloud:b@kerio:one_way:false"], {'nextcloud': nextcloud, 'kerio': kerio})
+
+    [result] = manager.sync_calendars()
+    assert result.success
+    assert result.counts["failed"] == 2
+    assert manager.backends.get("kerio").breaker.state == CircuitState.CLOSED
@@ -0,0 +1,72 @@
+"""Tests for the write-ahead journal of target writes."""
+
+import json
+from datetime import datetime, timezone
+
+from calendar_sync.events import CalendarEvent
+from calendar_sync.outbox import Outbox
+
+
+def make_event(uid: str, hour: int = 9) -> CalendarEvent:
+    start = datetime(2024, 5, 6, hour, tzinfo=timezone.utc)
+    end = datetime(2024, 5, 6, hour + 1, tzinfo=timezone.utc)
+    return CalendarEvent(uid=uid, summary=f"Event {uid}", start=start, end=end)
+
+
+def test_pending_survives_restart(tmp_path):
+    path = tmp_path / "outbox.jsonl"
+    outbox = Outbox(str(path))
+    created = outbox.plan("create", "work", make_event("a"))
+    deleted = outbox.plan("delete", "work", uid="b")
+    outbox.done(created)
+    outbox.failed(deleted)
+    outbox.close()
+
+    pending = Outbox(str(path)).pending()
+    assert [(record['id'], record['action'], record['uid']) for record in pending] == [(deleted, "delete", "b")]
+    assert pending[0]['attempts'] == 1
+
+
+def test_replanning_a_pending_write_reuses_its_record(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.jsonl"))
+    first = outbox.plan("create", "work", make_event("a"))
+    outbox.failed(first)
+    again = outbox.plan("create", "work", make_event("a"))
+    assert again == first
+    pending = outbox.pending()
+    assert len(pending) == 1
+    assert pending[0]['attempts'] == 1
+
+
+def test_plan_many_keeps_occurrences_apart(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.jsonl"))
+    ids = outbox.plan_many("create", "work", [make_event("series", 9), make_event("series", 11)])
+    assert len(set(ids)) == 2
+    assert len(outbox.pending()) == 2
+    # Once done, a new plan of the same write gets a new record
+    outbox.done(ids[0])
+    assert outbox.plan("create", "work", make_event("series", 9)) not in ids
+
+
+def test_compact_keeps_only_pending_writes(tmp_path):
+    path = tmp_path / "outbox.jsonl"
+    outbox = Outbox(str(path))
+    ids = [outbox.plan("create", "work", make_event(uid)) for uid in "abc"]
+    outbox.done(ids[0])
+    outbox.done(ids[2])
+    outbox.failed(ids[1])
+    before = outbox.pending()
+    outbox.compact()
+
+    lines = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert [line['op'] for line in lines] == ["plan", "failed"]
+    assert Outbox(str(path)).pending() == before
+    reopened = Outbox(str(path))
+    assert reopened.plan("create", "work", make_event("d")) != ids[1]
+    assert len(reopened.pending()) == 2
+
+
+def test_compact_without_journal_creates_nothing(tmp_path):
+    path = tmp_path / "outbox.jsonl"
+    Outbox(str(path)).compact()
+    assert not path.exists()
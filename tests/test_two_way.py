@@ -0,0 +1,69 @@
+"""Tests for two-way sync writing each diverged event to its stale side only."""
+
+from dataclasses import replace
+from datetime import timedelta
+
+from fakes import BASE, FakeClient, make_event, make_manager
+
+
+def setup(tmp_path):
+    nextcloud = FakeClient({'a': [make_event("e1")]})
+    kerio = FakeClient({'b': [make_event("e2")]})
+    manager = make_manager(
+        tmp_path, ["a@nextcloud:b@kerio:two_way:false"], {'nextcloud': nextcloud, 'kerio': kerio},
+        FORCE_RESYNC_MINUTES="0"
+    )
+    return manager, nextcloud, kerio
+
+
+def edit(client, calendar_id, uid, **fields):
+    events = client.events(calendar_id)
+    events[uid] = replace(events[uid], **fields)
+
+
+def test_missing_events_are_created_on_both_sides(tmp_path):
+    manager, nextcloud, kerio = setup(tmp_path)
+    [result] = manager.sync_calendars()
+    assert result.counts["created"] == 2
+    assert sorted(nextcloud.events("a")) == sorted(kerio.events("b")) == ["e1", "e2"]
+
+
+def test_edit_is_written_to_the_stale_side_only(tmp_path):
+    manager, nextcloud, kerio = setup(tmp_path)
+    manager.sync_calendars()
+    nextcloud.calls.clear()
+    kerio.calls.clear()
+
+    edit(kerio, "b", "e1", summary="Moved to room 2")
+    [result] = manager.sync_calendars()
+    assert nextcloud.writes() == [("update", "a", "e1")]
+    assert kerio.writes() == []
+    assert nextcloud.events("a")["e1"].summary == "Moved to room 2"
+    assert (result.counts["diverged"], result.counts["writes_avoided"]) == (1, 1)
+    assert "conflicts" not in result.counts
+
+    [result] = manager.sync_calendars()
+    assert nextcloud.writes() == [("update", "a", "e1")]
+    assert "diverged" not in result.counts
+
+
+def test_conflict_is_won_by_the_newer_version(tmp_path):
+    manager, nextcloud, kerio = setup(tmp_path)
+    manager.sync_calendars()
+    edit(nextcloud, "a", "e1", summary="Cancelled", sequence=2)
+    edit(kerio, "b", "e1", summary="Moved to room 2", sequence=1)
+
+    [result] = manager.sync_calendars()
+    assert result.counts["conflicts"] == 1
+    assert nextcloud.events("a")["e1"].summary == kerio.events("b")["e1"].summary == "Cancelled"
+
+
+def test_never_synced_event_is_won_by_the_later_modification(tmp_path):
+    manager, nextcloud, kerio = setup(tmp_path)
+    nextcloud.events("a")["e3"] = make_event("e3", "Old", last_modified=BASE - timedelta(days=2))
+    kerio.events("b")["e3"] = make_event("e3", "New", last_modified=BASE - timedelta(days=1))
+
+    [result] = manager.sync_calendars()
+    assert "conflicts" not in result.counts
+    assert nextcloud.events("a")["e3"].summary == "New"
+    assert ("update", "b", "e3") not in kerio.writes()